@@ -23,6 +23,36 @@ Dataframe rules:
 - If the user wants a random sample, assume no seed, without replacement, and uniforming across all rows. Unless otherwise specificed. 
 Keep answers concise. Provide brief rationale before tool calls when helpful. Avoid redundant summaries."""
 
+# Shared by the ng_annotations_* tools (mirrors models.Annotation)
+ANNOTATION_ITEMS_SCHEMA = {
+  "type": "array",
+  "items": {
+    "type": "object",
+    "properties": {
+      "id": {"type": "string"},
+      "type": {"type": "string", "enum": ["point", "box", "ellipsoid"]},
+      "center": {
+        "type": "object",
+        "properties": {
+          "x": {"type": "number"},
+          "y": {"type": "number"},
+          "z": {"type": "number"}
+        },
+        "required": ["x", "y", "z"]
+      },
+      "size": {
+        "type": "object",
+        "properties": {
+          "x": {"type": "number"},
+          "y": {"type": "number"},
+          "z": {"type": "number"}
+        }
+      }
+    },
+    "required": ["type", "center"]
+  }
+}
+
 # Define available tools (schemas must match your Pydantic models)
 TOOLS = [
   {
@@ -98,39 +128,99 @@ TOOLS = [
         "type": "object",
         "properties": {
           "layer": {"type": "string"},
-          "items": {
-            "type": "array",
-            "items": {
-              "type": "object",
-              "properties": {
-                "id": {"type": "string"},
-                "type": {"type": "string", "enum": ["point", "box", "ellipsoid"]},
-                "center": {
-                  "type": "object",
-                  "properties": {
-                    "x": {"type": "number"},
-                    "y": {"type": "number"},
-                    "z": {"type": "number"}
-                  },
-                  "required": ["x", "y", "z"]
-                },
-                "size": {
-                  "type": "object",
-                  "properties": {
-                    "x": {"type": "number"},
-                    "y": {"type": "number"},
-                    "z": {"type": "number"}
-                  }
-                }
-              },
-              "required": ["type", "center"]
-            }
-          }
+          "items": ANNOTATION_ITEMS_SCHEMA
+        },
+        "required": ["layer", "items"]
+      }
+    }
+  },
+  {
+    "type":"function",
+    "function": {
+      "name":"ng_annotations_upsert",
+      "description":"Insert annotations or update existing ones with the same id (use for iterative ROI curation)",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "layer": {"type": "string"},
+          "items": ANNOTATION_ITEMS_SCHEMA
+        },
+        "required": ["layer", "items"]
+      }
+    }
+  },
+  {
+    "type":"function",
+    "function": {
+      "name":"ng_annotations_delete",
+      "description":"Delete annotations from a layer by id",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "layer": {"type": "string"},
+          "ids": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["layer", "ids"]
+      }
+    }
+  },
+  {
+    "type":"function",
+    "function": {
+      "name":"ng_annotations_replace",
+      "description":"Replace all annotations in a layer with the given items",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "layer": {"type": "string"},
+          "items": ANNOTATION_ITEMS_SCHEMA
         },
         "required": ["layer", "items"]
       }
     }
   },
+  {
+    "type":"function",
+    "function": {
+      "name":"ng_annotations_query",
+      "description":"Find annotations in a layer near a point (radius), the k nearest, or inside a box. Center defaults to the current view position. Returns only matching ids/coordinates; prefer over ng_state_summary(detail='full') for spatial questions.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "layer": {"type": "string"},
+          "mode": {"type": "string", "enum": ["radius","knn","bbox"], "default": "radius"},
+          "center": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "radius": {"type": "number", "description": "Search radius (radius mode) or box half-width (bbox mode without lower/upper)"},
+          "k": {"type": "integer", "default": 10, "minimum": 1},
+          "lower": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "upper": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "units": {"type": "string", "enum": ["voxel","um","nm"], "default": "voxel", "description": "Units of radius; physical units use the state's dimensions"},
+          "limit": {"type": "integer", "default": 20, "minimum": 1, "maximum": 1000, "description": "Max matches returned; raise only when needed, large answers are cut off"}
+        },
+        "required": ["layer"]
+      }
+    }
+  },
+  {
+    "type":"function",
+    "function": {
+      "name":"ng_annotations_from_table",
+      "description":"Show many points from an uploaded table (or summary) as a precomputed annotation layer served by the backend. Prefer over ng_annotations_add for more than a few dozen points; state URL size stays constant.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "layer": {"type": "string", "description": "Annotation layer name (created or re-pointed)"},
+          "file_id": {"type": "string"},
+          "summary_id": {"type": "string"},
+          "center_columns": {"type": "array", "items": {"type": "string"}, "default": ["x","y","z"]},
+          "id_column": {"type": "string", "description": "Optional column of unique non-negative integer ids"},
+          "property_columns": {"type": "array", "items": {"type": "string"}, "description": "Numeric columns to attach as annotation properties"},
+          "limit": {"type": "integer", "default": 1000, "minimum": 1, "description": "Max annotations per spatial index chunk (level-of-detail density), not a row cap; every row is written"}
+        },
+        "required": ["layer"]
+      }
+    }
+  },
   {
     "type":"function",
     "function": {
@@ -159,7 +249,7 @@ DATA_TOOLS = [
     "type": "function",
     "function": {
       "name": "data_list_files",
-      "description": "List uploaded CSV files with metadata (ids, columns).",
+      "description": "List uploaded data files (CSV, Parquet, Arrow) with metadata (ids, format, columns).",
       "parameters": {"type": "object", "properties": {}}
     }
   },
@@ -190,9 +280,10 @@ DATA_TOOLS = [
         "properties": {
           "file_id": {"type": "string", "description": "Source file id (provide either file_id OR summary_id)"},
           "summary_id": {"type": "string", "description": "Existing summary/derived table id (mutually exclusive with file_id)"},
-          "sort_by": {"type": "string"},
+          "sort_by": {"type": "array", "items": {"type": "string"}, "description": "Ranking column(s); later columns break ties"},
           "descending": {"type": "boolean", "default": True},
-          "top_n": {"type": "integer", "default": 5, "minimum": 1, "maximum": 50},
+          "top_n": {"type": "integer", "default": 5, "minimum": 1, "maximum": 50, "description": "Rows to return (per group when group_by is set; 50 rows total at most)"},
+          "group_by": {"type": "array", "items": {"type": "string"}, "description": "Return the top_n rows within each group (e.g. best cell per region)"},
           "id_column": {"type": "string", "default": "cell_id"},
           "center_columns": {"type": "array", "items": {"type": "string"}, "default": ["x","y","z"]},
           "include_columns": {"type": "array", "items": {"type": "string"}},
@@ -253,30 +344,139 @@ DATA_TOOLS = [
     "type": "function",
     "function": {
       "name": "data_select",
-      "description": "Select subset of columns and filtered rows; stores as summary table.",
+      "description": "Filter rows, pick columns, add computed columns and optionally sort (runs lazily; only referenced columns are read); stores result as summary table. Filters are AND-combined; use {\"any\": [filters...]} for OR groups.",
       "parameters": {
         "type": "object",
         "properties": {
           "file_id": {"type": "string"},
-          "columns": {"type": "array", "items": {"type": "string"}},
+          "columns": {"type": "array", "items": {"type": "string"}, "description": "Output columns (may include computed names)"},
           "filters": {
             "type": "array",
             "items": {
               "type": "object",
               "properties": {
                 "column": {"type": "string"},
-                "op": {"type": "string", "enum": ["==","!=",">","<",">=","<="]},
-                "value": {}
-              },
-              "required": ["column", "op", "value"]
+                "op": {"type": "string", "enum": ["==","!=",">","<",">=","<=","in","not_in","between","is_null","is_not_null","contains"]},
+                "value": {"description": "Scalar; list for in/not_in; [low, high] for between; omit for is_null"},
+                "any": {"type": "array", "items": {"type": "object"}, "description": "OR group of nested filters"},
+                "all": {"type": "array", "items": {"type": "object"}, "description": "AND group of nested filters"}
+              }
             }
           },
+          "computed": {
+            "type": "array",
+            "description": "Computed columns, e.g. {name: 'ratio', expr: 'intensity / area'}; supports + - * / ** comparisons and/or, abs sqrt log log10 exp floor ceil round min max",
+            "items": {
+              "type": "object",
+              "properties": {"name": {"type": "string"}, "expr": {"type": "string"}},
+              "required": ["name", "expr"]
+            }
+          },
+          "sort_by": {"type": "string"},
+          "descending": {"type": "boolean", "default": False},
           "limit": {"type": "integer", "default": 20, "minimum": 1, "maximum": 500}
         },
         "required": ["file_id"]
       }
     }
   },
+  {
+    "type": "function",
+    "function": {
+      "name": "data_sql",
+      "description": "Run ONE SQL SELECT (Polars SQL: joins, GROUP BY, aggregates, window functions, CTEs) over uploaded tables and stores the result as a summary. Tables are named by file_id / summary_id (double-quote ids starting with a digit, e.g. \"1a2b3c4d\") and files also by their file-name stem (cells.csv -> cells). Prefer this over chaining several data_select calls.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "query": {"type": "string"},
+          "preview_rows": {"type": "integer", "default": 20, "minimum": 1, "maximum": 200}
+        },
+        "required": ["query"]
+      }
+    }
+  },
+  {
+    "type": "function",
+    "function": {
+      "name": "data_nearby",
+      "description": "Rows of an uploaded table (or summary) near a point: k nearest (default), within a radius, or inside a box, using the table's coordinate columns. Center defaults to the current view position, so use this for 'cells near where I'm looking'. Uses a cached spatial index; no full scan.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "file_id": {"type": "string"},
+          "summary_id": {"type": "string"},
+          "mode": {"type": "string", "enum": ["radius","knn","bbox"], "default": "knn"},
+          "center": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "radius": {"type": "number", "description": "Search radius (radius mode) or box half-width (bbox mode without lower/upper)"},
+          "k": {"type": "integer", "default": 10, "minimum": 1},
+          "lower": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "upper": {"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"},"z":{"type":"number"}},"required":["x","y","z"]},
+          "units": {"type": "string", "enum": ["voxel","um","nm"], "default": "voxel", "description": "Units of radius/distances; physical units use the state's dimensions"},
+          "center_columns": {"type": "array", "items": {"type": "string"}, "default": ["x","y","z"]},
+          "columns": {"type": "array", "items": {"type": "string"}, "description": "Columns to return (default all)"},
+          "limit": {"type": "integer", "default": 20, "minimum": 1, "maximum": 1000, "description": "Max rows returned; raise only when needed, large answers are cut off"}
+        }
+      }
+    }
+  },
+  {
+    "type": "function",
+    "function": {
+      "name": "data_in_view",
+      "description": "Cells of an uploaded table inside the current Neuroglancer field of view (position, zoom and layout of the state). Returns the rows when few are visible, otherwise a bounded grid of cell counts (density) at a level of detail matching the zoom.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "file_id": {"type": "string"},
+          "summary_id": {"type": "string"},
+          "center_columns": {"type": "array", "items": {"type": "string"}, "default": ["x","y","z"]},
+          "viewport": {"type": "array", "items": {"type": "integer"}, "default": [1024, 1024], "description": "Viewer size in screen pixels (width, height)"},
+          "depth": {"type": "number", "default": 10, "description": "Slab thickness in voxels around the slice (2D layouts)"},
+          "max_points": {"type": "integer", "default": 25, "minimum": 0, "maximum": 1000, "description": "Return rows when at most this many can be in view; keep small, large answers are cut off"},
+          "max_bins": {"type": "integer", "default": 48, "minimum": 1, "maximum": 4096, "description": "Otherwise at most this many density cells; keep small, large answers are cut off"},
+          "columns": {"type": "array", "items": {"type": "string"}, "description": "Columns to return in points mode (default all)"}
+        }
+      }
+    }
+  },
+  {
+    "type": "function",
+    "function": {
+      "name": "data_spatial_join",
+      "description": "Match cells across two uploaded tables (e.g. HCR rounds) by nearest coordinates within a distance tolerance. one_to_one pairs each cell at most once; many_to_one gives every left cell its nearest right cell. Stores the joined table (left columns, right columns, distance) as a summary.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "left_id": {"type": "string", "description": "file_id or summary_id"},
+          "right_id": {"type": "string", "description": "file_id or summary_id"},
+          "tolerance": {"type": "number", "description": "Maximum match distance in coordinate units"},
+          "left_columns": {"type": "array", "items": {"type": "string"}, "default": ["x","y","z"]},
+          "right_columns": {"type": "array", "items": {"type": "string"}, "description": "Defaults to left_columns"},
+          "mode": {"type": "string", "enum": ["one_to_one","many_to_one"], "default": "one_to_one"},
+          "how": {"type": "string", "enum": ["inner","left"], "default": "inner", "description": "left keeps unmatched left rows"},
+          "suffix": {"type": "string", "default": "_right"},
+          "preview_rows": {"type": "integer", "default": 20, "minimum": 1, "maximum": 200}
+        },
+        "required": ["left_id", "right_id", "tolerance"]
+      }
+    }
+  },
+  {
+    "type": "function",
+    "function": {
+      "name": "job_status",
+      "description": "Check a background job started by a long-running tool (histograms, spatial joins). Returns status, progress and, once done, the tool's result. Use wait to block up to 60 s; cancel=true stops it.",
+      "parameters": {
+        "type": "object",
+        "properties": {
+          "job_id": {"type": "string"},
+          "wait": {"type": "number", "default": 0, "minimum": 0, "maximum": 60},
+          "cancel": {"type": "boolean", "default": False}
+        },
+        "required": ["job_id"]
+      }
+    }
+  },
   {
     "type": "function",
     "function": {
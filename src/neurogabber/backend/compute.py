@@ -0,0 +1,242 @@
+"""
+Compute scheduler for CPU-heavy data tools.
+
+Selection, describe, ranking and histogram work runs under one of a bounded
+number of compute slots (``NEUROGABBER_COMPUTE_SLOTS``), each budgeted
+``NEUROGABBER_COMPUTE_THREADS`` threads, so concurrent sessions queue for
+cores instead of oversubscribing Polars' and NumPy's thread pools. Waiting
+calls are admitted round-robin across sessions (``X-Neurogabber-Session``
+header, else the client host): a session firing many calls can't starve the
+others.
+
+``NEUROGABBER_COMPUTE=process`` additionally runs kernels passed to
+``ComputeScheduler.run`` in a spawned process pool whose workers are capped at
+the per-job thread budget. Table inputs should be lazy scans of the on-disk
+Arrow IPC files (``DataMemory.get_lazy(..., prefer_disk=True)``), which pickle
+as a query plan; DataFrame results come back as an uncompressed Arrow IPC file
+the parent memory-maps, so table data never travels through pickles. The
+default ``thread`` mode runs kernels in the calling thread once admitted.
+
+Polars is imported lazily here: pool workers unpickle this module before
+their thread budget is applied, and Polars sizes its pool at import.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+_CPUS = os.cpu_count() or 1
+COMPUTE_MODE = os.getenv("NEUROGABBER_COMPUTE", "thread").lower()  # thread | process
+COMPUTE_SLOTS = int(os.getenv("NEUROGABBER_COMPUTE_SLOTS", str(max(1, min(4, _CPUS // 2)))))
+COMPUTE_THREADS = int(os.getenv("NEUROGABBER_COMPUTE_THREADS", str(max(1, _CPUS // max(1, COMPUTE_SLOTS)))))
+
+SESSION_HEADER = "X-Neurogabber-Session"
+DEFAULT_SESSION = "default"
+_THREAD_ENV = ("POLARS_MAX_THREADS", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+_session: ContextVar[str] = ContextVar("neurogabber_session", default=DEFAULT_SESSION)
+
+
+def set_session(session: Optional[str]) -> Token:
+    """Attribute compute in this context to ``session`` (reset with ``reset_session``)."""
+    return _session.set(session or DEFAULT_SESSION)
+
+
+def reset_session(token: Token) -> None:
+    _session.reset(token)
+
+
+def current_session() -> str:
+    return _session.get()
+
+
+@dataclass(frozen=True)
+class _ArrowResult:
+    path: str
+
+
+def _init_worker(threads: int) -> None:
+    for name in _THREAD_ENV:
+        os.environ[name] = str(threads)
+
+
+def _call_in_worker(fn: Callable, args: tuple, kwargs: dict, out_dir: str) -> Any:
+    import polars as pl
+
+    result = fn(*args, **kwargs)
+    if isinstance(result, pl.LazyFrame):
+        result = result.collect()
+    if isinstance(result, pl.DataFrame):
+        path = os.path.join(out_dir, f"{uuid.uuid4().hex}.arrow")
+        result.write_ipc(path, compression="uncompressed")
+        return _ArrowResult(path)
+    return result
+
+
+def _load(result: Any) -> Any:
+    if not isinstance(result, _ArrowResult):
+        return result
+    import polars as pl
+
+    df = pl.read_ipc(result.path)  # memory-mapped (uncompressed IPC)
+    try:
+        os.unlink(result.path)  # the mapping outlives the directory entry on POSIX
+    except OSError:
+        pass
+    return df
+
+
+def _collect(lf):
+    return lf.collect()
+
+
+def _describe(lf):
+    return lf.collect().describe()
+
+
+class ComputeScheduler:
+    def __init__(
+        self,
+        slots: int = COMPUTE_SLOTS,
+        threads: int = COMPUTE_THREADS,
+        mode: str = COMPUTE_MODE,
+        out_dir: Optional[str] = None,
+    ):
+        self.slots = max(1, slots)
+        self.threads = max(1, threads)
+        self.mode = mode
+        self._out_dir = out_dir
+        self._cond = threading.Condition()
+        self._waiting: "OrderedDict[str, Deque[object]]" = OrderedDict()
+        self._active = 0
+        self._held = threading.local()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.completed = 0
+        self.process_calls = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def process(self) -> bool:
+        return self.mode == "process"
+
+    def _head(self) -> Optional[object]:
+        for tickets in self._waiting.values():
+            return tickets[0]
+        return None
+
+    @contextmanager
+    def slot(self, session: Optional[str] = None) -> Iterator[None]:
+        """Hold a compute slot; waiters are admitted round-robin by session.
+
+        Re-entrant per thread, so a tool that calls another compute path
+        doesn't wait on itself.
+        """
+        if getattr(self._held, "depth", 0):
+            self._held.depth += 1
+            try:
+                yield
+            finally:
+                self._held.depth -= 1
+            return
+        session = session or current_session()
+        ticket = object()
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting.setdefault(session, deque()).append(ticket)
+            try:
+                while not (self._active < self.slots and self._head() is ticket):
+                    self._cond.wait()
+            except BaseException:
+                self._waiting[session].remove(ticket)
+                if not self._waiting[session]:
+                    del self._waiting[session]
+                self._cond.notify_all()
+                raise
+            tickets = self._waiting[session]
+            tickets.popleft()
+            if tickets:
+                self._waiting.move_to_end(session)  # other sessions go first next time
+            else:
+                del self._waiting[session]
+            self._active += 1
+            self.wait_seconds += time.perf_counter() - start
+            self._cond.notify_all()  # the next head may fit in a remaining slot
+        self._held.depth = 1
+        try:
+            yield
+        finally:
+            self._held.depth = 0
+            with self._cond:
+                self._active -= 1
+                self.completed += 1
+                self._cond.notify_all()
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """``fn(*args, **kwargs)`` under a compute slot (in a pool worker in process mode).
+
+        In process mode ``fn`` and its arguments must be picklable
+        (module-level functions, lazy scans, arrays).
+        """
+        with self.slot():
+            if not self.process:
+                return fn(*args, **kwargs)
+            self.process_calls += 1
+            future = self._executor().submit(_call_in_worker, fn, args, kwargs, self.out_dir())
+            return _load(future.result())
+
+    def collect(self, lf):
+        return self.run(_collect, lf)
+
+    def describe(self, lf):
+        return self.run(_describe, lf)
+
+    def out_dir(self) -> str:
+        if self._out_dir is None:
+            from .storage.data import DATA_DIR
+
+            self._out_dir = os.path.join(DATA_DIR, "compute")
+        os.makedirs(self._out_dir, exist_ok=True)
+        return self._out_dir
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._cond:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.slots,
+                    mp_context=multiprocessing.get_context("spawn"),  # Polars isn't fork-safe
+                    initializer=_init_worker,
+                    initargs=(self.threads,),
+                )
+            return self._pool
+
+    def shutdown(self) -> None:
+        with self._cond:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "mode": self.mode,
+                "slots": self.slots,
+                "threads_per_job": self.threads,
+                "active": self._active,
+                "queued": {session: len(t) for session, t in self._waiting.items()},
+                "completed": self.completed,
+                "process_calls": self.process_calls,
+                "wait_seconds": round(self.wait_seconds, 4),
+            }
+
+
+COMPUTE = ComputeScheduler()
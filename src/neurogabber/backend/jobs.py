@@ -0,0 +1,233 @@
+"""
+Local background jobs for long-running tools.
+
+Heavy tools (volume histograms, spatial joins, large ingests) run on a small
+thread pool instead of inside the chat request. ``JobManager.submit`` returns
+a ``Job`` handle at once; callers poll ``to_meta()`` or ``wait()`` for it.
+
+Job functions receive a ``JobContext``. ``report(fraction, message)``
+publishes progress and ``check()`` raises ``JobCancelled`` once cancellation
+was requested (cancellation is cooperative for running jobs; queued ones never
+start). Code deeper in a tool can use the module-level ``report`` /
+``check_cancelled``, which act on the job running in the current thread and
+do nothing outside a job.
+
+Jobs submitted with a ``key`` are deduplicated: while a job with the same key
+is queued, running or finished successfully, ``submit`` returns it instead of
+starting another, so its result doubles as a cache. Keys should carry source
+versions (``DataMemory.source_key``) so changed inputs get a fresh job.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+JOB_WORKERS = int(os.getenv("NEUROGABBER_JOB_WORKERS", "2"))
+# Finished jobs kept for polling / result reuse (oldest dropped first).
+MAX_JOBS = int(os.getenv("NEUROGABBER_MAX_JOBS", "256"))
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = "queued", "running", "done", "error", "cancelled"
+FINISHED = {DONE, ERROR, CANCELLED}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when its job was cancelled."""
+
+
+@dataclass
+class Job:
+    job_id: str
+    tool: str
+    args: Dict[str, Any]
+    key: Optional[Hashable] = None
+    status: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Optional[Future] = field(default=None, repr=False)
+    _cleanup: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes (or ``timeout`` s pass); True if finished."""
+        return self._done.wait(timeout)
+
+    def to_meta(self, include_result: bool = True) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        meta = {
+            "job_id": self.job_id,
+            "tool": self.tool,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "elapsed": round(end - (self.started or end), 3),
+        }
+        if self.status == DONE and include_result:
+            meta["result"] = self.result
+        if self.error:
+            meta["error"] = self.error
+        return meta
+
+
+class JobContext:
+    """Handle passed to job functions for progress and cancellation."""
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def report(self, fraction: Optional[float] = None, message: Optional[str] = None) -> None:
+        if fraction is not None:
+            self.job.progress = min(1.0, max(0.0, float(fraction)))
+        if message is not None:
+            self.job.message = message
+        self.check()
+
+    def check(self) -> None:
+        if self.job.cancel_requested:
+            raise JobCancelled(self.job.job_id)
+
+
+_current = threading.local()
+
+
+def report(fraction: Optional[float] = None, message: Optional[str] = None) -> None:
+    """Progress for the job running in this thread (no-op outside jobs)."""
+    ctx = getattr(_current, "ctx", None)
+    if ctx is not None:
+        ctx.report(fraction, message)
+
+
+def check_cancelled() -> None:
+    ctx = getattr(_current, "ctx", None)
+    if ctx is not None:
+        ctx.check()
+
+
+def _run_cleanup(cleanup: Callable[[], None]) -> None:
+    try:
+        cleanup()
+    except Exception:
+        pass  # best effort; the job's own status stands
+
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, max_jobs: int = MAX_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="neurogabber-job")
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        tool: str,
+        fn: Callable[[JobContext], Any],
+        args: Optional[Dict[str, Any]] = None,
+        key: Optional[Hashable] = None,
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """Run ``fn(ctx)`` in the pool, or return the live/successful job already holding ``key``.
+
+        ``cleanup`` (e.g. removing a spooled input) runs once the job reaches
+        any terminal status, including cancellation before it started; if an
+        existing job is returned instead, it runs right away.
+        """
+        with self._lock:
+            if key is not None and key in self._by_key:
+                existing = self._jobs.get(self._by_key[key])
+                if existing is not None and existing.status not in (ERROR, CANCELLED):
+                    if cleanup is not None:
+                        _run_cleanup(cleanup)
+                    return existing
+            job = Job(uuid.uuid4().hex[:12], tool, dict(args or {}), key=key, _cleanup=cleanup)
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._by_key[key] = job.job_id
+            self._trim()
+        # run in the submitter's context (keeps e.g. the compute session for fair scheduling)
+        job._future = self._executor.submit(contextvars.copy_context().run, self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[JobContext], Any]) -> None:
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        job.status, job.started = RUNNING, time.time()
+        ctx = JobContext(job)
+        _current.ctx = ctx
+        try:
+            result = fn(ctx)
+            ctx.check()  # a cancel during the last stretch still wins
+            job.result, job.progress = result, 1.0
+            if isinstance(result, dict) and "error" in result:
+                job.error = str(result["error"])
+                self._finish(job, ERROR)
+            else:
+                self._finish(job, DONE)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            if job.cancel_requested:  # JobCancelled re-wrapped by the tool's own error handling
+                self._finish(job, CANCELLED)
+                return
+            job.error = str(e)
+            job.message = traceback.format_exc(limit=3)[-400:]
+            self._finish(job, ERROR)
+        finally:
+            _current.ctx = None
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status, job.finished = status, time.time()
+        if status != DONE:
+            job.result = None
+        cleanup, job._cleanup = job._cleanup, None
+        if cleanup is not None:
+            _run_cleanup(cleanup)
+        job._done.set()
+
+    def _trim(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in FINISHED]
+        while len(self._jobs) > self.max_jobs and finished:
+            old = self._jobs.pop(finished.pop(0))
+            if old.key is not None and self._by_key.get(old.key) == old.job_id:
+                del self._by_key[old.key]
+
+    def get(self, job_id: str) -> Job:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job_id: {job_id}")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """Request cancellation; queued jobs are dropped, running ones stop at their next check."""
+        job = self.get(job_id)
+        if job.status in FINISHED:
+            return job
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, CANCELLED)
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_meta(include_result=False) for job in self._jobs.values()]
+
+
+JOBS = JobManager()
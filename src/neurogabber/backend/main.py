@@ -1,26 +1,48 @@
+import asyncio
+import hashlib
+import json
 import os
 import re
+import threading
 from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), '.env'))
 
-from fastapi import FastAPI, UploadFile, Body, Query, File
-from .models import ChatRequest, SetView, SetLUT, AddAnnotations, HistogramReq, IngestCSV, SaveState
+from fastapi import FastAPI, UploadFile, Body, Query, File, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+from .models import ChatRequest, SetView, SetLUT, AddAnnotations, DeleteAnnotations, AnnotationsQuery, DataNearby, DataInView, DataSpatialJoin, JobStatus, AnnotationsFromTable, HistogramReq, IngestCSV, SaveState
 from .tools.neuroglancer_state import (
     NeuroglancerState,
     to_url,
     from_url,
 )
 from .tools.plots import sample_voxels, histogram
+from .tools.precomputed_annotations import evict_sources, write_point_annotations
+from .tools.annotation_index import annotation_type
+from .tools.spatial import match_points
+from .tools.pointer_expansion import expand_if_pointer_async, is_pointer_url
 from .tools.io import load_csv, top_n_rois
+from .tools.query import PLAN_CACHE, sql_plan
+from .tools.ranking import RANK_CACHE
+from .tools.memo import TOOL_MEMO
+from .tools import formats
+from . import compute, jobs
+from .compute import COMPUTE
+from .jobs import JOBS
 from .storage.states import save_state, load_state
 from .adapters.llm import run_chat, SYSTEM_PROMPT, MODEL
-from .tools.constants import is_mutating_tool
-from .storage.data import DataMemory, InteractionMemory
+from .tools.constants import is_background_tool, is_memoizable_tool, is_mutating_tool
+from .storage.data import DataMemory, InteractionMemory, MAX_FILE_BYTES, content_hasher
+from .storage.stats import compact_stats, describe_frame
 from .observability.timing import TimingCollector
 import polars as pl
+import shutil
+import tempfile
+import uuid
 
 import logging
 
@@ -39,6 +61,17 @@ def _dbg(msg: str):  # lightweight wrapper to centralize debug guard
 
 app = FastAPI()
 
+
+@app.middleware("http")
+async def _compute_session(request: Request, call_next):
+    """Attribute compute to the caller's session for fair scheduling (see ``compute.py``)."""
+    session = request.headers.get(compute.SESSION_HEADER) or (request.client.host if request.client else None)
+    token = compute.set_session(session)
+    try:
+        return await call_next(request)
+    finally:
+        compute.reset_session(token)
+
 # In-memory working state per session (MVP). Replace with DB keyed by user/session.
 CURRENT_STATE = NeuroglancerState()
 DATA_MEMORY = DataMemory()
@@ -46,6 +79,34 @@ INTERACTION_MEMORY = InteractionMemory()
 _TRACE_HISTORY: list[dict] = []  # store recent full traces (in-memory, capped)
 _TRACE_HISTORY_MAX = 50
 
+# Precomputed annotation sources written by ng_annotations_from_table are served
+# from here; PUBLIC_URL is how Neuroglancer (in the browser) reaches this backend.
+PRECOMPUTED_DIR = os.getenv(
+    "NEUROGABBER_PRECOMPUTED_DIR", os.path.join(tempfile.gettempdir(), "neurogabber", "precomputed")
+)
+PUBLIC_URL = os.getenv("NEUROGABBER_PUBLIC_URL", "http://127.0.0.1:8000")
+# Sources are keyed by table version + arguments and reused; beyond this many the
+# least recently used ones not referenced by the current state are removed.
+PRECOMPUTED_KEEP = int(os.getenv("NEUROGABBER_PRECOMPUTED_KEEP", "16"))
+os.makedirs(PRECOMPUTED_DIR, exist_ok=True)
+
+
+class _PrecomputedFiles(StaticFiles):
+    """Static files with permissive CORS so a remotely hosted Neuroglancer can fetch chunks.
+
+    StaticFiles already provides ETag/Last-Modified (304 on revalidation) and
+    HTTP Range support.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Expose-Headers"] = "ETag, Content-Range, Content-Length"
+        return response
+
+
+app.mount("/precomputed", _PrecomputedFiles(directory=PRECOMPUTED_DIR, check_dir=False), name="precomputed")
+
 
 @app.post("/tools/ng_set_view")
 def t_set_view(args: SetView):
@@ -84,11 +145,10 @@ def t_set_layer_visibility(name: str = Body(..., embed=True), visible: bool = Bo
     CURRENT_STATE.set_layer_visibility(name=name, visible=visible)
     return {"ok": True, "layer": name, "visible": visible}
 
-@app.post("/tools/ng_annotations_add")
-def t_add_annotations(args: AddAnnotations):
-    global CURRENT_STATE
+def _annotation_items(annotations) -> list[dict]:
+    """Convert Annotation models to Neuroglancer inline annotation dicts."""
     items = []
-    for a in args.items:
+    for a in annotations:
         if a.type == "point":
             items.append({"point": [a.center.x, a.center.y, a.center.z], "id": a.id or None})
         elif a.type == "box":
@@ -97,13 +157,244 @@ def t_add_annotations(args: AddAnnotations):
         elif a.type == "ellipsoid":
             items.append({"type":"ellipsoid", "center": [a.center.x, a.center.y, a.center.z],
                           "radii": [a.size.x/2, a.size.y/2, a.size.z/2], "id": a.id or None})
-    CURRENT_STATE.add_annotations(args.layer, items)
+    return items
+
+@app.post("/tools/ng_annotations_add")
+def t_add_annotations(args: AddAnnotations):
+    global CURRENT_STATE
+    CURRENT_STATE.add_annotations(args.layer, _annotation_items(args.items))
     return {"ok": True}
 
+@app.post("/tools/ng_annotations_upsert")
+def t_upsert_annotations(args: AddAnnotations):
+    """Insert annotations or update existing ones matched by id (O(items))."""
+    try:
+        index = CURRENT_STATE.annotation_index(args.layer, create=True)
+        inserted, updated = index.upsert(_annotation_items(args.items))
+        return {"ok": True, "layer": args.layer, "inserted": inserted, "updated": updated, "count": len(index)}
+    except ValueError as ve:
+        return {"ok": False, "error": str(ve)}
+
+@app.post("/tools/ng_annotations_delete")
+def t_delete_annotations(args: DeleteAnnotations):
+    """Delete annotations by id; unknown ids are reported, not treated as errors."""
+    try:
+        index = CURRENT_STATE.annotation_index(args.layer)
+        if index is None:
+            return {"ok": False, "error": f"Unknown annotation layer '{args.layer}'"}
+        deleted, missing = index.delete(args.ids)
+        return {"ok": True, "layer": args.layer, "deleted": deleted, "missing": missing, "count": len(index)}
+    except ValueError as ve:
+        return {"ok": False, "error": str(ve)}
+
+@app.post("/tools/ng_annotations_replace")
+def t_replace_annotations(args: AddAnnotations):
+    """Replace every annotation in a layer with the given items."""
+    try:
+        count = CURRENT_STATE.annotation_index(args.layer, create=True).replace(_annotation_items(args.items))
+        return {"ok": True, "layer": args.layer, "count": count}
+    except ValueError as ve:
+        return {"ok": False, "error": str(ve)}
+
+_UNIT_METERS = {"um": 1e-6, "nm": 1e-9}
+
+
+def _view_center(state: NeuroglancerState) -> list[float]:
+    """xyz of the current view position (drops extra dims such as time)."""
+    pos = state.as_dict().get("position") or [0, 0, 0]
+    return [float(v) for v in (list(pos) + [0, 0, 0])[:3]]
+
+
+def _axis_scale(state: NeuroglancerState, units: str):
+    """Per-axis factor converting voxel coordinates to ``units`` (None for voxels)."""
+    if units == "voxel":
+        return None
+    dims = state.as_dict().get("dimensions") or {}
+    scale = []
+    for axis in ("x", "y", "z"):
+        size, unit = (dims.get(axis) or [None, None])[:2]
+        if unit != "m" or not size:
+            raise ValueError(f"Cannot convert to {units}: dimension '{axis}' is not in meters")
+        scale.append(size / _UNIT_METERS[units])
+    return scale
+
+
+_LAYOUT_PLANES = {"xy": (0, 1), "xz": (0, 2), "yz": (1, 2)}
+
+
+def _view_box(state: NeuroglancerState, viewport=(1024, 1024), depth: float = 10):
+    """Visible region ``(lower, upper)`` in voxel coordinates for the current view.
+
+    Cross-section layouts see ``crossSectionScale`` canonical units per screen
+    pixel in-plane and a ``depth`` voxel slab around the slice; 3D layouts see
+    a ``projectionScale`` cube. Canonical units are the finest dimension scale.
+    """
+    d = state.as_dict()
+    center = _view_center(state)
+    dims = d.get("dimensions") or {}
+    sizes = [((dims.get(axis) or [None])[0]) for axis in ("x", "y", "z")]
+    canonical = min((s for s in sizes if s), default=None)
+    factor = [canonical / s if canonical and s else 1.0 for s in sizes]
+    layout = d.get("layout") or "xy"
+    if isinstance(layout, dict):
+        layout = layout.get("type") or "xy"
+    plane = _LAYOUT_PLANES.get(str(layout)[:2])
+    if plane is None:  # 3d / 4panel
+        half = [float(d.get("projectionScale") or 1024) / 2 * f for f in factor]
+    else:
+        scale = float(d.get("crossSectionScale") or 1.0)
+        half = [depth / 2] * 3
+        for axis, px in zip(plane, viewport[:2]):
+            half[axis] = scale * px / 2 * factor[axis]
+    return [c - h for c, h in zip(center, half)], [c + h for c, h in zip(center, half)]
+
+
+def _spatial_lookup(grid, args, center, scale):
+    """Run ``args.mode`` (radius / knn / bbox) on ``grid``; returns ``(indices, distances or None)``."""
+    if args.mode == "knn":
+        return grid.knn(center, max(1, args.k), scale=scale)
+    if args.mode == "radius":
+        if args.radius is None:
+            raise ValueError("radius mode requires 'radius'")
+        return grid.radius(center, args.radius, scale=scale)
+    if args.lower and args.upper:
+        lower = [args.lower.x, args.lower.y, args.lower.z][: grid.dim]
+        upper = [args.upper.x, args.upper.y, args.upper.z][: grid.dim]
+    elif args.radius is not None:
+        half = [args.radius / f for f in scale] if scale else [args.radius] * grid.dim
+        lower = [c - h for c, h in zip(center, half)]
+        upper = [c + h for c, h in zip(center, half)]
+    else:
+        raise ValueError("bbox mode requires lower/upper or radius")
+    return grid.bbox(lower, upper), None
+
+
+@app.post("/tools/ng_annotations_query")
+def t_annotations_query(args: AnnotationsQuery):
+    """Radius, k-nearest or bbox lookup over an annotation layer's inline annotations.
+
+    Uses the layer's cached spatial index (rebuilt only after mutations) and
+    returns just the matching ids and coordinates, nearest first.
+    """
+    try:
+        index = CURRENT_STATE.annotation_index(args.layer)
+        if index is None:
+            return {"error": f"Unknown annotation layer '{args.layer}'"}
+        grid, ids = index.spatial()
+        center = [args.center.x, args.center.y, args.center.z] if args.center else _view_center(CURRENT_STATE)
+        scale = _axis_scale(CURRENT_STATE, args.units)
+        idx, dist = _spatial_lookup(grid, args, center, scale)
+        limit = max(1, min(args.limit, 1000))
+        matches = []
+        for j, i in enumerate(idx[:limit]):
+            m = {"id": ids[i], "point": grid.points[i].tolist()}
+            if dist is not None:
+                m["distance"] = round(float(dist[j]), 4)
+            matches.append(m)
+        return {
+            "layer": args.layer,
+            "mode": args.mode,
+            "center": center,
+            "units": args.units,
+            "count": int(len(idx)),
+            "truncated": len(idx) > limit,
+            "matches": matches,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+def _precomputed_in_use(state) -> set:
+    """Ids of precomputed sources served here that ``state``'s layers reference."""
+    prefix = f"{PUBLIC_URL.rstrip('/')}/precomputed/"
+    used = set()
+    for L in _state_dict(state).get("layers", []):
+        src = L.get("source")
+        url = src.get("url") if isinstance(src, dict) else src
+        if isinstance(url, str) and prefix in url:
+            used.add(url.split(prefix, 1)[1].strip("/").split("/", 1)[0])
+    return used
+
+@app.post("/tools/ng_annotations_from_table")
+def t_annotations_from_table(args: AnnotationsFromTable):
+    """Write table rows as a precomputed annotation source and reference it from a layer.
+
+    Unlike ng_annotations_add nothing is inlined into the state: the layer source
+    becomes ``precomputed://<PUBLIC_URL>/precomputed/<id>`` so URL size stays
+    constant and Neuroglancer loads only the spatial chunks in view. The id is
+    derived from the table version and arguments, so repeating a call reuses
+    the written source (``reused`` in the result).
+    """
+    global CURRENT_STATE
+    if not args.file_id and not args.summary_id:
+        return {"error": "Must provide file_id or summary_id"}
+    try:
+        if args.summary_id:
+            df = DATA_MEMORY.get_summary_df(args.summary_id)
+        else:
+            df = DATA_MEMORY.get_df(args.file_id)
+        if len(args.center_columns) != 3:
+            return {"error": "center_columns must name exactly 3 columns (x, y, z)"}
+        prop_cols = args.property_columns or []
+        wanted = [*args.center_columns, *prop_cols] + ([args.id_column] if args.id_column else [])
+        missing = [c for c in wanted if c not in df.columns]
+        if missing:
+            return {"error": f"Missing columns: {missing}", "available_columns": df.columns}
+        non_numeric = [c for c in [*args.center_columns, *prop_cols] if not df.schema[c].is_numeric()]
+        if non_numeric:
+            return {"error": f"Columns must be numeric: {non_numeric}"}
+        ids = None
+        if args.id_column:
+            id_series = df.get_column(args.id_column)
+            if not id_series.dtype.is_integer() or id_series.null_count() or id_series.min() < 0 or id_series.n_unique() != id_series.len():
+                return {"error": f"id_column '{args.id_column}' must contain unique non-negative integers"}
+            ids = id_series.to_numpy()
+        dims = CURRENT_STATE.as_dict().get("dimensions") or {}
+        dims3 = {k: dims[k] for k in ("x", "y", "z")} if all(k in dims for k in ("x", "y", "z")) else None
+        key = [DATA_MEMORY.source_key(args.summary_id or args.file_id), args.center_columns, prop_cols, args.id_column, args.limit, dims3]
+        ann_id = hashlib.blake2b(json.dumps(key, default=str).encode(), digest_size=8).hexdigest()
+        out_dir = os.path.join(PRECOMPUTED_DIR, ann_id)
+        info_path = os.path.join(out_dir, "info")
+        reused = os.path.exists(info_path)
+        if reused:
+            with open(info_path, encoding="utf-8") as fh:
+                info = json.load(fh)
+            os.utime(out_dir)  # most recently used
+        else:
+            tmp_dir = os.path.join(PRECOMPUTED_DIR, f".{ann_id}-{uuid.uuid4().hex[:8]}")
+            try:
+                info = write_point_annotations(
+                    tmp_dir,
+                    df.select(args.center_columns).to_numpy(),
+                    ids=ids,
+                    properties={c: df.get_column(c).to_numpy() for c in prop_cols},
+                    dimensions=dims3,
+                    limit=args.limit,
+                )
+                os.rename(tmp_dir, out_dir)
+            except OSError:
+                if not os.path.exists(info_path):  # not just a concurrent identical call winning the rename
+                    raise
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        source = f"precomputed://{PUBLIC_URL.rstrip('/')}/precomputed/{ann_id}"
+        CURRENT_STATE.set_layer_source(args.layer, source)
+        evict_sources(PRECOMPUTED_DIR, PRECOMPUTED_KEEP, protect=_precomputed_in_use(CURRENT_STATE))
+        return {
+            "ok": True,
+            "layer": args.layer,
+            "source": source,
+            "count": df.height,
+            "levels": len(info["spatial"]),
+            "properties": [p["id"] for p in info["properties"]],
+            "reused": reused,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.post("/tools/data_plot_histogram")
 def t_hist(args: HistogramReq):
     vox = sample_voxels(args.layer, args.roi)
-    hist, edges = histogram(vox)
+    hist, edges = COMPUTE.run(histogram, vox)
     return {"hist": hist.tolist(), "edges": edges.tolist()}
 
 @app.post("/tools/data_ingest_csv_rois")
@@ -143,6 +434,32 @@ def t_state_load(link: str = Body(..., embed=True)):
         return {"ok": False, "error": str(e)}
 
 
+@app.post("/tools/state_resolve")
+async def t_state_resolve(
+    link: str = Body(..., embed=True),
+    load: bool = Body(True, embed=True),
+    timeout: Optional[float] = Body(None, embed=True),
+):
+    """Expand a JSON-pointer link (s3/gs/http) to an inline-state URL without blocking.
+
+    Fetches run off the event loop, share the pointer cache and are coalesced
+    across concurrent requests. With ``load`` the result also becomes
+    CURRENT_STATE (like state_load). Inline-state links (``#!{...}`` or
+    ``#{...}``) are parsed in place and returned unchanged.
+    """
+    global CURRENT_STATE
+    try:
+        if is_pointer_url(link):
+            url, state, was_pointer = await expand_if_pointer_async(link, timeout=timeout)
+        else:
+            url, state, was_pointer = link, NeuroglancerState.from_url(link).as_dict(), False
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    if load:
+        CURRENT_STATE = NeuroglancerState(state)
+    return {"ok": True, "url": url, "was_pointer": was_pointer}
+
+
 @app.post("/tools/demo_load")
 def t_demo_load(link: str = Body(..., embed=True)):
     """Convenience: same as state_load, named for demos."""
@@ -184,7 +501,9 @@ def _data_context_block(max_files: int = 10, max_summaries: int = 10) -> str:
     if files:
         parts.append("Files:")
         for f in files:
-            parts.append(f"- {f['file_id']} {f['name']} rows={f['n_rows']} cols={f['n_cols']} cols={f['columns'][:6]}...")
+            stats = DATA_MEMORY.files[f['file_id']].stats
+            cols = compact_stats(stats) if stats else f"{f['columns'][:6]}..."
+            parts.append(f"- {f['file_id']} {f['name']} rows={f['n_rows']} cols={f['n_cols']} {cols}")
     else:
         parts.append("Files: (none)")
     if sums:
@@ -301,7 +620,8 @@ def chat(req: ChatRequest):
             
             # Tool execution with timing
             with timing.tool_execution(iter_timing, fn) as tool_ctx:
-                result_payload = _execute_tool_by_name(fn, args)
+                result_payload, cache_status = _execute_tool_memoized(fn, args)
+                tool_ctx.set_cache(cache_status)
                 # Measure sizes
                 tool_ctx.set_sizes(
                     args=len(_json.dumps(args)),
@@ -440,7 +760,7 @@ def debug_timing(n: Optional[int] = None):
     Returns:
         JSON with summary stats and recent timing records table
     """
-    from .observability.timing import get_timing_stats, get_recent_records
+    from .observability.timing import get_timing_stats, get_recent_records, get_pointer_load_stats
     
     stats = get_timing_stats()
     records = get_recent_records(n)
@@ -448,7 +768,10 @@ def debug_timing(n: Optional[int] = None):
     return {
         "stats": stats,
         "records": records,
-        "count": len(records)
+        "count": len(records),
+        "pointer_loads": get_pointer_load_stats(),
+        "tool_memo": TOOL_MEMO.stats(),
+        "compute": COMPUTE.stats(),
     }
 
 
@@ -461,6 +784,75 @@ def _truncate_tool_output(obj, max_chars: int = 4000):
         return str(obj)[:max_chars]
 
 
+def _memo_args(name: str, args: dict) -> dict:
+    """``args`` with the endpoint's defaults filled in, so omitted and explicit defaults share a key."""
+    import inspect
+    endpoint = {"data_info": t_data_info, "data_preview": t_data_preview, "data_describe": t_data_describe}[name]
+    full = {}
+    for pname, param in inspect.signature(endpoint).parameters.items():
+        default = getattr(param.default, "default", param.default)
+        full[pname] = args.get(pname, None if default is ... else default)
+    return full
+
+
+# Seconds the chat loop waits on a background tool before handing the model a job handle.
+JOB_INLINE_WAIT = float(os.getenv("NEUROGABBER_JOB_INLINE_WAIT", "20"))
+
+
+def _job_key(name: str, args: dict) -> tuple:
+    """Dedupe/cache key for a tool job: tool, args and the versions of the tables it reads."""
+    from .tools.query import normalize
+    versions = []
+    for field in ("file_id", "summary_id", "left_id", "right_id"):
+        table_id = args.get(field)
+        if isinstance(table_id, str) and (table_id in DATA_MEMORY.files or table_id in DATA_MEMORY.summaries):
+            versions.append(DATA_MEMORY.source_key(table_id))
+    return (name, normalize(args), tuple(versions))
+
+
+def _execute_tool_in_job(name: str, args: dict, wait: float | None = None) -> dict:
+    """Run a background tool as a job; its result if it finishes within ``wait`` s, else a job handle."""
+    job = JOBS.submit(name, lambda ctx: _execute_tool_by_name(name, args), args=args, key=_job_key(name, args))
+    job.wait(JOB_INLINE_WAIT if wait is None else wait)
+    if job.status == jobs.DONE:
+        return job.result
+    meta = job.to_meta()
+    if job.status not in jobs.FINISHED:
+        meta["note"] = "Still running; call job_status with this job_id (wait up to 60 s) for the result."
+    return meta
+
+
+def _execute_tool_memoized(name: str, args: dict) -> tuple[dict, str | None]:
+    """Run a tool for the chat loop.
+
+    Repeats of read-only data tools are served from ``TOOL_MEMO`` and
+    long-running tools go through the job queue (``_execute_tool_in_job``).
+    Returns ``(result, cache_status)`` where the status is ``"hit"``/``"miss"``
+    for memoizable tools and ``None`` otherwise. Errors and results computed
+    while ingest stats are still pending are not cached.
+    """
+    if is_background_tool(name):
+        return _execute_tool_in_job(name, args), None
+    if not is_memoizable_tool(name):
+        return _execute_tool_by_name(name, args), None
+    try:
+        source_key = DATA_MEMORY.source_key(args.get("file_id") or args.get("summary_id"))
+    except KeyError:
+        return _execute_tool_by_name(name, args), None
+    args = _memo_args(name, args)
+    key = TOOL_MEMO.key(name, args, source_key)
+    cached = TOOL_MEMO.get(key)
+    if cached is not None:
+        sid = (cached.get("summary") or {}).get("summary_id")
+        if sid is None or sid in DATA_MEMORY.summaries:
+            return cached, "hit"
+        TOOL_MEMO.discard(key)
+    result = _execute_tool_by_name(name, args)
+    if isinstance(result, dict) and "error" not in result and result.get("stats") != "pending":
+        TOOL_MEMO.put(key, result)
+    return result, "miss"
+
+
 def _execute_tool_by_name(name: str, args: dict):
     """Dispatcher for internal tool execution (server-side)."""
     # Directly call the endpoint functions; replicate FastAPI parameter handling
@@ -474,6 +866,22 @@ def _execute_tool_by_name(name: str, args: dict):
         if name == "ng_annotations_add":
             from .models import AddAnnotations
             return t_add_annotations(AddAnnotations(**args))
+        if name == "ng_annotations_upsert":
+            return t_upsert_annotations(AddAnnotations(**args))
+        if name == "ng_annotations_delete":
+            return t_delete_annotations(DeleteAnnotations(**args))
+        if name == "ng_annotations_replace":
+            return t_replace_annotations(AddAnnotations(**args))
+        if name == "ng_annotations_query":
+            return t_annotations_query(AnnotationsQuery(**args))
+        if name == "data_nearby":
+            return t_data_nearby(DataNearby(**args))
+        if name == "data_in_view":
+            return t_data_in_view(DataInView(**args))
+        if name == "data_spatial_join":
+            return t_data_spatial_join(DataSpatialJoin(**args))
+        if name == "ng_annotations_from_table":
+            return t_annotations_from_table(AnnotationsFromTable(**args))
         if name == "data_plot_histogram":
             from .models import HistogramReq
             return t_hist(HistogramReq(**args))
@@ -499,6 +907,8 @@ def _execute_tool_by_name(name: str, args: dict):
             return t_data_describe(**args)
         if name == "data_select":
             return t_data_select(**args)
+        if name == "data_sql":
+            return t_data_sql(**args)
         if name == "data_list_summaries":
             return t_data_list_summaries()
         if name == "data_info":
@@ -507,6 +917,8 @@ def _execute_tool_by_name(name: str, args: dict):
             return t_data_sample(**args)
         if name == "data_ng_views_table":
             return t_data_ng_views_table(**args)
+        if name == "job_status":
+            return t_job_status(JobStatus(**args))
         if name == "ng_add_layer":
             return t_add_layer(**args)
         if name == "ng_set_layer_visibility":
@@ -582,6 +994,30 @@ def _synthesize_tool_call_message(tool_calls) -> str:
         return "Applied tools."  # fallback
 
 
+def _inline_annotations(layer: dict) -> list:
+    """Inline annotation list of a layer ([] for remote sources such as precomputed://)."""
+    src = layer.get("source")
+    if not isinstance(src, dict):
+        return []
+    return src.get("annotations") or []
+
+
+def _annotation_layer_stats(state, layer: dict) -> tuple[int, list[str]]:
+    """(count, sorted types) for an annotation layer.
+
+    Reads the layer's AnnotationIndex when the annotation tools already built
+    one (O(types)); otherwise scans the inline list. Never builds an index, so
+    summarizing leaves the state untouched.
+    """
+    if isinstance(state, NeuroglancerState) and isinstance(layer.get("source"), dict):
+        index = state.annotation_index(layer.get("name"), build=False)
+        if index is not None:
+            return len(index), index.types()
+    anns = _inline_annotations(layer)
+    types = {annotation_type(a) for a in anns} - {None}
+    return len(anns), sorted(types)
+
+
 def summarize_state_struct(state, detail: str = "standard") -> dict:
     """Produce a structured summary for LLM inspection.
 
@@ -612,8 +1048,11 @@ def summarize_state_struct(state, detail: str = "standard") -> dict:
                 if rng:
                     base["normalized_range"] = rng
             elif ltype == "annotation":
-                anns = (L.get("source") or {}).get("annotations") or []
-                base["annotation_count"] = len(anns)
+                src = L.get("source")
+                if isinstance(src, str):
+                    base["source_kinds"] = [src.split("://", 1)[0]]
+                else:
+                    base["annotation_count"] = _annotation_layer_stats(state, L)[0]
         if detail == "full":
             shader = L.get("shader")
             if shader:
@@ -623,16 +1062,11 @@ def summarize_state_struct(state, detail: str = "standard") -> dict:
     annotation_layers = []
     for L in sd.get("layers", []):
         if L.get("type") == "annotation":
-            anns = (L.get("source") or {}).get("annotations") or []
-            types = set()
-            for a in anns:
-                t = a.get("type") or ("point" if "point" in a else None)
-                if t:
-                    types.add(t)
+            count, types = _annotation_layer_stats(state, L)
             annotation_layers.append({
                 "name": L.get("name"),
-                "count": len(anns),
-                "types": sorted(types)
+                "count": count,
+                "types": types,
             })
 
     return {
@@ -656,107 +1090,355 @@ def t_state_summary(detail: str = Body("standard", embed=True)):
 
 # ------------------- Data tool endpoints -------------------
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Appends are applied one at a time so cache carry-over sees consistent versions.
+_APPEND_LOCK = threading.Lock()
+
+
+async def _spool_upload(file: UploadFile, spool: str) -> tuple[int, str]:
+    """Copy an upload to ``spool`` in chunks; returns ``(size, content hash)``."""
+    size = 0
+    digest = content_hasher()  # fingerprinted while spooling, for duplicate detection
+    with open(spool, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > MAX_FILE_BYTES:
+                raise ValueError(f"File too large (> {MAX_FILE_BYTES} bytes)")
+            out.write(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
+
+
 @app.post("/upload_file")
-async def upload_file(file: UploadFile = File(...)):
-    raw = await file.read()
+async def upload_file(file: UploadFile = File(...), background: bool = Query(False)):
+    """Stream an upload to a spool file in chunks, then ingest it in a worker thread.
+
+    Neither the raw upload nor the parsed table is held in memory, and the
+    event loop stays free while large files are parsed. Re-uploads of
+    identical content skip parsing and alias the stored table
+    (``parse_skipped`` in the meta). With ``background=true`` the ingest runs
+    as a job and the response carries its handle (poll ``/jobs/{job_id}``;
+    the result is the file meta).
+    """
+    spool = DATA_MEMORY.spool_path()
+    handed_off = False
     try:
-        meta = DATA_MEMORY.add_file(file.filename, raw)
+        size, content_hash = await _spool_upload(file, spool)
+        if background:
+            name = file.filename
+
+            def remove_spool():
+                if os.path.exists(spool):
+                    os.unlink(spool)
+
+            # the job removes the spool whatever its outcome, cancelled-while-queued included
+            job = JOBS.submit(
+                "upload_file",
+                lambda ctx: DATA_MEMORY.add_file_path(name, spool, size, content_hash),
+                args={"name": name, "size": size},
+                cleanup=remove_spool,
+            )
+            handed_off = True
+            return {"ok": True, "job": job.to_meta()}
+        meta = await asyncio.to_thread(DATA_MEMORY.add_file_path, file.filename, spool, size, content_hash)
         return {"ok": True, "file": meta}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    finally:
+        if not handed_off and os.path.exists(spool):
+            os.unlink(spool)
+
+
+@app.post("/data/{file_id}/append")
+async def append_file(file_id: str, file: UploadFile = File(...)):
+    """Append a batch of rows (same columns; CSV/TSV, Parquet or Arrow) to an uploaded table.
+
+    The batch becomes a new chunk of the table and the file version is
+    bumped. Stats, coordinate indexes and single-key sort permutations are
+    updated from the batch alone; cached queries, memoized tool results and
+    summaries derived from the old version are invalidated.
+    """
+    spool = DATA_MEMORY.spool_path()
+    try:
+        if file_id not in DATA_MEMORY.files:
+            raise KeyError(f"Unknown file_id: {file_id}")
+        size, _ = await _spool_upload(file, spool)
+        meta = await asyncio.to_thread(_append_rows, file_id, file.filename, spool, size)
+        return {"ok": True, "file": meta}
+    except KeyError as e:
+        return {"ok": False, "error": str(e).strip("'\"")}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        if os.path.exists(spool):
+            os.unlink(spool)
+
+
+def _append_rows(file_id: str, name: str, path: str, size: int) -> dict:
+    with _APPEND_LOCK:
+        old_key, n_old = DATA_MEMORY.source_key(file_id), DATA_MEMORY.files[file_id].n_rows
+        meta = DATA_MEMORY.append_file_path(file_id, path, name, size)
+        new_key = DATA_MEMORY.source_key(file_id)
+        meta["sort_permutations_kept"] = RANK_CACHE.extend(
+            old_key, new_key, n_old, lambda: DATA_MEMORY.appended_batch(file_id)
+        )
+        for prefix in [old_key, *(("summary", sid) for sid in meta["invalidated"])]:
+            PLAN_CACHE.invalidate(prefix)
+            RANK_CACHE.invalidate(prefix)
+            TOOL_MEMO.invalidate(prefix)
+    return meta
+
+
+@app.get("/data/{table_id}/export")
+def data_export(table_id: str, format: str = Query("csv")):
+    """Download a file or summary as CSV, Parquet or Arrow IPC.
+
+    Streams from the table's lazy plan (on-disk IPC, spill file or derivation)
+    through Polars' streaming sink, so exporting never materializes the table.
+    """
+    from fastapi.responses import StreamingResponse
+    fmt = (format or "csv").lower()
+    if fmt not in formats.EXPORT_FORMATS:
+        return JSONResponse({"error": f"Unsupported format '{format}'", "formats": list(formats.EXPORT_FORMATS)}, status_code=400)
+    try:
+        lf = DATA_MEMORY.lazy_table(table_id)
+    except KeyError as e:
+        return JSONResponse({"error": str(e).strip("'\"")}, status_code=404)
+    media_type, ext, _ = formats.EXPORT_FORMATS[fmt]
+    if table_id in DATA_MEMORY.files:
+        stem = os.path.splitext(DATA_MEMORY.files[table_id].name or table_id)[0]
+    else:
+        stem = f"{DATA_MEMORY.summaries[table_id].kind}-{table_id}"
+    return StreamingResponse(
+        formats.export_chunks(lf, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{stem}{ext}"'},
+    )
+
+
+@app.post("/tools/job_status")
+def t_job_status(args: JobStatus):
+    """Status, progress and (when done) result of a background job; optionally wait or cancel."""
+    try:
+        job = JOBS.cancel(args.job_id) if args.cancel else JOBS.get(args.job_id)
+        if not args.cancel and args.wait:
+            job.wait(max(0.0, min(args.wait, 60.0)))
+        return job.to_meta()
+    except KeyError as e:
+        return {"error": str(e).strip("'\"")}
+
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": JOBS.list()}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, wait: float = Query(0.0)):
+    return t_job_status(JobStatus(job_id=job_id, wait=wait))
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    return t_job_status(JobStatus(job_id=job_id, cancel=True))
+
 
 @app.post("/tools/data_list_files")
-def t_data_list_files():
-    return {"files": DATA_MEMORY.list_files()}
+def t_data_list_files(request: Request = None):
+    return _table_response(request, {}, "files", DATA_MEMORY.list_files())
 
 @app.post("/tools/data_info")
 def t_data_info(file_id: str = Body(..., embed=True), sample_rows: int = Body(5, embed=True)):
     try:
-        df = DATA_MEMORY.get_df(file_id)
+        rec = DATA_MEMORY.files.get(file_id)
+        if rec is None:
+            raise KeyError(f"Unknown file_id: {file_id}")
         sample_rows = max(1, min(sample_rows, 20))
-        sample = df.head(sample_rows).to_dicts()
-        dtypes = {c: str(dt) for c, dt in zip(df.columns, df.dtypes)}
+        lf = rec.lazy()
+        sample = lf.head(sample_rows).collect().to_dicts()
+        stats = rec.stats  # precomputed at ingest; None while the worker is still running
+        if stats:
+            dtypes = {c: info["dtype"] for c, info in stats["columns"].items()}
+        else:
+            dtypes = {c: str(dt) for c, dt in lf.collect_schema().items()}
         return {
             "file_id": file_id,
-            "n_rows": df.height,
-            "n_cols": df.width,
-            "columns": df.columns,
+            "n_rows": rec.n_rows,
+            "n_cols": len(rec.columns),
+            "columns": rec.columns,
             "dtypes": dtypes,
             "sample": sample,
+            "stats": stats["columns"] if stats else rec.stats_status(),
         }
     except Exception as e:
         return {"error": str(e)}
 
 @app.post("/tools/data_preview")
-def t_data_preview(file_id: str = Body(..., embed=True), n: int = Body(10, embed=True)):
+def t_data_preview(file_id: str = Body(..., embed=True), n: int = Body(10, embed=True), request: Request = None):
     try:
-        df = DATA_MEMORY.get_df(file_id)
         n = max(1, min(n, 100))
-        return {"file_id": file_id, "rows": df.head(n).to_dicts(), "columns": df.columns}
+        head = DATA_MEMORY.get_lazy(file_id).head(n).collect()
+        return _table_response(request, {"file_id": file_id, "columns": head.columns}, "rows", head)
     except Exception as e:
         return {"error": str(e)}
 
 @app.post("/tools/data_describe")
 def t_data_describe(file_id: str = Body(..., embed=True)):
     try:
-        df = DATA_MEMORY.get_df(file_id)
-        desc = df.describe()
-        meta = DATA_MEMORY.add_summary(file_id, "describe", desc, note="numeric describe")
+        if file_id not in DATA_MEMORY.files:
+            raise KeyError(f"Unknown file_id: {file_id}")
+        desc = _describe(file_id)
+        meta = DATA_MEMORY.add_derived(
+            file_id, "describe", lambda _: _describe(file_id), {"op": "describe"},
+            df=desc, note="numeric describe",
+        )
         return {"summary": meta, "rows": desc.to_dicts()}
     except Exception as e:
         return {"error": str(e)}
 
+
+def _describe(file_id: str) -> pl.DataFrame:
+    # Served from the ingest-time stats; waits only if the worker hasn't finished.
+    stats = DATA_MEMORY.files[file_id].wait_stats()
+    if stats:
+        return describe_frame(stats)
+    return COMPUTE.describe(DATA_MEMORY.get_lazy(file_id, prefer_disk=COMPUTE.process))
+
+def _table_response(request: Request | None, payload: dict, key: str, table: "pl.DataFrame | list[dict]"):
+    """Return ``payload`` with ``table`` under ``key``, encoded as the HTTP client asked.
+
+    Row dicts by default (and always for the chat dispatcher, which passes no
+    request); columnar JSON or an Arrow IPC stream when negotiated through
+    ``Accept`` (see ``tools/formats.py``).
+    """
+    records = isinstance(table, list)
+    fmt = formats.negotiate(request.headers.get("accept")) if isinstance(request, Request) else "rows"
+    if fmt == "rows":
+        payload[key] = table if records else table.to_dicts()
+        return payload
+    if fmt == "columnar":
+        payload[key] = formats.records_columnar(table) if records else formats.columnar(table)
+        return JSONResponse(jsonable_encoder(payload), media_type=formats.COLUMNAR_JSON)
+    import json as _json
+    body = formats.arrow_stream(formats.records_frame(table) if records else table)
+    meta = _json.dumps(jsonable_encoder(payload))
+    return Response(body, media_type=formats.ARROW_STREAM, headers={formats.META_HEADER: meta})
+
+
+def _body_default(value, default=None):
+    """Omitted params arrive as FastAPI ``Body`` markers when the chat dispatcher
+    calls an endpoint directly; map them to ``default``."""
+    from fastapi import params as _fastapi_params
+    return default if isinstance(value, _fastapi_params.Body) else value
+
+
 @app.post("/tools/data_select")
 def t_data_select(
     file_id: str = Body(..., embed=True),
     columns: list[str] | None = Body(None, embed=True),
     filters: list[dict] | None = Body(None, embed=True),
+    computed: list[dict] | None = Body(None, embed=True),
+    sort_by: str | None = Body(None, embed=True),
+    descending: bool = Body(False, embed=True),
     limit: int = Body(20, embed=True),
+    request: Request = None,
 ):
+    """Filter / project / compute over a lazy scan of the table.
+
+    The query is compiled once (``tools/query.py`` grammar) and cached by its
+    normalized form; Polars pushes the filter, projection and limit into the
+    scan so only referenced columns are read.
+    """
     try:
-        df = DATA_MEMORY.get_df(file_id)
-        if columns:
-            missing = [c for c in columns if c not in df.columns]
-            if missing:
-                return {"error": f"Unknown columns: {missing}"}
-            df = df.select(columns)
-        if filters:
-            exprs = []
-            for f in filters:
-                col = f.get("column")
-                op = f.get("op")
-                val = f.get("value")
-                if col not in df.columns:
-                    return {"error": f"Filter column not in dataframe: {col}"}
-                col_expr = pl.col(col)
-                if op == "==":
-                    exprs.append(col_expr == val)
-                elif op == "!=":
-                    exprs.append(col_expr != val)
-                elif op == ">":
-                    exprs.append(col_expr > val)
-                elif op == "<":
-                    exprs.append(col_expr < val)
-                elif op == ">=":
-                    exprs.append(col_expr >= val)
-                elif op == "<=":
-                    exprs.append(col_expr <= val)
-                else:
-                    return {"error": f"Unsupported op {op}"}
-            if exprs:
-                import functools, operator
-                combined = functools.reduce(operator.and_, exprs)
-                df = df.filter(combined)
-        limit = max(1, min(limit, 500))
-        subset = df.head(limit)
-        meta = DATA_MEMORY.add_summary(file_id, "select", subset, note="filtered/select preview")
-        return {"summary": meta, "preview_rows": subset.to_dicts()}
+        query = dict(
+            columns=_body_default(columns),
+            filters=_body_default(filters),
+            computed=_body_default(computed),
+            sort_by=_body_default(sort_by),
+            descending=bool(_body_default(descending, False)),
+            limit=max(1, min(_body_default(limit, 20), 500)),
+        )
+        subset = PLAN_CACHE.run(
+            DATA_MEMORY.source_key(file_id), DATA_MEMORY.get_lazy(file_id, prefer_disk=COMPUTE.process),
+            collect=COMPUTE.collect, **query,
+        )
+
+        def build(lazy_table):
+            lf = lazy_table(file_id)
+            return PLAN_CACHE.compiled(lf.collect_schema().names(), **query).apply(lf)
+
+        meta = DATA_MEMORY.add_derived(
+            file_id, "select", build, {"op": "select", **query}, df=subset, note="filtered/select preview",
+        )
+        return _table_response(request, {"summary": meta}, "preview_rows", subset)
     except Exception as e:
         return {"error": str(e)}
 
+def _sql_tables() -> tuple[dict[str, "pl.LazyFrame"], dict[str, str]]:
+    """Lazy tables for data_sql: every file and summary by id, files also by name stem.
+
+    Returns ``(tables, table_name -> file/summary id)``.
+    """
+    tables: dict[str, pl.LazyFrame] = {}
+    ids: dict[str, str] = {}
+    stems: dict[str, list[str]] = {}
+    for fid, rec in DATA_MEMORY.files.items():
+        tables[fid], ids[fid] = rec.lazy(), fid
+        stem = re.sub(r"\W+", "_", os.path.splitext(rec.name or "")[0]).strip("_").lower()
+        if stem and not stem[0].isdigit():
+            stems.setdefault(stem, []).append(fid)
+    for sid, rec in DATA_MEMORY.summaries.items():
+        tables[sid], ids[sid] = rec.lazy(), sid
+    for stem, fids in stems.items():
+        if len(fids) == 1 and stem not in tables:  # ambiguous names stay id-only
+            tables[stem], ids[stem] = tables[fids[0]], fids[0]
+    return tables, ids
+
+
+@app.post("/tools/data_sql")
+def t_data_sql(
+    query: str = Body(..., embed=True),
+    preview_rows: int = Body(20, embed=True),
+):
+    """Run one SQL SELECT over all uploaded files and summaries; store the result as a summary.
+
+    Tables are registered lazily (by id, and files also by their file-name
+    stem) so joins/aggregations stream from disk in a single tool call.
+    """
+    try:
+        preview_rows = max(1, min(_body_default(preview_rows, 20), 200))
+        tables, ids = _sql_tables()
+        result = sql_plan(tables, query).collect(engine="streaming")
+        # referenced table names in order of appearance (``alias.column`` refs don't count)
+        found = {t: m.start() for t in tables if (m := re.search(rf"(?<![.\w]){re.escape(t)}\b", query))}
+        names = sorted(found, key=found.get)
+        referenced = list(dict.fromkeys(ids[t] for t in names))
+        # lineage: first referenced upload, else first summary
+        source = next((t for t in referenced if t in DATA_MEMORY.files), None)
+        if source is None:
+            source = next((t for t in referenced if t in DATA_MEMORY.summaries), "sql")
+
+        def build(lazy_table):
+            return sql_plan({t: lazy_table(ids[t]) for t in names}, query)
+
+        meta = DATA_MEMORY.add_derived(
+            source, "sql", build, {"op": "sql", "query": query}, depends_on=referenced,
+            df=result, note=query[:500],
+        )
+        return {
+            "summary": meta,
+            "n_rows": result.height,
+            "columns": result.columns,
+            "preview_rows": result.head(preview_rows).to_dicts(),
+            "truncated": result.height > preview_rows,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
 @app.post("/tools/data_list_summaries")
-def t_data_list_summaries():
-    return {"summaries": DATA_MEMORY.list_summaries()}
+def t_data_list_summaries(request: Request = None):
+    return _table_response(request, {}, "summaries", DATA_MEMORY.list_summaries())
 
 
 @app.post("/tools/data_sample")
@@ -765,6 +1447,7 @@ def t_data_sample(
     n: int = Body(5, embed=True),
     seed: int | None = Body(None, embed=True),
     replace: bool = Body(False, embed=True),
+    request: Request = None,
 ):
     """Return a random sample of rows from a dataframe (without replacement by default).
 
@@ -781,28 +1464,169 @@ def t_data_sample(
             n = df.height
         # polars sample: shuffle=True ensures random order even when n==height
         sampled = df.sample(n=n, with_replacement=replace, shuffle=True, seed=seed)
-        return {
+        return _table_response(request, {
             "file_id": file_id,
             "requested": n,
             "returned": sampled.height,
             "with_replacement": replace,
             "seed": seed,
-            "rows": sampled.to_dicts(),
             "columns": sampled.columns,
-        }
+        }, "rows", sampled)
     except KeyError:
         return {"error": f"Unknown file_id {file_id}"}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/tools/data_nearby")
+def t_data_nearby(args: DataNearby):
+    """Rows of a table near a point (radius / k-nearest) or inside a box.
+
+    Backed by a grid index over the table's coordinate columns, built once per
+    table version; only the matching rows are gathered. Center defaults to the
+    current view position.
+    """
+    if not args.file_id and not args.summary_id:
+        return {"error": "Must provide file_id or summary_id"}
+    try:
+        table_id = args.summary_id or args.file_id
+        grid = DATA_MEMORY.spatial_index(table_id, args.center_columns)
+        center = [args.center.x, args.center.y, args.center.z] if args.center else _view_center(CURRENT_STATE)
+        center = center[: grid.dim]
+        scale = _axis_scale(CURRENT_STATE, args.units)
+        scale = scale[: grid.dim] if scale else None
+        idx, dist = _spatial_lookup(grid, args, center, scale)
+        limit = max(1, min(args.limit, 1000))
+        df = DATA_MEMORY.get_summary_df(table_id) if args.summary_id else DATA_MEMORY.get_df(table_id)
+        if args.columns:
+            missing = [c for c in args.columns if c not in df.columns]
+            if missing:
+                return {"error": f"Unknown columns: {missing}", "available_columns": df.columns}
+            df = df.select(args.columns)
+        rows = df[idx[:limit]]
+        if dist is not None:
+            rows = rows.with_columns(pl.Series("distance", dist[:limit]).round(4))
+        return {
+            "table_id": table_id,
+            "mode": args.mode,
+            "center": center,
+            "units": args.units,
+            "count": int(len(idx)),
+            "truncated": len(idx) > limit,
+            "rows": rows.to_dicts(),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/tools/data_in_view")
+def t_data_in_view(args: DataInView):
+    """Cells inside the current Neuroglancer field of view, at a zoom-appropriate level of detail.
+
+    A count pyramid over the coordinate columns bounds the number of points
+    in view by summing at most ``max_bins`` cells. If that fits in
+    ``max_points`` the rows themselves are returned (grid-index bbox);
+    otherwise the non-empty cells of that level (density), as columnar
+    ``bins`` (cell ``lower`` corners and ``count``, densest first; each cell
+    spans ``cell_size``). Either way the cost is bounded, even when the view
+    covers the whole dataset.
+    """
+    if not args.file_id and not args.summary_id:
+        return {"error": "Must provide file_id or summary_id"}
+    try:
+        table_id = args.summary_id or args.file_id
+        pyramid = DATA_MEMORY.count_pyramid(table_id, args.center_columns)
+        lower, upper = _view_box(CURRENT_STATE, args.viewport, args.depth)
+        lower, upper = lower[: pyramid.dim], upper[: pyramid.dim]
+        max_bins = max(1, min(args.max_bins, 4096))
+        level = pyramid.level_for(lower, upper, max_bins)
+        corners, counts = pyramid.cells(lower, upper, level)
+        view = {"lower": lower, "upper": upper, "layout": CURRENT_STATE.as_dict().get("layout")}
+        if int(counts.sum()) <= max(0, min(args.max_points, 1000)):
+            idx = DATA_MEMORY.spatial_index(table_id, args.center_columns).bbox(lower, upper)
+            df = DATA_MEMORY.get_summary_df(table_id) if args.summary_id else DATA_MEMORY.get_df(table_id)
+            if args.columns:
+                missing = [c for c in args.columns if c not in df.columns]
+                if missing:
+                    return {"error": f"Unknown columns: {missing}", "available_columns": df.columns}
+                df = df.select(args.columns)
+            return {"table_id": table_id, "mode": "points", "view": view, "count": int(len(idx)), "rows": df[idx].to_dicts()}
+        order = (-counts).argsort(kind="stable")
+        size = pyramid.cell_size(level)
+        return {
+            "table_id": table_id,
+            "mode": "density",
+            "view": view,
+            "level": level,
+            "cell_size": size,
+            "approx_count": int(counts.sum()),  # cells overlapping the view edge count fully
+            "bins": {"lower": corners[order].tolist(), "count": counts[order].tolist()},
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _spatial_join_frame(args: DataSpatialJoin) -> pl.DataFrame:
+    right_columns = args.right_columns or args.left_columns
+    if len(right_columns) != len(args.left_columns):
+        raise ValueError("left_columns and right_columns must have the same length")
+    if not args.tolerance > 0:
+        raise ValueError("tolerance must be positive")
+    jobs.report(0.05, "indexing tables")
+    left_grid = DATA_MEMORY.spatial_index(args.left_id, args.left_columns)
+    right_grid = DATA_MEMORY.spatial_index(args.right_id, right_columns)
+    jobs.report(0.3, "matching points")
+    li, ri, dist = match_points(left_grid.points, right_grid.points, args.tolerance, args.mode, right_index=right_grid)
+    jobs.report(0.8, f"assembling {len(li)} matches")
+    left_df = DATA_MEMORY.get_table_df(args.left_id)
+    right_df = DATA_MEMORY.get_table_df(args.right_id)
+    right_df = right_df.rename({c: c + args.suffix for c in right_df.columns if c in left_df.columns})
+    if args.how == "left":
+        idx = pl.Series([None] * left_df.height, dtype=pl.Int64).scatter(li, ri)
+        dist = pl.Series("distance", [None] * left_df.height, dtype=pl.Float64).scatter(li, dist)
+        out = pl.concat([left_df, right_df.select(pl.all().gather(idx))], how="horizontal")
+        return out.with_columns(dist)
+    out = pl.concat([left_df[li], right_df[ri]], how="horizontal")
+    return out.with_columns(pl.Series("distance", dist))
+
+
+@app.post("/tools/data_spatial_join")
+def t_data_spatial_join(args: DataSpatialJoin):
+    """Match rows of two tables by nearest coordinates within a tolerance; store the result as a summary.
+
+    Uses the cached grid indexes of both tables (``tools/spatial.match_points``):
+    ``many_to_one`` takes each left row's nearest right row, ``one_to_one``
+    pairs mutual nearest neighbours so every right row is used at most once.
+    """
+    try:
+        result = _spatial_join_frame(args)
+        meta = DATA_MEMORY.add_derived(
+            args.left_id, "spatial_join", lambda _: _spatial_join_frame(args),
+            {"op": "spatial_join", **args.model_dump(exclude={"preview_rows"})},
+            depends_on=[args.left_id, args.right_id], df=result,
+            note=f"{args.mode} match within {args.tolerance}",
+        )
+        preview_rows = max(1, min(args.preview_rows, 200))
+        matched = result.height if args.how == "inner" else int(result["distance"].is_not_null().sum())
+        return {
+            "summary": meta,
+            "n_matched": matched,
+            "n_left": DATA_MEMORY.get_table_df(args.left_id).height,
+            "n_right": DATA_MEMORY.get_table_df(args.right_id).height,
+            "preview_rows": result.head(preview_rows).to_dicts(),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
 @app.post("/tools/data_ng_views_table")
 def t_data_ng_views_table(
     file_id: str | None = Body(None, embed=True),
     summary_id: str | None = Body(None, embed=True),
-    sort_by: str | None = Body(None, embed=True),
-    descending: bool = Body(True, embed=True),
+    sort_by: str | list[str] | None = Body(None, embed=True),
+    descending: bool | list[bool] = Body(True, embed=True),
     top_n: int = Body(5, embed=True),
+    group_by: str | list[str] | None = Body(None, embed=True),
     id_column: str = Body("cell_id", embed=True),
     center_columns: list[str] = Body(["x","y","z"], embed=True),
     include_columns: list[str] | None = Body(None, embed=True),
@@ -846,6 +1670,8 @@ def t_data_ng_views_table(
         descending = True
     if isinstance(top_n, _fastapi_params.Body):
         top_n = 5
+    if isinstance(group_by, _fastapi_params.Body):
+        group_by = None
     if isinstance(annotations, _fastapi_params.Body):
         annotations = False
     if DEBUG_ENABLED:
@@ -872,12 +1698,22 @@ def t_data_ng_views_table(
         missing = [c for c in cols_needed if c not in df.columns]
         if missing:
             return {"error": f"Missing required columns: {missing}"}
-        work_df = df
-        if sort_by:
-            if sort_by not in df.columns:
-                return {"error": f"sort_by column '{sort_by}' not found", "available_columns": df.columns}
-            work_df = df.sort(sort_by, descending=descending)
-        subset = work_df.head(top_n)
+        source_key = DATA_MEMORY.source_key(summary_id or file_id)  # type: ignore[arg-type]
+        try:
+            # ranking reuses the in-process sort-permutation cache, so it holds a slot rather than shipping work
+            with COMPUTE.slot():
+                if sort_by:
+                    subset = RANK_CACHE.top_k(source_key, df, top_n, sort_by, descending, group_by=group_by)
+                elif group_by:
+                    groups = [group_by] if isinstance(group_by, str) else list(group_by)
+                    subset = df.group_by(groups, maintain_order=True).head(top_n)
+                else:
+                    subset = df.head(top_n)
+        except (ValueError, pl.exceptions.ColumnNotFoundError) as e:
+            return {"error": str(e), "available_columns": df.columns}
+        if subset.height > 50:
+            warnings.append(f"{subset.height} ranked rows across groups; showing the first 50")
+            subset = subset.head(50)
         if DEBUG_ENABLED:
             _dbg(f"views_table subset height={subset.height} top_n={top_n} sort_by={sort_by} descending={descending}")
             if subset.height:
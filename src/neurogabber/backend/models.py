@@ -30,6 +30,77 @@ class AddAnnotations(BaseModel):
     items: List[Annotation]
 
 
+class DeleteAnnotations(BaseModel):
+    layer: str
+    ids: List[str]
+
+
+class AnnotationsQuery(BaseModel):
+    layer: str
+    mode: Literal["radius","knn","bbox"] = "radius"
+    center: Optional[Vec3] = None # defaults to current view position
+    radius: Optional[float] = None # radius mode; bbox half-width when lower/upper omitted
+    k: int = 10
+    lower: Optional[Vec3] = None # bbox corners
+    upper: Optional[Vec3] = None
+    units: Literal["voxel","um","nm"] = "voxel" # units of radius (coordinates stay in voxels)
+    limit: int = 20 # matches returned; keep small, tool output is cut at ~4000 chars
+
+
+class DataNearby(BaseModel):
+    file_id: Optional[str] = None
+    summary_id: Optional[str] = None
+    mode: Literal["radius","knn","bbox"] = "knn"
+    center: Optional[Vec3] = None # defaults to current view position
+    radius: Optional[float] = None # radius mode; bbox half-width when lower/upper omitted
+    k: int = 10
+    lower: Optional[Vec3] = None # bbox corners
+    upper: Optional[Vec3] = None
+    units: Literal["voxel","um","nm"] = "voxel"
+    center_columns: List[str] = ["x", "y", "z"]
+    columns: Optional[List[str]] = None # returned columns (default: all)
+    limit: int = 20 # rows returned; keep small, tool output is cut at ~4000 chars
+
+
+class DataInView(BaseModel):
+    file_id: Optional[str] = None
+    summary_id: Optional[str] = None
+    center_columns: List[str] = ["x", "y", "z"]
+    viewport: List[int] = [1024, 1024] # viewer size in screen pixels (width, height)
+    depth: float = 10 # slab thickness (voxels) around the slice for 2D layouts
+    max_points: int = 25 # return rows when at most this many can be in view
+    max_bins: int = 48 # otherwise density cells, at the finest level with <= this many
+    columns: Optional[List[str]] = None # returned columns in points mode (default: all)
+
+
+class DataSpatialJoin(BaseModel):
+    left_id: str # file_id or summary_id
+    right_id: str
+    tolerance: float # max match distance, in coordinate units
+    left_columns: List[str] = ["x", "y", "z"]
+    right_columns: Optional[List[str]] = None # defaults to left_columns
+    mode: Literal["one_to_one","many_to_one"] = "one_to_one"
+    how: Literal["inner","left"] = "inner" # left keeps unmatched left rows (null right side)
+    suffix: str = "_right" # appended to right column names that clash
+    preview_rows: int = 20
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    wait: float = 0 # seconds to block for completion (max 60)
+    cancel: bool = False
+
+
+class AnnotationsFromTable(BaseModel):
+    layer: str
+    file_id: Optional[str] = None
+    summary_id: Optional[str] = None
+    center_columns: List[str] = ["x", "y", "z"]
+    id_column: Optional[str] = None
+    property_columns: Optional[List[str]] = None
+    limit: int = 1000 # max annotations per spatial chunk
+
+
 class HistogramReq(BaseModel):
     layer: str
     roi: Optional[dict] = None # {bbox: [x0,y0,z0,x1,y1,z1]} or similar
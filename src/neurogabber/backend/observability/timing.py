@@ -8,13 +8,18 @@ Captures detailed timing information at key steps in the agent execution flow:
 - Tool executions
 - Response assembly
 
+JSON-pointer loads (state links resolved from s3/gs/http) are recorded
+separately with their time-to-ready and, in timing mode, peak Python memory.
+
 Outputs JSONL format for easy analysis. Enable with TIMING_MODE=true env var.
 """
 
 import asyncio
 import json
 import os
+import threading
 import time
+import tracemalloc
 import uuid
 from collections import deque
 from contextlib import contextmanager
@@ -31,6 +36,12 @@ TIMING_VERBOSE = os.getenv("TIMING_VERBOSE", "false").lower() == "true"
 # In-memory store for recent timing records (for /debug/timing endpoint)
 MAX_RECENT_RECORDS = 100
 _recent_records: Deque[Dict[str, Any]] = deque(maxlen=MAX_RECENT_RECORDS)
+_recent_pointer_loads: Deque[Dict[str, Any]] = deque(maxlen=MAX_RECENT_RECORDS)
+
+# Memory-traced pointer loads in flight (tracemalloc has one process-wide peak).
+_traced_lock = threading.Lock()
+_traced_loads: Dict[int, bool] = {}  # id(timing) -> overlapped another traced load
+_started_tracing = False
 
 
 @dataclass
@@ -42,6 +53,19 @@ class ToolTiming:
     duration: float
     args_size_bytes: int = 0
     result_size_bytes: int = 0
+    cache: Optional[str] = None  # "hit" / "miss" for memoized tools
+
+
+@dataclass
+class PointerLoadTiming:
+    """Time-to-ready and memory for one JSON-pointer resolution."""
+    url: str
+    duration: float = 0.0
+    source: str = ""  # cache | revalidated | coalesced | network | custom
+    size_bytes: int = 0
+    peak_memory_bytes: Optional[int] = None
+    error: Optional[str] = None
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
 
 
 @dataclass
@@ -146,6 +170,8 @@ class TimingRecord:
             for it in self.iterations if it.llm_call
         )
         
+        cache_states = [tool.cache for it in self.iterations for tool in it.tools]
+        
         overhead = self.total_duration - llm_duration - tool_duration
         
         self.summary = {
@@ -159,6 +185,8 @@ class TimingRecord:
             "num_iterations": len(self.iterations),
             "num_tools_called": sum(len(it.tools) for it in self.iterations),
             "total_tokens": total_tokens,
+            "memo_hits": cache_states.count("hit"),
+            "memo_misses": cache_states.count("miss"),
         }
 
 
@@ -185,6 +213,7 @@ class TimingCollector:
             with collector.tool_execution(iteration, "ng_set_view") as tool:
                 # ... execute tool
                 tool.set_sizes(args=256, result=128)
+                tool.set_cache("hit")  # memoized tools only
         
         collector.end_agent_loop()
         
@@ -311,10 +340,14 @@ class TimingCollector:
                 self.tool_name = tool_name
                 self.args_size = 0
                 self.result_size = 0
+                self.cache = None
             
             def set_sizes(self, args: int, result: int):
                 self.args_size = args
                 self.result_size = result
+            
+            def set_cache(self, status: Optional[str]):
+                self.cache = status
         
         ctx = ToolContext(self, iteration, start, tool_name)
         
@@ -329,7 +362,8 @@ class TimingCollector:
                 end=end,
                 duration=duration,
                 args_size_bytes=ctx.args_size,
-                result_size_bytes=ctx.result_size
+                result_size_bytes=ctx.result_size,
+                cache=ctx.cache,
             )
             iteration.tools.append(tool_timing)
     
@@ -366,6 +400,88 @@ def _write_timing_record(record: Dict[str, Any]):
         print(f"[TIMING] Error writing timing record: {e}")
 
 
+@contextmanager
+def pointer_load(url: str, trace_memory: Optional[bool] = None):
+    """Time a pointer load (fetch + parse); yields a ``PointerLoadTiming`` to fill in.
+
+    With ``trace_memory`` (default: ``TIMING_MODE``) the peak traced Python
+    allocation during the load is captured via ``tracemalloc``. Tracing slows
+    allocation, so it is off unless timing mode is on. tracemalloc keeps a
+    single process-wide peak, so it is only reset when no other traced load is
+    running, and a load that overlapped another records
+    ``peak_memory_bytes = None`` rather than a figure that mixes both.
+    """
+    if trace_memory is None:
+        trace_memory = TIMING_MODE
+    timing = PointerLoadTiming(url=url)
+    if trace_memory:
+        baseline = _begin_traced_load(timing)
+    start = time.perf_counter()
+    try:
+        yield timing
+    except Exception as e:
+        timing.error = str(e)[:200]
+        raise
+    finally:
+        timing.duration = time.perf_counter() - start
+        if trace_memory:
+            timing.peak_memory_bytes = _end_traced_load(timing, baseline)
+        _recent_pointer_loads.append(asdict(timing))
+        if TIMING_VERBOSE:
+            print(f"[TIMING] Pointer load {timing.source or 'failed'}: {timing.duration:.3f}s, {timing.size_bytes} bytes")
+
+
+def _begin_traced_load(timing: "PointerLoadTiming") -> int:
+    global _started_tracing
+    with _traced_lock:
+        if _traced_loads:
+            for key in _traced_loads:
+                _traced_loads[key] = True
+            _traced_loads[id(timing)] = True
+            return 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _traced_loads[id(timing)] = False
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _end_traced_load(timing: "PointerLoadTiming", baseline: int) -> Optional[int]:
+    global _started_tracing
+    with _traced_lock:
+        overlapped = _traced_loads.pop(id(timing), True)
+        peak = None if overlapped else max(0, tracemalloc.get_traced_memory()[1] - baseline)
+        if not _traced_loads and _started_tracing:
+            tracemalloc.stop()  # only once no traced load is left
+            _started_tracing = False
+        return peak
+
+
+def get_pointer_load_stats() -> Dict[str, Any]:
+    """Summary of recent pointer loads (durations, sources, sizes, peak memory)."""
+    loads = list(_recent_pointer_loads)
+    if not loads:
+        return {"count": 0}
+    durations = sorted(r["duration"] for r in loads)
+    peaks = [r["peak_memory_bytes"] for r in loads if r["peak_memory_bytes"] is not None]
+    sources: Dict[str, int] = {}
+    for r in loads:
+        key = r["source"] if not r["error"] else "error"
+        sources[key] = sources.get(key, 0) + 1
+    return {
+        "count": len(loads),
+        "duration": {
+            "p50": round(durations[len(durations) // 2], 4),
+            "max": round(durations[-1], 4),
+        },
+        "sources": sources,
+        "max_size_bytes": max(r["size_bytes"] for r in loads),
+        "max_peak_memory_bytes": max(peaks) if peaks else None,
+        "recent": loads[-20:],
+    }
+
+
 def get_recent_records(n: Optional[int] = None) -> List[Dict[str, Any]]:
     """Get the N most recent timing records. If n is None, return all."""
     if n is None:
@@ -418,6 +534,10 @@ def get_timing_stats() -> Dict[str, Any]:
             "p50": round(percentile(tool_durations, 50), 3),
             "p95": round(percentile(tool_durations, 95), 3),
         },
+        "tool_memo": {
+            "hits": sum(r["summary"].get("memo_hits", 0) for r in records),
+            "misses": sum(r["summary"].get("memo_misses", 0) for r in records),
+        },
         "recent_requests": [
             {
                 "request_id": r["request_id"][:8],
@@ -1,74 +1,511 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
 import uuid
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
 
 import polars as pl
 
-MAX_FILE_BYTES = 20 * 1024 * 1024  # 20 MB cap
+from ..jobs import report as report_progress
+from ..tools.dtypes import describe_changes, narrow_dtypes
+from ..tools.spatial import CountPyramid, GridIndex
+from .spill import MemoryBudget
+from .stats import column_stats, merge_stats
 
+MAX_FILE_BYTES = int(os.getenv("NEUROGABBER_MAX_UPLOAD_BYTES", str(8 * 1024**3)))  # 8 GiB cap
+# Uploaded tables are stored here as uncompressed Arrow IPC (scan-able, memory-mappable).
+DATA_DIR = os.getenv("NEUROGABBER_DATA_DIR", os.path.join(tempfile.gettempdir(), "neurogabber", "data"))
+# Resident budget for uploaded tables + summaries; colder frames are spilled/unmapped.
+DATA_MEMORY_BYTES = int(os.getenv("NEUROGABBER_DATA_MEMORY_BYTES", str(1024**3)))
+# Downcast numeric columns / dictionary-encode repeated strings at ingest (see tools.dtypes).
+OPTIMIZE_DTYPES = os.getenv("NEUROGABBER_OPTIMIZE_DTYPES", "true").lower() == "true"
 
-class UploadedFileRecord:
-    def __init__(self, file_id: str, name: str, size: int, df: pl.DataFrame):
+# Identical uploads (same content hash and format) become aliases of the first copy.
+DEDUPE_UPLOADS = os.getenv("NEUROGABBER_DEDUPE_UPLOADS", "true").lower() == "true"
+
+# Upload formats, by extension (magic bytes take precedence, see detect_format).
+FORMAT_EXTENSIONS = {
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "ipc",
+    ".ipc": "ipc",
+    ".feather": "ipc",
+    ".arrows": "ipc_stream",
+}
+
+# Column statistics are computed off the request path, one table at a time.
+_STATS_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neurogabber-stats")
+
+
+def content_hasher():
+    """Streaming hash used to fingerprint uploads (feed it chunks with ``update``)."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def file_digest(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    h = content_hasher()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(chunk_bytes):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def detect_format(path: str, name: str = "") -> str:
+    """Identify an upload as csv / tsv / parquet / ipc / ipc_stream.
+
+    Binary formats are recognized by their magic bytes regardless of the file
+    name; text falls back to the extension (default csv).
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(8)
+    if head[:4] == b"PAR1":
+        return "parquet"
+    if head[:6] == b"ARROW1":  # Arrow IPC file == Feather v2
+        return "ipc"
+    if head[:4] == b"\xff\xff\xff\xff":  # IPC stream continuation marker
+        return "ipc_stream"
+    if head[:4] == b"FEA1":
+        raise ValueError("Feather v1 files are not supported; re-save as Feather v2 / Arrow IPC")
+    fmt = FORMAT_EXTENSIONS.get(Path(name or path).suffix.lower(), "csv")
+    if fmt not in ("csv", "tsv"):
+        raise ValueError(f"File '{name}' has a {fmt} extension but not a valid {fmt} header")
+    return fmt
+
+
+class _TableRecord:
+    """Table held in memory, in an Arrow IPC file at ``path``, or both.
+
+    Disk-backed tables are memory-mapped on first ``df`` access and can be
+    released again (see ``MemoryBudget``); ``lazy()`` scans the file without
+    loading it. Derived tables may instead carry a ``_rebuild`` callable that
+    re-plans them from their sources, so releasing them just drops the frame.
+    Shape/columns are captured up front so metadata never needs the data.
+    """
+
+    path: Optional[str]
+    _spill_path: Optional[str] = None
+    _rebuild: Optional[Callable[[], Union[pl.LazyFrame, pl.DataFrame]]] = None
+    version: int = 0  # bumped when the table's contents change
+
+    def _init_table(self, df: Optional[pl.DataFrame], path: Optional[str]):
+        if df is None and path is None:
+            raise ValueError(f"{type(self).__name__} needs a df or a path")
+        self.path = path
+        self._df = df
+        if df is not None:
+            self.columns = df.columns
+            self.n_rows = df.height
+        else:
+            lf = pl.scan_ipc(path)
+            self.columns = lf.collect_schema().names()
+            self.n_rows = lf.select(pl.len()).collect().item()
+
+    @property
+    def df(self) -> pl.DataFrame:
+        if self._df is None:
+            if self.path is None and self._rebuild is not None:
+                out = self._rebuild()
+                self._df = out.collect() if isinstance(out, pl.LazyFrame) else out
+                self.columns, self.n_rows = self._df.columns, self._df.height
+            else:
+                # memory-mapped for uncompressed IPC; appended chunks stay separate Arrow chunks
+                frames = [pl.read_ipc(p) for p in self._paths()]
+                self._df = frames[0] if len(frames) == 1 else pl.concat(frames, rechunk=False)
+        return self._df
+
+    def _paths(self) -> List[str]:
+        """IPC files holding the table, in row order."""
+        return [self.path]
+
+    def lazy(self, prefer_disk: bool = False) -> pl.LazyFrame:
+        """Lazy view of the table; ``prefer_disk`` scans the IPC file even when
+        the frame is resident (a path-only plan, cheap to ship to another process)."""
+        if prefer_disk and self.path is not None:
+            return pl.scan_ipc(self._paths())
+        if self._df is None:
+            if self.path is None and self._rebuild is not None:
+                return self._rebuild().lazy()  # composes with the caller's query
+            return pl.scan_ipc(self._paths())
+        return self._df.lazy()
+
+    def resident_bytes(self) -> int:
+        return 0 if self._df is None else int(self._df.estimated_size())
+
+    def release(self) -> None:
+        """Drop the in-memory frame, writing it to ``_spill_path`` first if unbacked."""
+        if self._df is None:
+            return
+        if self.path is None and self._rebuild is None:
+            if self._spill_path is None:
+                return  # nowhere to spill; keep resident
+            self._df.write_ipc(self._spill_path, compression="uncompressed")
+            self.path = self._spill_path
+        self._df = None
+
+
+class UploadedFileRecord(_TableRecord):
+    """An uploaded table (usually backed by the Arrow IPC file written at ingest).
+
+    Rows appended later (``DataMemory.append_file_path``) live in one extra
+    IPC file per batch, ``chunk_paths``, read after ``path``.
+    """
+
+    def __init__(self, file_id: str, name: str, size: int, df: pl.DataFrame | None = None,
+                 path: str | None = None, format: str = "csv"):
         self.file_id = file_id
         self.name = name
         self.size = size
-        self.df = df
+        self.format = format
+        self._stats: Optional[Future] = None
+        # Arrow sizes before/after the ingest dtype pass, and what it changed
+        self.original_bytes: Optional[int] = None
+        self.optimized_bytes: Optional[int] = None
+        self.dtype_changes: Dict[str, str] = {}
+        self.content_hash: Optional[str] = None
+        # Set on aliases of an identical earlier upload: they share its IPC file,
+        # its stats and (while it is unchanged) its resident frame.
+        self.alias_of: Optional[UploadedFileRecord] = None
+        self.chunk_paths: List[str] = []
+        self._init_table(df, path)
+
+    def _paths(self) -> List[str]:
+        return [self.path, *self.chunk_paths]
+
+    def _shared_source(self) -> Optional["UploadedFileRecord"]:
+        src = self.alias_of
+        if src is not None and src.path is not None and src._paths() == self._paths():
+            return src
+        return None
+
+    @property
+    def df(self) -> pl.DataFrame:
+        src = self._shared_source()
+        if self._df is None and src is not None and src._df is not None:
+            self._df = src._df  # same immutable Arrow buffers
+        return super().df
+
+    def resident_bytes(self) -> int:
+        src = self._shared_source()
+        if src is not None and self._df is not None and self._df is src._df:
+            return 0  # counted once, on the source record
+        return super().resident_bytes()
+
+    def compute_stats_async(self) -> Future:
+        """Schedule per-column statistics on the background stats worker."""
+        lf = self.lazy()
+        self._stats = _STATS_EXECUTOR.submit(column_stats, lf)
+        return self._stats
+
+    @property
+    def stats(self) -> Optional[dict]:
+        """Precomputed column statistics, or None while pending / on failure."""
+        if self._stats is None or not self._stats.done() or self._stats.exception() is not None:
+            return None
+        return self._stats.result()
+
+    def wait_stats(self, timeout: float | None = None) -> Optional[dict]:
+        """Block (up to ``timeout`` s) for the stats; scheduled now if never started.
+
+        Returns None on timeout or if the computation failed.
+        """
+        if self._stats is None:
+            self.compute_stats_async()
+        try:
+            return self._stats.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def stats_status(self) -> str:
+        if self._stats is None:
+            return "none"
+        if not self._stats.done():
+            return "pending"
+        return "error" if self._stats.exception() is not None else "ready"
 
     def to_meta(self) -> dict:
         return {
             "file_id": self.file_id,
             "name": self.name,
             "size": self.size,
-            "n_rows": self.df.height,
-            "n_cols": self.df.width,
-            "columns": self.df.columns,
+            "format": self.format,
+            "n_rows": self.n_rows,
+            "n_cols": len(self.columns),
+            "columns": self.columns,
+            "stats": self.stats_status(),
+            "original_bytes": self.original_bytes,
+            "optimized_bytes": self.optimized_bytes,
+            "dtype_changes": self.dtype_changes,
+            "content_hash": self.content_hash,
+            "alias_of": self.alias_of.file_id if self.alias_of is not None else None,
         }
 
 
-class SummaryRecord:
+class SummaryRecord(_TableRecord):
+    """A derived table.
+
+    Either materialized (``df``, spilled to ``spill_path`` under memory
+    pressure) or lazy: ``plan`` is the JSON spec it was built from and
+    ``rebuild`` re-plans it over the current ``depends_on`` tables, so the
+    frame is only a cache. ``n_rows`` is None until a lazy summary is read.
+    """
+
     def __init__(
         self,
         summary_id: str,
         source_file_id: str,
         kind: str,
-        df: pl.DataFrame,
+        df: pl.DataFrame | None,
         note: Optional[str] = None,
+        spill_path: Optional[str] = None,
+        plan: Optional[dict] = None,
+        depends_on: Optional[List[str]] = None,
+        rebuild: Optional[Callable[[], Union[pl.LazyFrame, pl.DataFrame]]] = None,
     ):
         self.summary_id = summary_id
         self.source_file_id = source_file_id
         self.kind = kind
-        self.df = df
         self.note = note
+        self.plan = plan
+        self.depends_on = list(depends_on or [])
+        self.stale = False  # materialized-only summary whose sources changed
+        self._spill_path = spill_path
+        self._rebuild = rebuild
+        if df is None and rebuild is not None:
+            self.path, self._df = None, None
+            self.columns = rebuild().lazy().collect_schema().names()
+            self.n_rows = None
+        else:
+            self._init_table(df, None)
 
     def to_meta(self) -> dict:
         return {
             "summary_id": self.summary_id,
             "source_file_id": self.source_file_id,
             "kind": self.kind,
-            "n_rows": self.df.height,
-            "n_cols": self.df.width,
-            "columns": self.df.columns,
+            "n_rows": self.n_rows,
+            "n_cols": len(self.columns),
+            "columns": self.columns,
             "note": self.note,
+            "lazy": self._rebuild is not None,
+            "materialized": self._df is not None or self.path is not None,
+            "depends_on": self.depends_on,
+            "plan": self.plan,
+            "stale": self.stale,
         }
 
 
 class DataMemory:
-    """Ephemeral session-scoped data store for uploaded CSVs & derived summaries."""
+    """Ephemeral session-scoped data store for uploaded CSVs & derived summaries.
+
+    Uploads are converted to Arrow IPC files under ``data_dir`` with a streaming
+    (out-of-core) CSV scan, so ingesting a file never needs it all in RAM.
+    Resident frames (files and summaries) are kept under ``memory_budget``
+    bytes: least recently used ones are spilled to IPC / unmapped and reload
+    memory-mapped on next access. Listing works from metadata alone.
 
-    def __init__(self):
+    Summaries produced by queries are lazy derivations (``add_derived``):
+    evicting them costs nothing and ``depends_on`` forms the lineage graph
+    used by ``invalidate`` / ``refresh_summary``.
+    """
+
+    def __init__(self, data_dir: str | None = None, memory_budget: int | None = None):
         self.files: Dict[str, UploadedFileRecord] = {}
         self.summaries: Dict[str, SummaryRecord] = {}
+        self.data_dir = Path(data_dir or DATA_DIR) / uuid.uuid4().hex[:8]
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.budget = MemoryBudget(DATA_MEMORY_BYTES if memory_budget is None else memory_budget)
+        # (index type, table_id, coordinate columns) -> (source_key, index)
+        self._spatial: Dict[tuple, tuple] = {}
+        self._spatial_lock = threading.Lock()
+        # (content hash, format) -> file_id of the upload that was parsed
+        self._by_content: Dict[tuple, str] = {}
+        self._append_lock = threading.Lock()
+
+    def spool_path(self) -> str:
+        """Fresh path inside ``data_dir`` for streaming an upload to disk."""
+        return str(self.data_dir / f"upload-{uuid.uuid4().hex}.part")
 
     def add_file(self, name: str, raw: bytes) -> dict:
         if len(raw) > MAX_FILE_BYTES:
             raise ValueError(f"File too large ({len(raw)} bytes > {MAX_FILE_BYTES})")
+        spool = self.spool_path()
         try:
-            df = pl.read_csv(raw)
-        except Exception as e:  # pragma: no cover - defensive
-            raise ValueError(f"Failed to parse CSV: {e}") from e
+            with open(spool, "wb") as fh:
+                fh.write(raw)
+            return self.add_file_path(name, spool, len(raw))
+        finally:
+            if os.path.exists(spool):
+                os.unlink(spool)
+
+    def add_file_path(self, name: str, path: str, size: int | None = None, content_hash: str | None = None) -> dict:
+        """Ingest a CSV/TSV, Parquet or Arrow IPC/Feather file already on disk.
+
+        Blocking; call from a worker thread in async code. The source file is
+        left in place for the caller to remove. ``content_hash`` is the
+        ``content_hasher`` digest if the caller computed it while streaming;
+        content identical to an earlier upload is not parsed again but stored
+        as an alias of it (meta has ``parse_skipped: true``).
+        """
+        size = os.path.getsize(path) if size is None else size
+        if size > MAX_FILE_BYTES:
+            raise ValueError(f"File too large ({size} bytes > {MAX_FILE_BYTES})")
+        fmt = detect_format(path, name)
+        if DEDUPE_UPLOADS:
+            content_hash = content_hash or file_digest(path)
+            source = self.files.get(self._by_content.get((content_hash, fmt), ""))
+            if source is not None and source.path is not None and os.path.exists(source.path):
+                return {**self._add_alias(source, name, size).to_meta(), "parse_skipped": True}
         fid = uuid.uuid4().hex[:8]
-        rec = UploadedFileRecord(fid, name, len(raw), df)
+        out = self.data_dir / f"{fid}.arrow"
+        try:
+            report_progress(0.05, f"parsing {fmt}")
+            _write_ipc(fmt, path, out)
+            original_bytes = out.stat().st_size
+            report_progress(0.6, "optimizing dtypes")
+            changes = _optimize_ipc(out) if OPTIMIZE_DTYPES else {}
+            rec = UploadedFileRecord(fid, name, size, path=str(out), format=fmt)
+            rec.original_bytes, rec.optimized_bytes = original_bytes, out.stat().st_size
+            rec.dtype_changes = changes
+            rec.content_hash = content_hash
+        except Exception as e:
+            out.unlink(missing_ok=True)
+            raise ValueError(f"Failed to parse {fmt.upper()}: {e}") from e
         self.files[fid] = rec
-        return rec.to_meta()
+        if content_hash is not None:
+            self._by_content[(content_hash, fmt)] = fid
+        rec.compute_stats_async()
+        return {**rec.to_meta(), "parse_skipped": False}
+
+    def _add_alias(self, source: UploadedFileRecord, name: str, size: int) -> UploadedFileRecord:
+        """New file id over ``source``'s IPC file (as originally ingested); nothing is parsed or copied."""
+        rec = UploadedFileRecord(uuid.uuid4().hex[:8], name, size, path=source.path, format=source.format)
+        rec.original_bytes, rec.optimized_bytes = source.original_bytes, source.optimized_bytes
+        rec.dtype_changes, rec.content_hash = dict(source.dtype_changes), source.content_hash
+        rec.alias_of = source
+        if not source.chunk_paths:
+            rec._stats = source._stats
+        self.files[rec.file_id] = rec
+        if rec._stats is None:
+            rec.compute_stats_async()
+        return rec
+
+    def append_file_path(self, file_id: str, path: str, name: str = "", size: int | None = None) -> dict:
+        """Append the rows of a CSV/TSV, Parquet or Arrow file to an uploaded table.
+
+        The batch is parsed into its own IPC chunk file cast to the table's
+        dtypes and the file's version is bumped. Work is O(batch): the
+        resident frame (if any) gains a chunk without a copy, stats are
+        merged from the batch (``merge_stats``, on the stats worker), cached
+        coordinate indexes are extended and derived summaries invalidated.
+        Only a batch value that doesn't fit a narrowed storage dtype costs a
+        rewrite of the table with the wider dtype.
+
+        Returns the file meta plus ``appended_rows``, ``version`` and
+        ``invalidated`` (affected summary ids).
+        """
+        if file_id not in self.files:
+            raise KeyError(f"Unknown file_id: {file_id}")
+        size = os.path.getsize(path) if size is None else size
+        with self._append_lock:
+            rec = self.files[file_id]
+            fmt = detect_format(path, name or rec.name)
+            out = self.data_dir / f"{file_id}-{uuid.uuid4().hex[:8]}.arrow"
+            raw = out.with_suffix(".raw")
+            try:
+                report_progress(0.05, f"parsing {fmt}")
+                _write_ipc(fmt, path, raw)
+                batch = pl.read_ipc(raw)
+                schema = rec.lazy().collect_schema()
+                if set(batch.columns) != set(schema.names()):
+                    raise ValueError(f"columns {sorted(batch.columns)} don't match the table's {schema.names()}")
+                batch = batch.select(schema.names())
+                widened = _append_schema(schema, batch)
+                batch = batch.cast(dict(widened), strict=True)
+                if widened != schema:
+                    self._rewrite_with(rec, widened)
+                batch.write_ipc(out, compression="uncompressed")
+            except Exception as e:
+                out.unlink(missing_ok=True)
+                raise ValueError(f"Failed to append {fmt.upper()}: {e}") from e
+            finally:
+                raw.unlink(missing_ok=True)
+            batch = pl.read_ipc(out)
+            old_key = self.source_key(file_id)
+            rec.chunk_paths.append(str(out))
+            if rec._df is not None:
+                rec._df = pl.concat([rec._df, batch], rechunk=False)
+                self.budget.touch(rec)
+            rec.n_rows += batch.height
+            rec.size += size
+            rec.version += 1
+            prev_stats, batch_lf = rec._stats, pl.scan_ipc(str(out))
+            full_lf = rec.lazy(prefer_disk=True)
+            rec._stats = _STATS_EXECUTOR.submit(_appended_stats, prev_stats, batch_lf, full_lf)
+            self._extend_coordinate_indexes(file_id, old_key, batch)
+            invalidated = self.invalidate(file_id)
+        return {**rec.to_meta(), "appended_rows": batch.height, "version": rec.version, "invalidated": invalidated}
+
+    def _rewrite_with(self, rec: UploadedFileRecord, schema: pl.Schema) -> None:
+        """Rewrite ``rec``'s data in ``schema`` (wider dtypes) as one new base file."""
+        base = self.data_dir / f"{rec.file_id}-{uuid.uuid4().hex[:8]}.arrow"
+        rec.lazy(prefer_disk=True).cast(dict(schema)).sink_ipc(base, compression="uncompressed")
+        old = [p for p in rec._paths() if not any(a is not rec and p in a._paths() for a in self.files.values())]
+        self._release_content(rec)
+        self.budget.forget(rec)
+        rec.path, rec.chunk_paths, rec._df = str(base), [], None
+        changes = {}
+        for c, change in rec.dtype_changes.items():
+            original = change.split(" -> ")[0]
+            if str(schema[c]) != original:
+                changes[c] = f"{original} -> {schema[c]}"
+        rec.dtype_changes = changes
+        for p in old:
+            try:
+                os.unlink(p)  # mappings held elsewhere outlive the entry on POSIX
+            except OSError:
+                pass
+
+    def appended_batch(self, file_id: str) -> pl.DataFrame:
+        """Rows added by the latest append (its memory-mapped chunk file)."""
+        rec = self.files[file_id]
+        if not rec.chunk_paths:
+            raise ValueError(f"File {file_id} has no appended rows")
+        return pl.read_ipc(rec.chunk_paths[-1])
+
+    def _release_content(self, rec: UploadedFileRecord) -> None:
+        """Stop deduping against ``rec``'s base file, which is about to change.
+
+        The content entry moves to another record still holding the base as
+        ingested (an alias), if there is one.
+        """
+        key = (rec.content_hash, rec.format)
+        if rec.content_hash is not None and self._by_content.get(key) == rec.file_id:
+            heir = next((a for a in self.files.values() if a is not rec and a.path == rec.path), None)
+            if heir is not None:
+                self._by_content[key] = heir.file_id
+            else:
+                del self._by_content[key]
+        rec.content_hash = None
+
+    def _extend_coordinate_indexes(self, table_id: str, old_key: tuple, batch: pl.DataFrame) -> None:
+        new_key = self.source_key(table_id)
+        with self._spatial_lock:
+            entries = [(k, idx) for k, (ver, idx) in self._spatial.items() if k[1] == table_id and ver == old_key]
+        for key, index in entries:
+            pts = batch.select([pl.col(c).cast(pl.Float64) for c in key[2]]).to_numpy()
+            extended = index.extended(pts)
+            with self._spatial_lock:
+                # past twice the size it was built for, a rebuilt grid fits the density better
+                if extended is None or len(extended) > 2 * max(extended.built_points, 1):
+                    self._spatial.pop(key, None)
+                else:
+                    self._spatial[key] = (new_key, extended)
 
     def list_files(self) -> List[dict]:
         return [rec.to_meta() for rec in self.files.values()]
@@ -76,14 +513,153 @@ class DataMemory:
     def get_df(self, file_id: str) -> pl.DataFrame:
         if file_id not in self.files:
             raise KeyError(f"Unknown file_id: {file_id}")
-        return self.files[file_id].df
+        rec = self.files[file_id]
+        df = rec.df
+        self.budget.touch(rec)
+        return df
+
+    def get_lazy(self, file_id: str, prefer_disk: bool = False) -> pl.LazyFrame:
+        """Lazy scan of an uploaded table (no load for disk-backed files)."""
+        if file_id not in self.files:
+            raise KeyError(f"Unknown file_id: {file_id}")
+        return self.files[file_id].lazy(prefer_disk)
+
+    def source_key(self, table_id: str) -> tuple:
+        """Cache key for a file or summary's current contents (kind, id, version)."""
+        if table_id in self.files:
+            return ("file", table_id, self.files[table_id].version)
+        if table_id in self.summaries:
+            return ("summary", table_id, self.summaries[table_id].version)
+        raise KeyError(f"Unknown file_id: {table_id}")
 
     def add_summary(
         self, file_id: str, kind: str, df: pl.DataFrame, note: str | None = None
     ) -> dict:
+        """Store a materialized summary (for results that cannot be recomputed)."""
+        sid = uuid.uuid4().hex[:8]
+        spill_path = str(self.data_dir / f"summary-{sid}.arrow")
+        depends_on = [file_id] if file_id in self.files or file_id in self.summaries else []
+        rec = SummaryRecord(sid, file_id, kind, df, note, spill_path=spill_path, depends_on=depends_on)
+        self.summaries[sid] = rec
+        self.budget.touch(rec)
+        return rec.to_meta()
+
+    def add_derived(
+        self,
+        file_id: str,
+        kind: str,
+        build: Callable[[Callable[[str], pl.LazyFrame]], Union[pl.LazyFrame, pl.DataFrame]],
+        plan: dict,
+        depends_on: List[str] | None = None,
+        df: pl.DataFrame | None = None,
+        note: str | None = None,
+    ) -> dict:
+        """Store a lazy summary: ``build(lazy_table)`` re-plans it from its sources.
+
+        ``df`` (the result the caller already computed, if any) is kept as the
+        resident copy until the memory budget evicts it; eviction just drops
+        it, and the next read rebuilds from ``depends_on`` (default
+        ``[file_id]``).
+        """
+        depends_on = [file_id] if depends_on is None else list(depends_on)
+        for table_id in depends_on:
+            self.source_key(table_id)  # unknown ids raise KeyError
         sid = uuid.uuid4().hex[:8]
-        rec = SummaryRecord(sid, file_id, kind, df, note)
+        rec = SummaryRecord(
+            sid, file_id, kind, df, note, plan=plan, depends_on=depends_on,
+            rebuild=lambda: build(self.lazy_table),
+        )
         self.summaries[sid] = rec
+        self.budget.touch(rec)
+        return rec.to_meta()
+
+    def get_table_df(self, table_id: str) -> pl.DataFrame:
+        """DataFrame for a file or summary id."""
+        if table_id in self.files:
+            return self.get_df(table_id)
+        return self.get_summary_df(table_id)
+
+    def lazy_table(self, table_id: str) -> pl.LazyFrame:
+        """Lazy frame for a file or summary id."""
+        if table_id in self.files:
+            return self.files[table_id].lazy()
+        return self.get_summary_record(table_id).lazy()
+
+    def spatial_index(self, table_id: str, columns: List[str] | tuple = ("x", "y", "z")) -> GridIndex:
+        """Grid index over a table's coordinate columns.
+
+        Built on first use from just those columns (NaN/null rows are skipped)
+        and cached until the table's version changes.
+        """
+        return self._coordinate_index(GridIndex, table_id, columns)
+
+    def count_pyramid(self, table_id: str, columns: List[str] | tuple = ("x", "y", "z")) -> CountPyramid:
+        """Multi-resolution point counts over a table's coordinates (cached like ``spatial_index``)."""
+        return self._coordinate_index(CountPyramid, table_id, columns)
+
+    def _coordinate_index(self, index_type, table_id: str, columns) -> object:
+        columns = tuple(columns)
+        if not 1 <= len(columns) <= 3:
+            raise ValueError("Spatial index needs 1-3 coordinate columns")
+        key, version = (index_type.__name__, table_id, columns), self.source_key(table_id)
+        with self._spatial_lock:
+            cached = self._spatial.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        lf = self.lazy_table(table_id)
+        schema = lf.collect_schema()
+        missing = [c for c in columns if c not in schema]
+        if missing:
+            raise ValueError(f"Missing coordinate columns: {missing}")
+        non_numeric = [c for c in columns if not schema[c].is_numeric()]
+        if non_numeric:
+            raise ValueError(f"Coordinate columns must be numeric: {non_numeric}")
+        pts = lf.select([pl.col(c).cast(pl.Float64) for c in columns]).collect().to_numpy()
+        index = index_type(pts)
+        with self._spatial_lock:
+            self._spatial[key] = (version, index)
+        return index
+
+    def dependents(self, table_id: str) -> List[str]:
+        """Summary ids derived (directly or transitively) from ``table_id``, in creation order."""
+        found: set = set()
+        frontier = {table_id}
+        while frontier:
+            frontier = {
+                sid for sid, rec in self.summaries.items()
+                if sid not in found and frontier.intersection(rec.depends_on)
+            }
+            found |= frontier
+        return [sid for sid in self.summaries if sid in found]
+
+    def invalidate(self, table_id: str) -> List[str]:
+        """Mark everything derived from ``table_id`` as changed.
+
+        Lazy summaries drop their cached frame (and bump their version) and are
+        rebuilt on next read; materialized ones are flagged ``stale``.
+        Returns the affected summary ids.
+        """
+        affected = self.dependents(table_id)
+        for sid in affected:
+            rec = self.summaries[sid]
+            rec.version += 1
+            if rec._rebuild is None:
+                rec.stale = True
+                continue
+            self.budget.forget(rec)
+            rec._df = None
+            rec.n_rows = None
+        return affected
+
+    def refresh_summary(self, summary_id: str) -> dict:
+        """Recompute a lazy summary now (after ``invalidate``) and return its meta."""
+        rec = self.get_summary_record(summary_id)
+        if rec._rebuild is None:
+            raise ValueError(f"Summary {summary_id} is materialized and cannot be recomputed")
+        self.budget.forget(rec)
+        rec._df = None
+        self.get_summary_df(summary_id)
+        rec.stale = False
         return rec.to_meta()
 
     def list_summaries(self) -> List[dict]:
@@ -92,7 +668,10 @@ class DataMemory:
     def get_summary_df(self, summary_id: str) -> pl.DataFrame:
         if summary_id not in self.summaries:
             raise KeyError(f"Unknown summary_id: {summary_id}")
-        return self.summaries[summary_id].df
+        rec = self.summaries[summary_id]
+        df = rec.df
+        self.budget.touch(rec)
+        return df
 
     def get_summary_record(self, summary_id: str) -> SummaryRecord:
         if summary_id not in self.summaries:
@@ -100,6 +679,62 @@ class DataMemory:
         return self.summaries[summary_id]
 
 
+def _append_schema(schema: pl.Schema, batch: pl.DataFrame) -> pl.Schema:
+    """``schema`` with columns widened (to the common supertype) where ``batch`` values don't fit."""
+    out = dict(schema)
+    for c, dt in schema.items():
+        try:
+            batch.get_column(c).cast(dt, strict=True)
+        except (pl.exceptions.InvalidOperationError, pl.exceptions.ComputeError):
+            empty = [pl.Series(c, [], dtype=dt).to_frame(), batch.get_column(c).head(0).to_frame()]
+            out[c] = pl.concat(empty, how="vertical_relaxed").schema[c]
+    return pl.Schema(out)
+
+
+def _appended_stats(prev: Optional[Future], batch: pl.LazyFrame, full: pl.LazyFrame) -> dict:
+    # Runs on the single stats worker after ``prev`` (FIFO), so it is already settled.
+    try:
+        stats = prev.result() if prev is not None else None
+    except Exception:
+        stats = None
+    return merge_stats(stats, batch) if stats else column_stats(full)
+
+
+def _write_ipc(fmt: str, src: str, out: Path) -> None:
+    """Materialize ``src`` as the Arrow IPC file backing a record."""
+    if fmt == "ipc":
+        # Already the storage format: hard-link (zero-copy) or copy, no decode.
+        # (LZ4/ZSTD-compressed IPC still reads fine, just not memory-mapped.)
+        try:
+            os.link(src, out)
+        except OSError:
+            shutil.copyfile(src, out)
+        return
+    if fmt == "ipc_stream":
+        lf = pl.read_ipc_stream(src).lazy()
+    elif fmt == "parquet":
+        lf = pl.scan_parquet(src)
+    else:
+        lf = pl.scan_csv(src, separator="\t" if fmt == "tsv" else ",")
+    lf.sink_ipc(out)
+
+
+def _optimize_ipc(path: Path) -> Dict[str, str]:
+    """Rewrite the IPC file at ``path`` in narrower lossless dtypes; returns the changes."""
+    lf = pl.scan_ipc(path)
+    before = lf.collect_schema()
+    plan = narrow_dtypes(lf)
+    if not plan:
+        return {}
+    tmp = path.with_suffix(".narrow")
+    try:
+        lf.cast(plan).sink_ipc(tmp)
+        os.replace(tmp, path)  # also detaches a hard-linked IPC upload
+    finally:
+        tmp.unlink(missing_ok=True)
+    return describe_changes(before, pl.scan_ipc(path).collect_schema())
+
+
 class InteractionMemory:
     """Simple rolling memory for recent interactions."""
 
@@ -0,0 +1,65 @@
+"""LRU memory budget for DataMemory tables.
+
+Tracks the resident frames of uploaded files and summaries by
+``DataFrame.estimated_size()``. When the total exceeds the budget, the least
+recently used frames are released: tables without a backing file are first
+written to Arrow IPC (uncompressed, so they reload memory-mapped), then the
+in-memory frame is dropped. Metadata (shape, columns) stays on the record.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Protocol
+
+
+class SpillableTable(Protocol):
+    def resident_bytes(self) -> int: ...
+
+    def release(self) -> None: ...
+
+
+class MemoryBudget:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._resident: "OrderedDict[int, tuple[SpillableTable, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.spills = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._bytes
+
+    def touch(self, table: SpillableTable) -> None:
+        """Mark ``table`` most recently used (and resident), evicting others if over budget."""
+        with self._lock:
+            key = id(table)
+            old = self._resident.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            size = table.resident_bytes()
+            if size:
+                self._resident[key] = (table, size)
+                self._bytes += size
+            # never evict the table being accessed
+            while self._bytes > self.max_bytes and len(self._resident) > 1:
+                _, (victim, victim_size) = self._resident.popitem(last=False)
+                self._bytes -= victim_size
+                victim.release()
+                self.spills += 1
+
+    def forget(self, table: SpillableTable) -> None:
+        with self._lock:
+            old = self._resident.pop(id(table), None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def stats(self) -> dict:
+        return {
+            "budget_bytes": self.max_bytes,
+            "resident_bytes": self._bytes,
+            "resident_tables": len(self._resident),
+            "spills": self.spills,
+        }
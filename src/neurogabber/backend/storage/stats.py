@@ -0,0 +1,273 @@
+"""Per-column statistics computed once per uploaded table.
+
+Two streaming passes over the table's lazy scan: one for counts, nulls,
+distinct estimates (HyperLogLog), min/max, mean/std and quantiles; one for a
+fixed-bin histogram of numeric columns. Low-cardinality columns also keep
+their exact distinct values (top-level ``"values"``). The result is plain JSON
+so tools can return it directly.
+
+``merge_stats`` folds an appended batch into existing stats touching only the
+batch: counts, nulls, min/max and mean/std combine exactly, as do ``distinct``
+for columns with tracked values and histograms whose range didn't grow;
+quantiles (and histograms re-binned to a wider range) are approximated from
+the two summaries.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+HIST_BINS = 10
+VALUE_SET_MAX = 256  # track exact distinct values up to this many per column
+_SEP = "\x00"
+
+
+def _json_value(v: Any) -> Any:
+    if isinstance(v, float):
+        return v if math.isfinite(v) else None
+    if v is None or isinstance(v, (int, str, bool)):
+        return v
+    return str(v)  # dates, durations, decimals
+
+
+def _orderable(dt: pl.DataType) -> bool:
+    return dt.is_numeric() or dt.is_temporal() or dt == pl.Utf8 or dt == pl.Boolean
+
+
+def _column_aggregates(lf: pl.LazyFrame) -> Tuple[pl.Schema, int, Dict[str, Dict[str, Any]]]:
+    """First pass: ``(schema, n_rows, {column: info})`` without histograms."""
+    schema = lf.collect_schema()
+    aggs: List[pl.Expr] = [pl.len().alias("__n_rows")]
+    for c, dt in schema.items():
+        col = pl.col(c)
+        aggs.append(col.null_count().alias(f"{c}{_SEP}null_count"))
+        if dt.is_nested():
+            continue
+        aggs.append(col.approx_n_unique().alias(f"{c}{_SEP}distinct"))
+        if _orderable(dt):
+            aggs += [col.min().alias(f"{c}{_SEP}min"), col.max().alias(f"{c}{_SEP}max")]
+        if dt.is_numeric():
+            aggs += [col.mean().alias(f"{c}{_SEP}mean"), col.std().alias(f"{c}{_SEP}std")]
+            aggs += [col.quantile(q, "linear").alias(f"{c}{_SEP}q{q}") for q in QUANTILES]
+    row = lf.select(aggs).collect(engine="streaming").row(0, named=True)
+
+    columns: Dict[str, Dict[str, Any]] = {}
+    for c, dt in schema.items():
+        info: Dict[str, Any] = {"dtype": str(dt)}
+        for key in ("null_count", "distinct", "min", "max", "mean", "std"):
+            if f"{c}{_SEP}{key}" in row:
+                info[key] = _json_value(row[f"{c}{_SEP}{key}"])
+        if dt.is_numeric():
+            info["quantiles"] = {f"p{int(q * 100):02d}": _json_value(row[f"{c}{_SEP}q{q}"]) for q in QUANTILES}
+        columns[c] = info
+    return schema, int(row["__n_rows"]), columns
+
+
+def _hist_range(dt: pl.DataType, info: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    lo, hi = info.get("min"), info.get("max")
+    if (dt.is_numeric() and dt != pl.Boolean and isinstance(lo, (int, float))
+            and isinstance(hi, (int, float)) and hi > lo):
+        return lo, hi
+    return None
+
+
+def _bin_counts(lf: pl.LazyFrame, ranges: Dict[str, Tuple[float, float]], bins: int) -> Dict[str, List[int]]:
+    """Counts of each column in ``bins`` equal buckets over its (lo, hi) range (out-of-range values clip)."""
+    if not ranges:
+        return {}
+    aggs = []
+    for c, (lo, hi) in ranges.items():
+        width = (hi - lo) / bins
+        bucket = ((pl.col(c).cast(pl.Float64) - lo) / width).floor().clip(0, bins - 1)
+        aggs += [(bucket == i).sum().alias(f"{c}{_SEP}h{i}") for i in range(bins)]
+    row = lf.select(aggs).collect(engine="streaming").row(0, named=True)
+    return {c: [int(row[f"{c}{_SEP}h{i}"] or 0) for i in range(bins)] for c in ranges}
+
+
+def _edges(lo: float, hi: float, bins: int) -> List[float]:
+    width = (hi - lo) / bins
+    return [lo + i * width for i in range(bins + 1)]
+
+
+def _value_sets(lf: pl.LazyFrame, schema: pl.Schema, columns: Dict[str, Dict[str, Any]]) -> Dict[str, List[Any]]:
+    small = [
+        c for c, info in columns.items()
+        if not schema[c].is_nested() and isinstance(info.get("distinct"), int) and info["distinct"] <= VALUE_SET_MAX
+    ]
+    if not small:
+        return {}
+    row = lf.select([pl.col(c).drop_nulls().unique().implode() for c in small]).collect(engine="streaming")
+    values = {c: [_json_value(v) for v in row[c][0]] for c in small}
+    return {c: v for c, v in values.items() if len(v) <= VALUE_SET_MAX}
+
+
+def column_stats(lf: pl.LazyFrame, bins: int = HIST_BINS) -> Dict[str, Any]:
+    """Return ``{"n_rows": int, "columns": {name: {...}}, "values": {name: [...]}}`` for ``lf``."""
+    schema, n_rows, columns = _column_aggregates(lf)
+    # histogram pass: bucket counts for numeric columns with a finite, non-empty range
+    ranges = {c: r for c, info in columns.items() if (r := _hist_range(schema[c], info))}
+    for c, counts in _bin_counts(lf, ranges, bins).items():
+        columns[c]["histogram"] = {"edges": _edges(*ranges[c], bins), "counts": counts}
+    values = _value_sets(lf, schema, columns)
+    for c, vals in values.items():
+        columns[c]["distinct"] = len(vals)  # exact where known
+    return {"n_rows": n_rows, "columns": columns, "values": values}
+
+
+def _combine(a: Optional[Any], b: Optional[Any], pick) -> Optional[Any]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    try:
+        return pick(a, b)
+    except TypeError:  # mismatched JSON forms (e.g. after a dtype change)
+        return b
+
+
+def _mixture_quantiles(a: Dict[str, Any], n_a: int, b: Dict[str, Any], n_b: int) -> Dict[str, Any]:
+    """Quantiles of the union, reading each side's min/quantiles/max as a piecewise-linear CDF."""
+    def knots(info):
+        q = info.get("quantiles") or {}
+        pts = [(info.get("min"), 0.0), *[(q.get(f"p{int(p * 100):02d}"), p) for p in QUANTILES], (info.get("max"), 1.0)]
+        pts = [(x, p) for x, p in pts if isinstance(x, (int, float))]
+        return (np.array([x for x, _ in pts], dtype=float), np.array([p for _, p in pts])) if pts else None
+
+    ka, kb = (knots(a) if n_a else None), (knots(b) if n_b else None)
+    if ka is None or kb is None:
+        return dict((a if kb is None else b).get("quantiles") or {})
+    xs = np.unique(np.concatenate([ka[0], kb[0]]))
+    cdf = (n_a * np.interp(xs, *ka, left=0.0, right=1.0) + n_b * np.interp(xs, *kb, left=0.0, right=1.0)) / (n_a + n_b)
+    return {f"p{int(q * 100):02d}": _json_value(float(np.interp(q, cdf, xs))) for q in QUANTILES}
+
+
+def _rebin(hist: Optional[Dict[str, Any]], info: Dict[str, Any], n: int, lo: float, hi: float, bins: int) -> np.ndarray:
+    """Spread an existing histogram (or a single repeated value) over new edges, uniformly within old bins."""
+    new_edges = np.array(_edges(lo, hi, bins))
+    out = np.zeros(bins)
+    if hist is None:
+        v = info.get("min")
+        if n and isinstance(v, (int, float)):
+            out[min(int((v - lo) / (hi - lo) * bins), bins - 1)] += n
+        return out
+    old_edges = np.asarray(hist["edges"], dtype=float)
+    for (l0, h0), count in zip(zip(old_edges[:-1], old_edges[1:]), hist["counts"]):
+        if not count:
+            continue
+        overlap = np.clip(np.minimum(new_edges[1:], h0) - np.maximum(new_edges[:-1], l0), 0, None)
+        out += count * overlap / (overlap.sum() or 1.0)
+    return out
+
+
+def _round_counts(values: np.ndarray) -> np.ndarray:
+    """Integer counts summing to ``round(values.sum())`` (largest remainders round up)."""
+    floor = np.floor(values).astype(int)
+    short = int(round(values.sum())) - int(floor.sum())
+    if short > 0:
+        floor[np.argsort(floor - values, kind="stable")[:short]] += 1
+    return floor
+
+
+def merge_stats(stats: Dict[str, Any], batch: pl.LazyFrame, bins: int = HIST_BINS) -> Dict[str, Any]:
+    """Stats of (table + ``batch``) from the table's ``stats``; reads only the batch.
+
+    ``batch`` must have the table's columns and dtypes.
+    """
+    schema, n_b, b_cols = _column_aggregates(batch)
+    b_values = _value_sets(batch, schema, b_cols)
+    n_a = stats["n_rows"]
+    a_values = stats.get("values", {})
+    columns: Dict[str, Dict[str, Any]] = {}
+    values: Dict[str, List[Any]] = {}
+    ranges: Dict[str, Tuple[float, float]] = {}
+    for c, dt in schema.items():
+        a, b = stats["columns"].get(c, {}), b_cols[c]
+        nn_a = n_a - (a.get("null_count") or 0)
+        nn_b = n_b - (b.get("null_count") or 0)
+        info: Dict[str, Any] = {"dtype": str(dt), "null_count": (a.get("null_count") or 0) + (b.get("null_count") or 0)}
+        if "distinct" in b:
+            if c in a_values and c in b_values:
+                merged = list(dict.fromkeys([*a_values[c], *b_values[c]]))
+                if len(merged) <= VALUE_SET_MAX:
+                    values[c] = merged
+            info["distinct"] = len(values[c]) if c in values else min(
+                nn_a + nn_b, (a.get("distinct") or 0) + (b.get("distinct") or 0)
+            )
+        if "min" in b:
+            info["min"] = _combine(a.get("min"), b.get("min"), min)
+            info["max"] = _combine(a.get("max"), b.get("max"), max)
+        if dt.is_numeric():
+            info.update(_merge_moments(a, nn_a, b, nn_b))
+            info["quantiles"] = _mixture_quantiles(a, nn_a, b, nn_b)
+            if (r := _hist_range(dt, info)):
+                ranges[c] = r
+        columns[c] = info
+    batch_counts = _bin_counts(batch, ranges, bins)
+    for c, (lo, hi) in ranges.items():
+        a = stats["columns"].get(c, {})
+        hist = a.get("histogram")
+        if hist is not None and len(hist["counts"]) == bins and hist["edges"][0] == lo and hist["edges"][-1] == hi:
+            old = np.asarray(hist["counts"], dtype=float)  # same edges: exact
+        else:
+            old = _rebin(hist, a, n_a - (a.get("null_count") or 0), lo, hi, bins)
+        counts = _round_counts(old + np.asarray(batch_counts[c], dtype=float))
+        columns[c]["histogram"] = {"edges": _edges(lo, hi, bins), "counts": counts.tolist()}
+    return {"n_rows": n_a + n_b, "columns": columns, "values": values}
+
+
+def _merge_moments(a: Dict[str, Any], n_a: int, b: Dict[str, Any], n_b: int) -> Dict[str, Any]:
+    """Combined mean and sample std (Chan et al. pairwise update)."""
+    mean_a, mean_b = a.get("mean"), b.get("mean")
+    if not n_a or mean_a is None:
+        return {"mean": mean_b, "std": b.get("std")}
+    if not n_b or mean_b is None:
+        return {"mean": mean_a, "std": a.get("std")}
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    m2 = ((a.get("std") or 0.0) ** 2) * (n_a - 1) + ((b.get("std") or 0.0) ** 2) * (n_b - 1) + delta**2 * n_a * n_b / n
+    return {"mean": _json_value(mean_a + delta * n_b / n), "std": _json_value(math.sqrt(m2 / (n - 1)) if n > 1 else None)}
+
+
+def describe_frame(stats: Dict[str, Any]) -> pl.DataFrame:
+    """``DataFrame.describe()``-shaped table built from precomputed stats."""
+    n_rows = stats["n_rows"]
+    rows = ["count", "null_count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    data: Dict[str, List[Any]] = {"statistic": rows}
+    for c, info in stats["columns"].items():
+        q = info.get("quantiles") or {}
+        values = [
+            n_rows - (info.get("null_count") or 0),
+            info.get("null_count"),
+            info.get("mean"),
+            info.get("std"),
+            info.get("min"),
+            q.get("p25"),
+            q.get("p50"),
+            q.get("p75"),
+            info.get("max"),
+        ]
+        data[c] = [None if v is None else str(v) if not isinstance(v, (int, float)) else float(v) for v in values]
+    return pl.DataFrame(data, strict=False)
+
+
+def compact_stats(stats: Dict[str, Any], max_columns: int = 24) -> str:
+    """One-line column summary for the LLM data context, e.g. ``x:f64[0..512] region:str(7)``."""
+    parts = []
+    for c, info in list(stats["columns"].items())[:max_columns]:
+        dtype = info["dtype"].lower().replace("float", "f").replace("int", "i").replace("string", "str")
+        if isinstance(info.get("min"), (int, float)) and isinstance(info.get("max"), (int, float)):
+            part = f"{c}:{dtype}[{info['min']:.4g}..{info['max']:.4g}]"
+        else:
+            part = f"{c}:{dtype}({info.get('distinct', '?')})"
+        if info.get("null_count"):
+            part += f" nulls={info['null_count']}"
+        parts.append(part)
+    extra = len(stats["columns"]) - max_columns
+    if extra > 0:
+        parts.append(f"+{extra} more")
+    return " ".join(parts)
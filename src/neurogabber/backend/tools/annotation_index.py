@@ -0,0 +1,163 @@
+"""Id-keyed index over an annotation layer's inline annotation list.
+
+The layer's ``source.annotations`` list stays the source of truth (it is what
+gets serialized into the state URL); the index maps ``id -> position`` in that
+list and keeps per-type counts so upserts, deletes and summaries are O(changes)
+instead of O(layer size). A spatial index over annotation anchors is built on
+demand and rebuilt after the layer changes.
+"""
+
+from __future__ import annotations
+
+import uuid
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .spatial import GridIndex
+
+
+def annotation_type(ann: Dict) -> Optional[str]:
+    """Neuroglancer annotation type (inline point annotations may omit 'type')."""
+    return ann.get("type") or ("point" if "point" in ann else None)
+
+
+def annotation_anchor(ann: Dict) -> Optional[List[float]]:
+    """Representative xyz for spatial queries: point/center, or a line/box midpoint."""
+    for key in ("point", "center"):
+        if key in ann:
+            return list(ann[key][:3])
+    if "pointA" in ann and "pointB" in ann:
+        return [(a + b) / 2 for a, b in zip(ann["pointA"][:3], ann["pointB"][:3])]
+    return None
+
+
+class AnnotationIndex:
+    """Id -> position index over one layer's annotation list.
+
+    Deletes swap the last annotation into the freed slot, so annotation order is
+    not preserved (Neuroglancer does not depend on it). ``version`` increments on
+    every mutation so derived structures (e.g. spatial indexes) can tell when
+    they are stale.
+
+    Building the index never touches the list, so read-only callers (summaries,
+    queries) leave the state as they found it. Legacy lists with missing or
+    repeated ids are normalized (ids generated, last occurrence kept) by the
+    first mutation.
+    """
+
+    def __init__(self, items: List[Dict]):
+        self.items = items
+        self.positions: Dict[str, int] = {}
+        self.type_counts: Counter = Counter()
+        self.version = 0
+        self._spatial: Optional[Tuple[int, GridIndex, List[Optional[str]]]] = None
+        self._build()
+
+    def _build(self):
+        self.positions.clear()
+        self.type_counts.clear()
+        for pos, ann in enumerate(self.items):
+            if ann.get("id"):
+                self.positions[str(ann["id"])] = pos  # repeated ids: the last occurrence wins
+            self.type_counts[annotation_type(ann)] += 1
+        self._normalized = len(self.positions) == len(self.items)
+
+    def _normalize(self):
+        if self._normalized:
+            return
+        seen: Dict[str, Dict] = {}
+        for ann in self.items:
+            if not ann.get("id"):
+                ann["id"] = uuid.uuid4().hex
+            seen[str(ann["id"])] = ann
+        self.items[:] = list(seen.values())
+        self._build()
+        self.version += 1
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, ann_id: str) -> bool:
+        return str(ann_id) in self.positions
+
+    def get(self, ann_id: str) -> Optional[Dict]:
+        pos = self.positions.get(str(ann_id))
+        return None if pos is None else self.items[pos]
+
+    def spatial(self) -> Tuple[GridIndex, List[Optional[str]]]:
+        """Grid index over annotation anchors plus the id of each indexed row.
+
+        Cached until the next mutation (tracked through ``version``). Rows of
+        not-yet-normalized annotations without an id map to ``None``.
+        """
+        if self._spatial is None or self._spatial[0] != self.version:
+            anchors = np.full((len(self.items), 3), np.nan)
+            for pos, ann in enumerate(self.items):
+                anchor = annotation_anchor(ann)
+                if anchor is not None and len(anchor) == 3:
+                    anchors[pos] = anchor
+            ids = [str(ann["id"]) if ann.get("id") else None for ann in self.items]
+            self._spatial = (self.version, GridIndex(anchors), ids)
+        return self._spatial[1], self._spatial[2]
+
+    def types(self) -> List[str]:
+        return sorted(t for t, n in self.type_counts.items() if t and n > 0)
+
+    def upsert(self, items: Iterable[Dict]) -> Tuple[int, int]:
+        """Insert new annotations or replace existing ones with the same id.
+
+        Annotations without an id get a generated one. Returns
+        ``(inserted, updated)``.
+        """
+        self._normalize()
+        inserted = updated = 0
+        for ann in items:
+            if not ann.get("id"):
+                ann["id"] = uuid.uuid4().hex
+            key = str(ann["id"])
+            pos = self.positions.get(key)
+            if pos is None:
+                self.positions[key] = len(self.items)
+                self.items.append(ann)
+                inserted += 1
+            else:
+                self.type_counts[annotation_type(self.items[pos])] -= 1
+                self.items[pos] = ann
+                updated += 1
+            self.type_counts[annotation_type(ann)] += 1
+        if inserted or updated:
+            self.version += 1
+        return inserted, updated
+
+    def delete(self, ids: Iterable[str]) -> Tuple[int, List[str]]:
+        """Remove annotations by id. Returns ``(deleted, missing_ids)``."""
+        self._normalize()
+        deleted = 0
+        missing: List[str] = []
+        for ann_id in ids:
+            key = str(ann_id)
+            pos = self.positions.pop(key, None)
+            if pos is None:
+                missing.append(key)
+                continue
+            self.type_counts[annotation_type(self.items[pos])] -= 1
+            last = self.items.pop()
+            if pos < len(self.items):
+                self.items[pos] = last
+                self.positions[str(last["id"])] = pos
+            deleted += 1
+        if deleted:
+            self.version += 1
+        return deleted, missing
+
+    def replace(self, items: Iterable[Dict]) -> int:
+        """Drop every annotation and insert ``items``. Returns the new count."""
+        self.items.clear()
+        self.positions.clear()
+        self.type_counts.clear()
+        self._normalized = True
+        self.version += 1
+        self.upsert(items)
+        return len(self.items)
@@ -1,6 +1,7 @@
 """Shared tool classification constants.
 
-Centralizes definition of which tools mutate the Neuroglancer state so that
+Centralizes definition of which tools mutate the Neuroglancer state (and which
+read-only data tools may be memoized, and which run as background jobs) so that
 frontend, backend chat loop, and tests do not drift.
 """
 
@@ -10,6 +11,10 @@ MUTATING_TOOLS: set[str] = {
     "ng_set_view",
     "ng_set_lut",
     "ng_annotations_add",
+    "ng_annotations_upsert",
+    "ng_annotations_delete",
+    "ng_annotations_replace",
+    "ng_annotations_from_table",  # adds/re-points a precomputed annotation layer
     "ng_add_layer",
     "ng_set_layer_visibility",
     "state_load",            # replaces entire state
@@ -17,6 +22,29 @@ MUTATING_TOOLS: set[str] = {
     "data_ng_views_table",   # generates multiple view mutations
 }
 
+# Read-only tools whose result depends only on their args and one table's
+# contents (file_id / summary_id); served from TOOL_MEMO on repeats.
+MEMOIZABLE_TOOLS: set[str] = {
+    "data_info",
+    "data_preview",
+    "data_describe",
+}
+
+# Long-running tools the chat loop runs as background jobs (backend/jobs.py):
+# the tool call returns a job handle if the job outlasts the inline wait.
+BACKGROUND_TOOLS: set[str] = {
+    "data_plot_histogram",  # CloudVolume fetch + histogram
+    "data_spatial_join",
+}
+
 
 def is_mutating_tool(name: str) -> bool:
     return name in MUTATING_TOOLS
+
+
+def is_memoizable_tool(name: str) -> bool:
+    return name in MEMOIZABLE_TOOLS
+
+
+def is_background_tool(name: str) -> bool:
+    return name in BACKGROUND_TOOLS
@@ -0,0 +1,110 @@
+"""
+Storage vs compute dtypes for uploaded tables.
+
+``narrow_dtypes`` plans a lossless downcast at ingest: integers to the
+narrowest type holding their min/max, Float64 to Float32 when every value
+round-trips exactly, and repeated strings to ``Categorical``. Tables are stored
+and held resident in these types.
+
+Polars integer arithmetic wraps on overflow and string functions reject
+categoricals, so query paths call ``widen`` before computing: narrow integers
+become Int64, Float32 becomes Float64 and categoricals become strings again.
+The casts run inside the scan, so the narrow on-disk columns are still what
+gets read.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, TypeVar
+
+import polars as pl
+
+# Narrowest first; a column takes the first type whose range holds its min/max.
+_INT_CANDIDATES = (pl.Int8, pl.UInt8, pl.Int16, pl.UInt16, pl.Int32, pl.UInt32)
+_INT_RANGE = {
+    pl.Int8: (-(2**7), 2**7 - 1),
+    pl.UInt8: (0, 2**8 - 1),
+    pl.Int16: (-(2**15), 2**15 - 1),
+    pl.UInt16: (0, 2**16 - 1),
+    pl.Int32: (-(2**31), 2**31 - 1),
+    pl.UInt32: (0, 2**32 - 1),
+}
+_INT_WIDTH = {pl.Int8: 1, pl.UInt8: 1, pl.Int16: 2, pl.UInt16: 2, pl.Int32: 4, pl.UInt32: 4, pl.Int64: 8, pl.UInt64: 8}
+
+# Strings become Categorical when distinct values are at most this share of rows.
+CATEGORICAL_MAX_RATIO = 0.5
+
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+_SEP = "\x00"
+
+
+def _int_type(lo: int, hi: int, current: pl.DataType) -> Optional[pl.DataType]:
+    for dt in _INT_CANDIDATES:
+        if _INT_WIDTH[dt] >= _INT_WIDTH.get(current, 8):
+            return None
+        low, high = _INT_RANGE[dt]
+        if low <= lo and hi <= high:
+            return dt
+    return None
+
+
+def narrow_dtypes(lf: pl.LazyFrame, categorical_max_ratio: float = CATEGORICAL_MAX_RATIO) -> Dict[str, pl.DataType]:
+    """Lossless narrower dtype per column of ``lf`` (columns that can't shrink are omitted).
+
+    One streaming aggregate pass: min/max for integers, an exact Float32
+    round-trip check for Float64, and a distinct estimate for strings.
+    """
+    schema = lf.collect_schema()
+    aggs = [pl.len().alias("__n")]
+    for c, dt in schema.items():
+        col = pl.col(c)
+        if dt.is_integer() and dt in _INT_WIDTH and _INT_WIDTH[dt] > 1:
+            aggs += [col.min().alias(f"{c}{_SEP}min"), col.max().alias(f"{c}{_SEP}max")]
+        elif dt == pl.Float64:
+            exact = (col.cast(pl.Float32).cast(pl.Float64) == col) | col.is_null() | col.is_nan()
+            aggs.append(exact.all().alias(f"{c}{_SEP}f32"))
+        elif dt == pl.String:
+            aggs.append(col.approx_n_unique().alias(f"{c}{_SEP}distinct"))
+    if len(aggs) == 1:
+        return {}
+    row = lf.select(aggs).collect(engine="streaming").row(0, named=True)
+    n_rows = row["__n"]
+    plan: Dict[str, pl.DataType] = {}
+    for c, dt in schema.items():
+        if f"{c}{_SEP}min" in row:
+            lo, hi = row[f"{c}{_SEP}min"], row[f"{c}{_SEP}max"]
+            target = _int_type(lo, hi, dt) if lo is not None else pl.Int8
+            if target is not None:
+                plan[c] = target
+        elif row.get(f"{c}{_SEP}f32"):
+            plan[c] = pl.Float32
+        elif f"{c}{_SEP}distinct" in row and n_rows > 1:
+            if row[f"{c}{_SEP}distinct"] <= max(1, categorical_max_ratio * n_rows):
+                plan[c] = pl.Categorical
+    return plan
+
+
+def compute_casts(schema: pl.Schema, names: Optional[Iterable[str]] = None) -> Dict[str, pl.DataType]:
+    """Casts that lift narrow storage dtypes in ``schema`` back to compute dtypes."""
+    out: Dict[str, pl.DataType] = {}
+    for c in (schema.names() if names is None else [n for n in names if n in schema]):
+        dt = schema[c]
+        if dt in _INT_RANGE:
+            out[c] = pl.Int64
+        elif dt == pl.Float32:
+            out[c] = pl.Float64
+        elif isinstance(dt, (pl.Categorical, pl.Enum)):
+            out[c] = pl.String
+    return out
+
+
+def widen(frame: Frame, names: Optional[Iterable[str]] = None) -> Frame:
+    """``frame`` with narrow integer / Float32 / categorical columns in compute dtypes."""
+    schema = frame.collect_schema()
+    casts = compute_casts(schema, names)
+    return frame.cast(casts) if casts else frame
+
+
+def describe_changes(before: pl.Schema, after: pl.Schema) -> Dict[str, str]:
+    """``{column: "Int64 -> Int16"}`` for columns whose dtype differs."""
+    return {c: f"{dt} -> {after[c]}" for c, dt in before.items() if c in after and after[c] != dt}
@@ -0,0 +1,151 @@
+"""
+Response encodings for table-valued data endpoints.
+
+Endpoints return row dicts by default (what the LLM tools expect). HTTP
+clients may opt into a denser encoding through the ``Accept`` header:
+
+* ``application/vnd.neurogabber.columnar+json`` – the row field becomes
+  ``{"columns": [...], "dtypes": [...], "data": {column: [values]}}``, which
+  ``pandas.DataFrame(body["data"])`` reads directly;
+* ``application/vnd.apache.arrow.stream`` – the body is an Arrow IPC stream of
+  the rows; the remaining payload fields travel as JSON in the
+  ``X-Neurogabber-Meta`` header.
+
+``export_chunks`` streams a whole table as CSV / Parquet / Arrow IPC for
+downloads: Polars' streaming sink writes into a bounded queue that the HTTP
+response drains, so memory stays constant whatever the table size.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import queue
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import polars as pl
+
+COLUMNAR_JSON = "application/vnd.neurogabber.columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+META_HEADER = "X-Neurogabber-Meta"
+
+# export format -> (media type, file extension, LazyFrame sink method)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv", "sink_csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet", "sink_parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow", "sink_ipc"),
+}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """``"arrow"``, ``"columnar"`` or ``"rows"`` for an ``Accept`` header (first match wins)."""
+    for part in (accept or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media == ARROW_STREAM:
+            return "arrow"
+        if media == COLUMNAR_JSON:
+            return "columnar"
+    return "rows"
+
+
+def columnar(df: pl.DataFrame) -> Dict[str, Any]:
+    return {
+        "columns": df.columns,
+        "dtypes": [str(dt) for dt in df.dtypes],
+        "data": df.to_dict(as_series=False),
+    }
+
+
+def records_frame(items: List[Dict[str, Any]]) -> pl.DataFrame:
+    """Frame from metadata records; nested values (lists, dicts) become JSON strings."""
+    keys: Dict[str, None] = {}
+    for item in items:
+        keys.update(dict.fromkeys(item))
+    data = {
+        k: [json.dumps(v, default=str) if isinstance(v, (dict, list)) else v for v in (item.get(k) for item in items)]
+        for k in keys
+    }
+    return pl.DataFrame(data, strict=False)
+
+
+def records_columnar(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    keys: Dict[str, None] = {}
+    for item in items:
+        keys.update(dict.fromkeys(item))
+    return {"columns": list(keys), "data": {k: [item.get(k) for item in items] for k in keys}}
+
+
+def arrow_stream(df: pl.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.write_ipc_stream(buf, compat_level=pl.CompatLevel.oldest())
+    return buf.getvalue()
+
+
+def read_arrow_stream(body: bytes) -> pl.DataFrame:
+    return pl.read_ipc_stream(io.BytesIO(body))
+
+
+class _QueueWriter(io.RawIOBase):
+    """Write-only file object handing each write to a bounded queue (blocks when full)."""
+
+    def __init__(self, out: "queue.Queue", cancelled: threading.Event):
+        self.out = out
+        self.cancelled = cancelled
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        while True:
+            if self.cancelled.is_set():
+                raise OSError("export cancelled")
+            try:
+                self.out.put(chunk, timeout=0.1)
+                return len(chunk)
+            except queue.Full:
+                continue
+
+
+_DONE = object()
+
+
+def export_chunks(lf: pl.LazyFrame, fmt: str, max_pending: int = 8) -> Iterator[bytes]:
+    """Yield ``lf`` encoded as ``fmt`` (see ``EXPORT_FORMATS``) chunk by chunk.
+
+    The sink runs on a worker thread; at most ``max_pending`` written chunks
+    wait in memory. Closing the generator early (client disconnect) cancels
+    the sink.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}' (use {', '.join(EXPORT_FORMATS)})")
+    out: "queue.Queue" = queue.Queue(maxsize=max_pending)
+    cancelled = threading.Event()
+    failure: List[BaseException] = []
+
+    def run():
+        try:
+            getattr(lf, EXPORT_FORMATS[fmt][2])(_QueueWriter(out, cancelled))
+        except BaseException as e:  # surfaced to the consumer below
+            failure.append(e)
+        finally:
+            while not cancelled.is_set():
+                try:
+                    out.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    worker = threading.Thread(target=run, name="neurogabber-export", daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = out.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if failure and not cancelled.is_set():
+            raise failure[0]
+    finally:
+        cancelled.set()
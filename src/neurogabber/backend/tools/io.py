@@ -1,6 +1,9 @@
 import os, polars as pl
 from typing import List, Dict
 
+from .dtypes import widen
+from .ranking import top_k
+
 
 S3_BUCKET = os.getenv("S3_BUCKET")
 
@@ -20,9 +23,5 @@ def top_n_rois(df: pl.DataFrame, n: int = 20) -> List[Dict]:
     have = set(df.columns)
     needed = {"id","x","y","z","size_x","size_y","size_z"}
     assert needed.issubset(have), f"CSV missing columns: {needed - have}"
-    return (
-        df.with_columns((pl.col("size_x")*pl.col("size_y")*pl.col("size_z")).alias("vol"))
-        .sort("vol", descending=True)
-        .head(n)
-        .to_dicts()
-    )
\ No newline at end of file
+    vol = widen(df, ["size_x", "size_y", "size_z"]).with_columns((pl.col("size_x")*pl.col("size_y")*pl.col("size_z")).alias("vol"))
+    return top_k(vol, n, "vol", descending=True).to_dicts()
\ No newline at end of file
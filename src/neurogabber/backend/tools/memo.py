@@ -0,0 +1,71 @@
+"""
+Memoized results for read-only data tools.
+
+The model often repeats ``data_info`` / ``data_describe`` / ``data_preview``
+with identical arguments across turns. ``ToolMemo`` caches their results keyed
+by (tool, normalized args, source key); source keys carry the table version,
+so any change recorded in ``DataMemory`` makes older entries unreachable, and
+``invalidate`` drops them eagerly.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from .query import normalize
+
+
+class ToolMemo:
+    """LRU of tool results; hits return a copy so callers may mutate freely."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(tool: str, args: Dict[str, Any], source_key: Hashable) -> Tuple:
+        return (tool, normalize(args), source_key)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self, source_key_prefix: Tuple) -> None:
+        """Drop results whose source key starts with ``source_key_prefix``."""
+        n = len(source_key_prefix)
+        with self._lock:
+            for key in [k for k in self._entries if isinstance(k[2], tuple) and k[2][:n] == source_key_prefix]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+TOOL_MEMO = ToolMemo()
@@ -2,6 +2,8 @@ import json, os, uuid
 from typing import Dict, Any, Iterable
 from urllib.parse import quote, unquote
 
+from .annotation_index import AnnotationIndex
+
 
 #NEURO_BASE = os.getenv("NEUROGLANCER_BASE", "https://neuroglancer.github.io")
 NEURO_BASE = os.getenv("NEUROGLANCER_BASE", "https://neuroglancer-demo.appspot.com")
@@ -21,6 +23,8 @@ class NeuroglancerState:
       support both styles.
     - Idempotent behaviors (e.g. add_layer with an existing name) preserved.
     - Validation (layer type whitelist) retained.
+    - Inline annotations are reached through a lazily built, per-layer
+      ``AnnotationIndex`` (id -> position) so upserts/deletes are O(changes).
     """
 
     def __init__(self, data: Dict | None = None):
@@ -34,6 +38,7 @@ class NeuroglancerState:
                 "layout": "xy",
             }
         self.data = data
+        self._ann_indexes: Dict[str, AnnotationIndex] = {}
 
     # --- Core mutation helpers -------------------------------------------------
     def set_view(self, center: Dict[str, float], zoom: Any, orientation: str | None):
@@ -86,12 +91,53 @@ class NeuroglancerState:
                 break
         return self
 
-    def add_annotations(self, layer: str, items: Iterable[Dict]):
+    def set_layer_source(self, name: str, source: str | dict):
+        """Point an existing layer at a new source; adds an annotation layer if missing."""
+        for L in self.data.get("layers", []):
+            if L.get("name") == name:
+                L["source"] = source
+                return self
+        return self.add_layer(name, layer_type="annotation", source=source)
+
+    def annotation_index(self, layer: str, create: bool = False, build: bool = True) -> AnnotationIndex | None:
+        """Return the id index for an annotation layer's inline annotations.
+
+        The index is rebuilt if the layer's annotation list was replaced behind
+        our back (e.g. direct edits to ``self.data``). With ``create=True`` a
+        missing annotation layer is added; with ``build=False`` only an
+        up-to-date cached index is returned (None otherwise) and the layer is
+        left untouched.
+        """
         ann = next((L for L in self.data.get("layers", []) if L.get("type") == "annotation" and L.get("name") == layer), None)
         if not ann:
+            if not create:
+                return None
             ann = {"type": "annotation", "name": layer, "source": {"annotations": []}}
             self.data.setdefault("layers", []).append(ann)
-        ann["source"].setdefault("annotations", []).extend(items)
+        if not isinstance(ann.get("source"), dict):
+            raise ValueError(f"Annotation layer '{layer}' has a remote source; inline annotations are not editable")
+        index = self._ann_indexes.get(layer)
+        if not build:
+            return index if index is not None and index.items is ann["source"].get("annotations") else None
+        items = ann["source"].setdefault("annotations", [])
+        if index is None or index.items is not items:
+            index = AnnotationIndex(items)
+            self._ann_indexes[layer] = index
+        return index
+
+    def add_annotations(self, layer: str, items: Iterable[Dict]):
+        """Add annotations; an item whose id already exists replaces the old one."""
+        self.annotation_index(layer, create=True).upsert(items)
+        return self
+
+    def delete_annotations(self, layer: str, ids: Iterable[str]):
+        index = self.annotation_index(layer)
+        if index is not None:
+            index.delete(ids)
+        return self
+
+    def replace_annotations(self, layer: str, items: Iterable[Dict]):
+        self.annotation_index(layer, create=True).replace(items)
         return self
 
     # --- Serialization helpers -------------------------------------------------
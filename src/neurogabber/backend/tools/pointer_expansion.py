@@ -2,13 +2,23 @@
 Neuroglancer state pointer expansion utilities.
 
 Handles expansion of JSON pointers (s3://, gs://, http(s)://) in Neuroglancer URLs
-to canonical inline state URLs with percent-encoded JSON.
+to canonical inline state URLs with percent-encoded JSON. Pointer bodies are
+cached (TTL + ETag/Last-Modified revalidation) and storage clients are pooled.
 """
 
+import asyncio
 import json
-import urllib.parse
+import os
 import re
-from typing import Callable, Tuple, Any, Mapping, Optional
+import threading
+import time
+import urllib.error
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple, Any, Mapping, Optional
+
+from ..observability.timing import pointer_load
 
 try:
     import boto3  # Optional; only needed for direct s3:// fetch
@@ -23,6 +33,119 @@ except ImportError:
     _HAS_GCS = False
 
 
+POINTER_CACHE_TTL = float(os.getenv("NEUROGABBER_POINTER_CACHE_TTL", "300"))
+POINTER_CACHE_MAX_ENTRIES = int(os.getenv("NEUROGABBER_POINTER_CACHE_MAX_ENTRIES", "128"))
+POINTER_CACHE_MAX_BYTES = int(os.getenv("NEUROGABBER_POINTER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+POINTER_FETCH_TIMEOUT = float(os.getenv("NEUROGABBER_POINTER_TIMEOUT", "30"))
+POINTER_MAX_BYTES = int(os.getenv("NEUROGABBER_POINTER_MAX_BYTES", str(50 * 1024 * 1024)))
+_READ_CHUNK = 64 * 1024
+
+
+class PointerTooLarge(ValueError):
+    """Pointer body exceeds ``POINTER_MAX_BYTES``."""
+
+
+# -------- Pointer cache --------
+
+@dataclass
+class CachedPointer:
+    """Fetched pointer body plus the validators needed to revalidate it."""
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.text)
+
+
+class PointerCache:
+    """Size-bounded LRU of pointer bodies keyed by URL.
+
+    Entries younger than ``ttl`` seconds are served without touching the
+    network. Older entries are revalidated with their ETag / Last-Modified
+    (a 304-style answer only refreshes the timestamp); entries without
+    validators are refetched. Thread-safe: Panel sessions and the backend may
+    share one cache.
+    """
+
+    def __init__(self, ttl: float = POINTER_CACHE_TTL, max_entries: int = POINTER_CACHE_MAX_ENTRIES,
+                 max_bytes: int = POINTER_CACHE_MAX_BYTES, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries: "OrderedDict[str, CachedPointer]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.revalidated = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> Optional[CachedPointer]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def is_fresh(self, entry: CachedPointer) -> bool:
+        return self.clock() - entry.fetched_at < self.ttl
+
+    def put(self, url: str, entry: CachedPointer) -> CachedPointer:
+        entry.fetched_at = self.clock()
+        if entry.size > self.max_bytes:
+            return entry  # too big to keep; still usable by the caller
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[url] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    def touch(self, entry: CachedPointer) -> None:
+        entry.fetched_at = self.clock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.revalidated = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+        }
+
+
+POINTER_CACHE = PointerCache()
+
+# Storage clients are expensive to build (credential lookup, connection pool);
+# keep one per factory and reuse it across fetches.
+_CLIENTS: Dict[Tuple[str, Any], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _pooled_client(kind: str, factory: Callable[..., Any], *args) -> Any:
+    """Return the shared client built by ``factory(*args)``, creating it once."""
+    key = (kind, factory)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = factory(*args)
+        return client
+
+
 # -------- Core Helpers --------
 
 def _is_probably_json(text: str) -> bool:
@@ -50,34 +173,120 @@ def _fetch_http(url: str, http_get: Optional[Callable[[str], str]] = None) -> st
     # Default simple implementation
     import urllib.request
     with urllib.request.urlopen(url) as resp:
-        return resp.read().decode('utf-8')
+        _check_declared_size(resp.headers.get("Content-Length"), url)
+        return _read_bounded(resp.read, url).decode('utf-8')
+
+
+def _check_declared_size(size: Any, url: str) -> None:
+    """Reject early when the server/object metadata already reports an oversized body."""
+    if isinstance(size, str) and size.isdigit():
+        size = int(size)
+    if isinstance(size, int) and size > POINTER_MAX_BYTES:
+        raise PointerTooLarge(f"Pointer '{url}' is {size} bytes; limit is {POINTER_MAX_BYTES}")
+
+
+def _read_bounded(read: Callable[[int], bytes], url: str) -> bytes:
+    """Read a stream chunk by chunk, aborting as soon as the limit is crossed."""
+    buf = bytearray()
+    while True:
+        chunk = read(_READ_CHUNK)
+        if not chunk:
+            return bytes(buf)
+        buf += chunk
+        if len(buf) > POINTER_MAX_BYTES:
+            raise PointerTooLarge(f"Pointer '{url}' exceeds {POINTER_MAX_BYTES} bytes")
+
+
+def _fetch_http_conditional(url: str, cached: Optional[CachedPointer] = None) -> Optional[CachedPointer]:
+    """GET with If-None-Match / If-Modified-Since; returns None on 304.
+
+    The body is streamed and bounded by ``POINTER_MAX_BYTES`` (Content-Length
+    is checked before reading).
+    """
+    import urllib.request
+    req = urllib.request.Request(url)
+    if cached is not None:
+        if cached.etag:
+            req.add_header("If-None-Match", cached.etag)
+        if cached.last_modified:
+            req.add_header("If-Modified-Since", cached.last_modified)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            _check_declared_size(resp.headers.get("Content-Length"), url)
+            return CachedPointer(
+                text=_read_bounded(resp.read, url).decode('utf-8'),
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+            )
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached is not None:
+            return None
+        raise
+
+
+def _split_bucket_url(url: str, scheme: str) -> Tuple[str, str]:
+    m = re.match(rf'^{scheme}://([^/]+)/(.+)$', url)
+    if not m:
+        raise ValueError(f"Not a valid {scheme} URL: {url}")
+    return m.group(1), m.group(2)
 
 
 def _fetch_s3(url: str) -> str:
     """Fetch s3://bucket/key using boto3 (if available)."""
+    return _fetch_s3_conditional(url).text
+
+
+def _fetch_s3_conditional(url: str, cached: Optional[CachedPointer] = None) -> Optional[CachedPointer]:
+    """Fetch s3://bucket/key, sending the cached ETag; returns None if unchanged."""
     if not _HAS_BOTO3:
         raise RuntimeError("boto3 not installed; install boto3 or provide a custom fetcher.")
-    m = re.match(r'^s3://([^/]+)/(.+)$', url)
-    if not m:
-        raise ValueError(f"Not a valid s3 URL: {url}")
-    bucket, key = m.group(1), m.group(2)
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    return obj['Body'].read().decode('utf-8')
+    bucket, key = _split_bucket_url(url, "s3")
+    s3 = _pooled_client("s3", boto3.client, 's3')
+    kwargs = {"Bucket": bucket, "Key": key}
+    if cached is not None and cached.etag:
+        kwargs["IfNoneMatch"] = cached.etag
+    try:
+        obj = s3.get_object(**kwargs)
+    except Exception as e:
+        # botocore raises ClientError with code 304 / NotModified for a matching ETag
+        code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+        if cached is not None and code in ("304", "NotModified"):
+            return None
+        raise
+    _check_declared_size(obj.get('ContentLength'), url)
+    # bounded even if ContentLength is missing or wrong
+    return CachedPointer(text=_read_bounded(obj['Body'].read, url).decode('utf-8'), etag=obj.get('ETag'))
 
 
 def _fetch_gs(url: str) -> str:
     """Fetch gs://bucket/key using google-cloud-storage (if available)."""
+    return _fetch_gs_conditional(url).text
+
+
+def _fetch_gs_conditional(url: str, cached: Optional[CachedPointer] = None) -> Optional[CachedPointer]:
+    """Fetch gs://bucket/key; if the blob generation matches the cache returns None.
+
+    Blob metadata is loaded first, so an oversized object is rejected before
+    any of it is downloaded; the body is then streamed and bounded.
+    """
     if not _HAS_GCS:
         raise RuntimeError("google-cloud-storage not installed; install google-cloud-storage or provide a custom fetcher.")
-    m = re.match(r'^gs://([^/]+)/(.+)$', url)
-    if not m:
-        raise ValueError(f"Not a valid gs URL: {url}")
-    bucket_name, blob_name = m.group(1), m.group(2)
-    client = gcs.Client()
+    bucket_name, blob_name = _split_bucket_url(url, "gs")
+    client = _pooled_client("gs", gcs.Client)
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
-    return blob.download_as_text()
+    blob.reload()  # metadata only
+    generation = getattr(blob, "generation", None)
+    if not isinstance(generation, int):
+        generation = None
+    if cached is not None and cached.etag and str(generation) == cached.etag:
+        return None
+    _check_declared_size(blob.size, url)
+    # pin the generation we sized, so a concurrent overwrite can't slip past the check
+    kwargs = {"if_generation_match": generation} if generation is not None else {}
+    with blob.open("rb", **kwargs) as fh:
+        text = _read_bounded(fh.read, url).decode('utf-8')
+    return CachedPointer(text=text, etag=str(generation) if generation is not None else None)
 
 
 def _default_fetch(url: str) -> str:
@@ -92,6 +301,115 @@ def _default_fetch(url: str) -> str:
         raise ValueError(f"Unsupported pointer scheme for URL fetch: {url}")
 
 
+def _conditional_fetcher(url: str) -> Callable[[str, Optional[CachedPointer]], Optional[CachedPointer]]:
+    if url.startswith('s3://'):
+        return _fetch_s3_conditional
+    if url.startswith('gs://'):
+        return _fetch_gs_conditional
+    if url.startswith('http://') or url.startswith('https://'):
+        return _fetch_http_conditional
+    raise ValueError(f"Unsupported pointer scheme for URL fetch: {url}")
+
+
+def _cached_fetch(url: str, cache: Optional[PointerCache] = None) -> str:
+    """Fetch through ``cache`` (default: the module-wide ``POINTER_CACHE``).
+
+    Fresh entries are returned without I/O; stale ones are revalidated.
+    """
+    return _cached_fetch_source(url, cache)[0]
+
+
+def _cached_fetch_source(url: str, cache: Optional[PointerCache] = None) -> Tuple[str, str]:
+    """``_cached_fetch`` that also reports where the body came from
+    ("cache", "revalidated" or "network")."""
+    cache = POINTER_CACHE if cache is None else cache
+    fetch = _conditional_fetcher(url)
+    entry = cache.get(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.hits += 1
+        return entry.text, "cache"
+    fresh = fetch(url, entry)
+    if fresh is None:
+        cache.revalidated += 1
+        cache.touch(entry)
+        return entry.text, "revalidated"
+    cache.misses += 1
+    return cache.put(url, fresh).text, "network"
+
+
+# -------- Async fetch (server-side expansion) --------
+
+async def _fetch_http_conditional_async(url: str, cached: Optional[CachedPointer] = None) -> Optional[CachedPointer]:
+    """Non-blocking counterpart of ``_fetch_http_conditional`` (httpx)."""
+    import httpx
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    async with httpx.AsyncClient(follow_redirects=True, timeout=POINTER_FETCH_TIMEOUT) as client:
+        async with client.stream("GET", url, headers=headers) as resp:
+            if resp.status_code == 304 and cached is not None:
+                return None
+            resp.raise_for_status()
+            _check_declared_size(resp.headers.get("Content-Length"), url)
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes(_READ_CHUNK):
+                buf += chunk
+                if len(buf) > POINTER_MAX_BYTES:
+                    raise PointerTooLarge(f"Pointer '{url}' exceeds {POINTER_MAX_BYTES} bytes")
+            return CachedPointer(
+                text=buf.decode(resp.encoding or 'utf-8'),
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+            )
+
+
+async def _conditional_fetch_async(url: str, cached: Optional[CachedPointer]) -> Optional[CachedPointer]:
+    if url.startswith('http://') or url.startswith('https://'):
+        return await _fetch_http_conditional_async(url, cached)
+    # boto3 / google-cloud-storage are blocking; keep them off the event loop.
+    return await asyncio.to_thread(_conditional_fetcher(url), url, cached)
+
+
+# Concurrent requests for the same pointer share one fetch.
+_INFLIGHT: Dict[str, "asyncio.Future[Tuple[str, str]]"] = {}
+
+
+async def cached_fetch_async(url: str, cache: Optional[PointerCache] = None,
+                             timeout: float | None = None) -> str:
+    """Async ``_cached_fetch``: shared cache, per-URL request coalescing, timeout."""
+    return (await _cached_fetch_async_source(url, cache, timeout))[0]
+
+
+async def _cached_fetch_async_source(url: str, cache: Optional[PointerCache] = None,
+                                     timeout: float | None = None) -> Tuple[str, str]:
+    cache = POINTER_CACHE if cache is None else cache
+    entry = cache.get(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.hits += 1
+        return entry.text, "cache"
+    pending = _INFLIGHT.get(url)
+    if pending is not None:
+        return (await asyncio.shield(pending))[0], "coalesced"
+
+    async def _fetch() -> Tuple[str, str]:
+        fresh = await _conditional_fetch_async(url, entry)
+        if fresh is None:
+            cache.revalidated += 1
+            cache.touch(entry)
+            return entry.text, "revalidated"
+        cache.misses += 1
+        return cache.put(url, fresh).text, "network"
+
+    task = asyncio.ensure_future(asyncio.wait_for(_fetch(), timeout or POINTER_FETCH_TIMEOUT))
+    _INFLIGHT[url] = task
+    # shield: a cancelled caller must not cancel the fetch other callers await
+    task.add_done_callback(lambda t: _INFLIGHT.pop(url) if _INFLIGHT.get(url) is t else None)
+    return await asyncio.shield(task)
+
+
 # -------- Public API --------
 
 def resolve_neuroglancer_pointer(
@@ -106,7 +424,8 @@ def resolve_neuroglancer_pointer(
     fragment : str
         Either inline (percent-encoded) JSON or a pointer URL (http(s)://, s3://, gs://).
     fetcher : callable, optional
-        Custom fetcher(url) -> text. If not provided, uses default logic.
+        Custom fetcher(url) -> text. If not provided, pointers are fetched
+        through the shared ``POINTER_CACHE`` (TTL + ETag revalidation).
 
     Returns
     -------
@@ -133,17 +452,48 @@ def resolve_neuroglancer_pointer(
             raise ValueError(f"Fragment looked like JSON but failed to parse: {e}") from e
 
     # Case 2: Pointer (URL to JSON)
-    fetcher = fetcher or _default_fetch
-    try:
-        json_text = fetcher(decoded)
-    except Exception as e:
-        raise ValueError(f"Failed to fetch content from pointer '{decoded}': {e}") from e
-    
+    with pointer_load(decoded) as load:
+        try:
+            if fetcher is None:
+                json_text, load.source = _cached_fetch_source(decoded)
+            else:
+                json_text, load.source = fetcher(decoded), "custom"
+        except PointerTooLarge:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to fetch content from pointer '{decoded}': {e}") from e
+        load.size_bytes = len(json_text)
+        return _parse_pointer_text(json_text, decoded), True
+
+
+def _parse_pointer_text(json_text: str, pointer: str) -> dict:
     try:
-        state = json.loads(json_text)
+        return json.loads(json_text)
     except json.JSONDecodeError as e:
-        raise ValueError(f"Fetched text is not valid JSON from pointer '{decoded}': {e}") from e
-    return state, True
+        raise ValueError(f"Fetched text is not valid JSON from pointer '{pointer}': {e}") from e
+
+
+async def resolve_neuroglancer_pointer_async(fragment: str, timeout: float | None = None) -> Tuple[dict, bool]:
+    """Async variant of ``resolve_neuroglancer_pointer`` using non-blocking fetchers.
+
+    Fetches go through the shared ``POINTER_CACHE``; concurrent calls for the
+    same pointer are coalesced into one request. Raises ``ValueError`` on fetch
+    failure or timeout.
+    """
+    decoded = _percent_decode(fragment)
+    if _is_probably_json(decoded):
+        return resolve_neuroglancer_pointer(fragment)
+    with pointer_load(decoded) as load:
+        try:
+            json_text, load.source = await _cached_fetch_async_source(decoded, timeout=timeout)
+        except asyncio.TimeoutError as e:
+            raise ValueError(f"Timed out fetching pointer '{decoded}'") from e
+        except PointerTooLarge:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to fetch content from pointer '{decoded}': {e}") from e
+        load.size_bytes = len(json_text)
+        return _parse_pointer_text(json_text, decoded), True
 
 
 def neuroglancer_state_to_url(
@@ -206,21 +556,28 @@ def expand_if_pointer_and_generate_inline(
     RuntimeError
         If required cloud storage libraries are missing
     """
-    # Split base and fragment
+    base, fragment = _split_viewer_url(full_url)
+    state, was_pointer = resolve_neuroglancer_pointer(fragment, fetcher=fetcher)
+    canonical = neuroglancer_state_to_url(state, base)
+    return canonical, state, was_pointer
+
+
+async def expand_if_pointer_async(full_url: str, timeout: float | None = None) -> Tuple[str, dict, bool]:
+    """Async ``expand_if_pointer_and_generate_inline`` (never blocks the event loop)."""
+    base, fragment = _split_viewer_url(full_url)
+    state, was_pointer = await resolve_neuroglancer_pointer_async(fragment, timeout=timeout)
+    return neuroglancer_state_to_url(state, base), state, was_pointer
+
+
+def _split_viewer_url(full_url: str) -> Tuple[str, str]:
+    """Split into (viewer base, fragment); a missing base falls back to the demo viewer."""
     if '#!' in full_url:
         base, fragment = full_url.split('#!', 1)
     else:
         # If only fragment provided
         base, fragment = '', full_url.lstrip('#!')
-    
-    state, was_pointer = resolve_neuroglancer_pointer(fragment, fetcher=fetcher)
-    
     # Use provided base URL or fall back to a default
-    if not base:
-        base = "https://neuroglancer-demo.appspot.com"
-    
-    canonical = neuroglancer_state_to_url(state, base)
-    return canonical, state, was_pointer
+    return base or "https://neuroglancer-demo.appspot.com", fragment
 
 
 def is_pointer_url(url: str) -> bool:
@@ -0,0 +1,369 @@
+"""
+Writer for Neuroglancer's precomputed annotation format.
+
+Large annotation sets (e.g. thousands of detected cells from an uploaded table)
+are written to disk as a precomputed annotation source instead of being
+inlined into ``source.annotations``. The backend serves the directory
+statically, and the state only carries a constant-size
+``precomputed://http://...`` source URL. Neuroglancer then fetches just the
+spatial index chunks that intersect the current view.
+
+Layout written:
+
+    <out_dir>/info
+    <out_dir>/by_id/<id>                  (fewer than BY_ID_SHARD_MIN annotations)
+    <out_dir>/by_id/<shard>.shard         (otherwise; uint64 sharded, identity hash)
+    <out_dir>/spatial<level>/<ix>_<iy>_<iz>
+
+The sharded ``by_id`` index packs all annotations into a handful of shard
+files (about 256 annotations per minishard), so large sets don't cost one tiny
+file per annotation.
+
+See https://github.com/google/neuroglancer/blob/master/src/datasource/precomputed/annotations.md
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import shutil
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+ANNOTATION_INFO_TYPE = "neuroglancer_annotations_v1"
+SHARDING_TYPE = "neuroglancer_uint64_sharded_v1"
+# below this many annotations by_id stays one file per annotation
+BY_ID_SHARD_MIN = 4096
+_PER_MINISHARD = 256
+_MAX_MINISHARD_BITS = 8
+_PROPERTY_ID_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _property_id(column: str) -> str:
+    """Map a column name to a valid annotation property id (``^[a-z][a-zA-Z0-9_]*$``)."""
+    pid = _PROPERTY_ID_RE.sub("_", column)
+    if not pid or not pid[0].isalpha():
+        pid = "p_" + pid
+    return pid[0].lower() + pid[1:]
+
+
+def _property_dtype(values: np.ndarray) -> str:
+    """Pick a 4-byte property type so records never need padding."""
+    if np.issubdtype(values.dtype, np.integer):
+        info = np.iinfo(np.int32)
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return "int32"
+    return "float32"
+
+
+def _record_dtype(rank: int, properties: Sequence[dict]) -> np.dtype:
+    """Little-endian structured dtype for one encoded annotation (point geometry + properties)."""
+    fields = [("geometry", "<f4", (rank,))]
+    for prop in properties:
+        fields.append((prop["id"], "<i4" if prop["type"] == "int32" else "<f4"))
+    return np.dtype(fields)
+
+
+def _encode_records(
+    points: np.ndarray,
+    props: Mapping[str, np.ndarray],
+    properties: Sequence[dict],
+    idx: np.ndarray,
+) -> np.ndarray:
+    rec = np.zeros(len(idx), dtype=_record_dtype(points.shape[1], properties))
+    rec["geometry"] = points[idx]
+    for prop in properties:
+        rec[prop["id"]] = props[prop["id"]][idx]
+    return rec
+
+
+def _level_keys(points: np.ndarray, lower: np.ndarray, chunk: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Cell coordinates of each point in a level grid, clipped to the grid."""
+    cells = np.floor((points - lower) / chunk).astype(np.int64)
+    return np.clip(cells, 0, grid - 1)
+
+
+def _sharding_spec(n: int) -> dict:
+    bits = max(0, math.ceil(math.log2(max(n, 1) / _PER_MINISHARD)))
+    minishard_bits = min(bits, _MAX_MINISHARD_BITS)
+    return {
+        "@type": SHARDING_TYPE,
+        "preshift_bits": 0,
+        "hash": "identity",
+        "minishard_bits": minishard_bits,
+        "shard_bits": bits - minishard_bits,
+        "minishard_index_encoding": "raw",
+        "data_encoding": "raw",
+    }
+
+
+def _shard_location(ids: np.ndarray, spec: Mapping) -> tuple:
+    """(shard, minishard) of each id under an identity-hash sharding spec."""
+    hashed = ids >> np.uint64(spec["preshift_bits"])
+    minishard = hashed & np.uint64((1 << spec["minishard_bits"]) - 1)
+    shard = (hashed >> np.uint64(spec["minishard_bits"])) & np.uint64((1 << spec["shard_bits"]) - 1)
+    return shard, minishard
+
+
+def _shard_name(shard: int, spec: Mapping) -> str:
+    return f"{shard:0{math.ceil(spec['shard_bits'] / 4)}x}.shard"
+
+
+def _write_sharded(out_dir: str, ids: np.ndarray, records: np.ndarray, spec: Mapping) -> None:
+    """Write ``records[i]`` under key ``ids[i]`` as uint64 sharded shard files.
+
+    Each shard is its shard index (``2**minishard_bits`` [start, end) pairs),
+    then the records ordered by (minishard, id), then the raw minishard
+    indexes; all offsets are relative to the end of the shard index.
+    """
+    shard, minishard = _shard_location(ids, spec)
+    order = np.lexsort((ids, minishard, shard))
+    shard, minishard, ids = shard[order], minishard[order], ids[order]
+    size = records.dtype.itemsize
+    n_minishards = 1 << spec["minishard_bits"]
+    bounds = np.flatnonzero(np.r_[True, shard[1:] != shard[:-1], True])
+    for s0, s1 in zip(bounds[:-1], bounds[1:]):
+        data = records[order[s0:s1]].tobytes()
+        shard_index = np.zeros((n_minishards, 2), dtype="<u8")
+        minishard_indexes = []
+        cursor = len(data)
+        ms = minishard[s0:s1]
+        ms_bounds = np.flatnonzero(np.r_[True, ms[1:] != ms[:-1], True])
+        for m0, m1 in zip(ms_bounds[:-1], ms_bounds[1:]):
+            index = np.zeros((3, m1 - m0), dtype="<u8")
+            index[0] = np.diff(ids[s0 + m0:s0 + m1], prepend=np.uint64(0))
+            index[1, 0] = m0 * size  # records are contiguous: later deltas stay 0
+            index[2] = size
+            raw = index.tobytes()
+            shard_index[int(ms[m0])] = (cursor, cursor + len(raw))
+            minishard_indexes.append(raw)
+            cursor += len(raw)
+        with open(os.path.join(out_dir, _shard_name(int(shard[s0]), spec)), "wb") as fh:
+            fh.write(shard_index.tobytes())
+            fh.write(data)
+            fh.write(b"".join(minishard_indexes))
+
+
+def write_point_annotations(
+    out_dir: str,
+    points: np.ndarray,
+    ids: Optional[np.ndarray] = None,
+    properties: Optional[Mapping[str, np.ndarray]] = None,
+    dimensions: Optional[Mapping[str, list]] = None,
+    limit: int = 1000,
+    max_levels: int = 8,
+    seed: int = 0,
+    by_id_shard_min: int = BY_ID_SHARD_MIN,
+) -> Dict:
+    """Write point annotations as a precomputed annotation source.
+
+    Parameters
+    ----------
+    out_dir : str
+        Target directory (created if missing).
+    points : ndarray, shape (N, 3)
+        Annotation coordinates, in the same units as ``dimensions``.
+    ids : ndarray of uint64, optional
+        Annotation ids; defaults to ``0..N-1``.
+    properties : mapping, optional
+        Column name -> 1-D numeric array; stored as float32/int32 properties.
+    dimensions : mapping, optional
+        Neuroglancer coordinate space for x, y, z (defaults to 1 nm voxels).
+    limit : int
+        Maximum annotations per spatial chunk at every level except the last.
+    max_levels : int
+        Upper bound on spatial index levels; the final level takes all
+        remaining annotations.
+    seed : int
+        Seed for the random level assignment (Neuroglancer expects each chunk
+        to hold a uniform random sample of what is left).
+    by_id_shard_min : int
+        From this many annotations on the ``by_id`` index is sharded.
+
+    Returns
+    -------
+    dict
+        The ``info`` JSON that was written.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError(f"points must have shape (N, 3), got {points.shape}")
+    n = points.shape[0]
+    if n == 0:
+        raise ValueError("No annotations to write")
+    if not np.isfinite(points).all():
+        raise ValueError("points contain NaN or infinite coordinates")
+    ids = np.arange(n, dtype=np.uint64) if ids is None else np.asarray(ids, dtype=np.uint64)
+    if ids.shape != (n,):
+        raise ValueError("ids must be a 1-D array with one entry per point")
+    limit = max(1, int(limit))
+
+    prop_specs: List[dict] = []
+    prop_values: Dict[str, np.ndarray] = {}
+    for col, values in (properties or {}).items():
+        values = np.asarray(values)
+        pid = base = _property_id(col)
+        n_dup = 1
+        while pid in prop_values:  # e.g. "a-b" and "a_b"; the description keeps the column name
+            n_dup += 1
+            pid = f"{base}_{n_dup}"
+        ptype = _property_dtype(values)
+        prop_specs.append({"id": pid, "type": ptype, "description": col})
+        prop_values[pid] = values.astype(np.int32 if ptype == "int32" else np.float32)
+
+    dims = dimensions or {"x": [1e-9, "m"], "y": [1e-9, "m"], "z": [1e-9, "m"]}
+    lower = np.floor(points.min(axis=0))
+    upper = np.floor(points.max(axis=0)) + 1.0
+    extent = upper - lower
+
+    os.makedirs(os.path.join(out_dir, "by_id"), exist_ok=True)
+
+    # by_id: single annotation encoding (no relationships -> nothing appended)
+    all_idx = np.arange(n)
+    records = _encode_records(points, prop_values, prop_specs, all_idx)
+    by_id_dir = os.path.join(out_dir, "by_id")
+    by_id_spec: Dict = {"key": "by_id"}
+    if n >= by_id_shard_min:
+        by_id_spec["sharding"] = _sharding_spec(n)
+        _write_sharded(by_id_dir, ids, records, by_id_spec["sharding"])
+    else:
+        for i in range(n):
+            with open(os.path.join(by_id_dir, str(int(ids[i]))), "wb") as fh:
+                fh.write(records[i].tobytes())
+
+    # spatial index: coarse-to-fine levels, each chunk keeps <= limit of the
+    # annotations still unassigned (in shuffled order)
+    rng = np.random.default_rng(seed)
+    remaining = rng.permutation(n)
+    grid = np.ones(3, dtype=np.int64)
+    spatial_specs = []
+    for level in range(max_levels):
+        chunk = extent / grid
+        cells = _level_keys(points[remaining], lower, chunk, grid)
+        keys = (cells[:, 0] * grid[1] + cells[:, 1]) * grid[2] + cells[:, 2]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        counts = np.diff(np.r_[starts, len(sorted_keys)])
+        is_last = level == max_levels - 1
+        if is_last:
+            take = np.ones(len(order), dtype=bool)
+        else:
+            rank = np.arange(len(order)) - np.repeat(starts, counts)
+            take = rank < limit
+
+        level_key = f"spatial{level}"
+        level_dir = os.path.join(out_dir, level_key)
+        os.makedirs(level_dir, exist_ok=True)
+        taken_sorted = order[take]
+        taken_keys = sorted_keys[take]
+        bounds = np.flatnonzero(np.r_[True, taken_keys[1:] != taken_keys[:-1], True])
+        for b0, b1 in zip(bounds[:-1], bounds[1:]):
+            idx = remaining[taken_sorted[b0:b1]]
+            key = int(taken_keys[b0])
+            cx, cy, cz = key // (grid[1] * grid[2]), (key // grid[2]) % grid[1], key % grid[2]
+            with open(os.path.join(level_dir, f"{cx}_{cy}_{cz}"), "wb") as fh:
+                fh.write(np.uint64(len(idx)).astype("<u8").tobytes())
+                fh.write(_encode_records(points, prop_values, prop_specs, idx).tobytes())
+                fh.write(ids[idx].astype("<u8").tobytes())
+
+        spatial_specs.append({
+            "key": level_key,
+            "grid_shape": grid.tolist(),
+            "chunk_size": chunk.tolist(),
+            "limit": int(counts.max()) if is_last else limit,
+        })
+        remaining = remaining[order[~take]]
+        if remaining.size == 0:
+            break
+        # refine only along axes that have extent
+        grid = np.where(extent > 1.0, grid * 2, grid)
+    if remaining.size:  # pragma: no cover - last level always takes everything
+        raise RuntimeError("spatial index did not assign every annotation")
+
+    info = {
+        "@type": ANNOTATION_INFO_TYPE,
+        "dimensions": {k: list(dims[k]) for k in ("x", "y", "z")},
+        "lower_bound": lower.tolist(),
+        "upper_bound": upper.tolist(),
+        "annotation_type": "point",
+        "properties": prop_specs,
+        "relationships": [],
+        "by_id": by_id_spec,
+        "spatial": spatial_specs,
+    }
+    with open(os.path.join(out_dir, "info"), "w", encoding="utf-8") as fh:
+        json.dump(info, fh)
+    return info
+
+
+def read_annotation_chunk(path: str, info: Mapping) -> Dict[str, np.ndarray]:
+    """Decode one spatial chunk (multiple annotation encoding) written above.
+
+    Mainly useful for tests and debugging.
+    """
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    count = int(np.frombuffer(raw[:8], dtype="<u8")[0])
+    dtype = _record_dtype(len(info["dimensions"]), info.get("properties", []))
+    rec_end = 8 + count * dtype.itemsize
+    records = np.frombuffer(raw[8:rec_end], dtype=dtype)
+    ids = np.frombuffer(raw[rec_end:rec_end + 8 * count], dtype="<u8")
+    return {"points": records["geometry"], "ids": ids, "records": records}
+
+
+def read_annotation_by_id(out_dir: str, info: Mapping, ann_id: int) -> Optional[np.void]:
+    """Look up one annotation record in the ``by_id`` index (sharded or not).
+
+    Mainly useful for tests and debugging; returns None for unknown ids.
+    """
+    dtype = _record_dtype(len(info["dimensions"]), info.get("properties", []))
+    by_id_dir = os.path.join(out_dir, info["by_id"]["key"])
+    spec = info["by_id"].get("sharding")
+    if spec is None:
+        path = os.path.join(by_id_dir, str(int(ann_id)))
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as fh:
+            return np.frombuffer(fh.read(dtype.itemsize), dtype=dtype)[0]
+    shard, minishard = (int(v[0]) for v in _shard_location(np.array([ann_id], dtype=np.uint64), spec))
+    path = os.path.join(by_id_dir, _shard_name(shard, spec))
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    header = 16 << spec["minishard_bits"]
+    start, end = np.frombuffer(raw[16 * minishard:16 * minishard + 16], dtype="<u8")
+    index = np.frombuffer(raw[header + int(start):header + int(end)], dtype="<u8").reshape(3, -1)
+    chunk_ids = np.cumsum(index[0], dtype=np.uint64)
+    sizes = index[2]
+    starts = np.cumsum(index[1], dtype=np.uint64) + np.r_[np.uint64(0), np.cumsum(sizes[:-1], dtype=np.uint64)]
+    hit = np.flatnonzero(chunk_ids == np.uint64(ann_id))
+    if hit.size == 0:
+        return None
+    offset = header + int(starts[hit[0]])
+    return np.frombuffer(raw[offset:offset + int(sizes[hit[0]])], dtype=dtype)[0]
+
+
+def evict_sources(root: str, keep: int, protect: Iterable[str] = ()) -> List[str]:
+    """Remove the least recently used source directories under ``root`` beyond ``keep``.
+
+    Directories named in ``protect`` and in-progress ones (leading ``.``)
+    are never removed. Returns the names removed.
+    """
+    protect = set(protect)
+    try:
+        entries = [e for e in os.scandir(root) if e.is_dir() and not e.name.startswith(".")]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    removed = []
+    for entry in entries[max(0, keep):]:
+        if entry.name in protect:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.name)
+    return removed
@@ -0,0 +1,355 @@
+"""
+Filter / expression grammar for the data tools, compiled to Polars expressions.
+
+Queries run on ``LazyFrame`` scans so Polars can push predicates, projections
+and limits down to the on-disk Arrow IPC files; only the referenced columns are
+read.
+
+Filters (a top-level list is AND-combined)::
+
+    {"column": "x", "op": ">", "value": 10}          # == != > < >= <=
+    {"column": "region", "op": "in", "value": ["CA1", "CA3"]}   # also not_in
+    {"column": "z", "op": "between", "value": [0, 100]}         # inclusive
+    {"column": "label", "op": "is_null"}                        # also is_not_null
+    {"column": "name", "op": "contains", "value": "soma"}
+    {"any": [<filter>, ...]}    # OR group (nestable; "all" for AND)
+
+Computed columns are arithmetic/boolean expressions over column names::
+
+    {"name": "ratio", "expr": "intensity / area"}
+    {"name": "r", "expr": "sqrt(x**2 + y**2)"}
+
+Expressions are parsed with ``ast`` and only whitelisted node types and
+functions are accepted; nothing is evaluated as Python.
+
+``run_sql`` executes one read-only SQL statement over named lazy tables via
+``pl.SQLContext`` (streaming engine); ``sql_plan`` returns the unexecuted plan.
+SQL and computed columns see narrow ingest dtypes widened (``dtypes.widen``).
+"""
+
+from __future__ import annotations
+
+import ast
+import functools
+import json
+import operator
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import polars as pl
+
+from .dtypes import widen
+
+
+class QueryError(ValueError):
+    """Invalid filter, computed column or column reference."""
+
+
+_COMPARE = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+FILTER_OPS = [*_COMPARE, "in", "not_in", "between", "is_null", "is_not_null", "contains"]
+
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_CMPOPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Gt: operator.gt,
+    ast.Lt: operator.lt,
+    ast.GtE: operator.ge,
+    ast.LtE: operator.le,
+}
+_FUNCS = {
+    "abs": lambda e: e.abs(),
+    "sqrt": lambda e: e.sqrt(),
+    "log": lambda e: e.log(),
+    "log10": lambda e: e.log10(),
+    "exp": lambda e: e.exp(),
+    "floor": lambda e: e.floor(),
+    "ceil": lambda e: e.ceil(),
+    "round": lambda e, d=0: e.round(int(d)),
+    "min": lambda *es: pl.min_horizontal(*es),
+    "max": lambda *es: pl.max_horizontal(*es),
+    "is_null": lambda e: e.is_null(),
+}
+
+
+def _lit(value: Any) -> pl.Expr:
+    return value if isinstance(value, pl.Expr) else pl.lit(value)
+
+
+class _ExprCompiler:
+    """Compile one expression string; records the columns it references."""
+
+    def __init__(self, known: Set[str]):
+        self.known = known
+        self.columns: Set[str] = set()
+
+    def compile(self, text: str) -> pl.Expr:
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError as e:
+            raise QueryError(f"Invalid expression '{text}': {e.msg}") from e
+        return _lit(self._node(tree.body))
+
+    def _node(self, node: ast.AST):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in self.known:
+                raise QueryError(f"Unknown column '{node.id}' in expression")
+            self.columns.add(node.id)
+            return pl.col(node.id)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            return _BINOPS[type(node.op)](_lit(self._node(node.left)), _lit(self._node(node.right)))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -_lit(self._node(node.operand))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ~_lit(self._node(node.operand))
+        if isinstance(node, ast.BoolOp):
+            combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+            return functools.reduce(combine, [_lit(self._node(v)) for v in node.values])
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _CMPOPS:
+            return _CMPOPS[type(node.ops[0])](_lit(self._node(node.left)), _lit(self._node(node.comparators[0])))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCS and not node.keywords:
+            args = [self._node(a) for a in node.args]
+            if node.func.id in ("min", "max"):
+                args = [_lit(a) for a in args]
+            elif args:
+                args[0] = _lit(args[0])
+            try:
+                return _FUNCS[node.func.id](*args)
+            except TypeError as e:
+                raise QueryError(f"Bad arguments to {node.func.id}(): {e}") from e
+        raise QueryError(f"Unsupported syntax in expression: {ast.dump(node)[:60]}")
+
+
+def _column(name: Any, known: Set[str], used: Set[str]) -> pl.Expr:
+    if name not in known:
+        raise QueryError(f"Filter column not in dataframe: {name}")
+    used.add(name)
+    return pl.col(name)
+
+
+def compile_filter(spec: Any, known: Set[str], used: Set[str]) -> pl.Expr:
+    """Compile one filter node (see module docstring) into a boolean expression."""
+    if isinstance(spec, list):
+        spec = {"all": spec}
+    if not isinstance(spec, dict):
+        raise QueryError(f"Filter must be an object, got {type(spec).__name__}")
+    for group, combine in (("all", operator.and_), ("any", operator.or_)):
+        if group in spec:
+            parts = spec[group]
+            if not isinstance(parts, list) or not parts:
+                raise QueryError(f"'{group}' must be a non-empty list of filters")
+            return functools.reduce(combine, [compile_filter(p, known, used) for p in parts])
+    op = spec.get("op")
+    col = _column(spec.get("column"), known, used)
+    value = spec.get("value")
+    if op in _COMPARE:
+        return _COMPARE[op](col, value)
+    if op in ("in", "not_in"):
+        if not isinstance(value, list):
+            raise QueryError(f"'{op}' needs a list value")
+        expr = col.is_in(value)
+        return ~expr if op == "not_in" else expr
+    if op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise QueryError("'between' needs [low, high]")
+        return col.is_between(value[0], value[1], closed="both")
+    if op == "is_null":
+        return col.is_null()
+    if op == "is_not_null":
+        return col.is_not_null()
+    if op == "contains":
+        return col.cast(pl.Utf8).str.contains(str(value), literal=True)
+    raise QueryError(f"Unsupported op {op}")
+
+
+def normalize(spec: Any) -> str:
+    """Canonical JSON for a query spec (stable cache key)."""
+    return json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+
+
+@dataclass
+class CompiledQuery:
+    """Expressions for one normalized query, independent of the source data."""
+    predicate: Optional[pl.Expr]
+    computed: List[pl.Expr]
+    columns: Optional[List[str]]  # output projection (None = all)
+    sort_by: Optional[str]
+    descending: bool
+    limit: Optional[int]
+    referenced: Set[str]
+
+    def apply(self, lf: pl.LazyFrame) -> pl.LazyFrame:
+        """Build the plan; Polars pushes the filter, projection and limit into the scan."""
+        if self.computed:
+            # narrow storage dtypes would wrap / reject arithmetic, so compute in wide ones
+            lf = widen(lf, self.referenced).with_columns(self.computed)
+        if self.predicate is not None:
+            lf = lf.filter(self.predicate)
+        if self.sort_by:
+            lf = lf.sort(self.sort_by, descending=self.descending, nulls_last=True)
+        if self.columns:
+            lf = lf.select(self.columns)
+        if self.limit is not None:
+            lf = lf.head(self.limit)
+        return lf
+
+
+def compile_query(
+    schema_names: Sequence[str],
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Any] = None,
+    computed: Optional[Sequence[Dict[str, str]]] = None,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> CompiledQuery:
+    known = set(schema_names)
+    referenced: Set[str] = set()
+    computed_exprs = []
+    for item in computed or []:
+        name, text = (item or {}).get("name"), (item or {}).get("expr")
+        if not name or not isinstance(text, str):
+            raise QueryError("Computed columns need 'name' and 'expr'")
+        comp = _ExprCompiler(known)
+        computed_exprs.append(comp.compile(text).alias(name))
+        referenced |= comp.columns
+        known.add(name)
+    predicate = compile_filter(filters, known, referenced) if filters else None
+    if columns:
+        missing = [c for c in columns if c not in known]
+        if missing:
+            raise QueryError(f"Unknown columns: {missing}")
+        referenced |= set(columns)
+    if sort_by:
+        if sort_by not in known:
+            raise QueryError(f"sort_by column '{sort_by}' not found")
+        referenced.add(sort_by)
+    return CompiledQuery(predicate, computed_exprs, list(columns) if columns else None, sort_by, descending, limit, referenced)
+
+
+class PlanCache:
+    """LRU of compiled queries and their (small, limited) results.
+
+    Compiled expressions are keyed by the normalized query plus the source
+    schema; results additionally by a source key (id + version) so a refined
+    query recompiles nothing it has seen and a repeated one does no I/O.
+    """
+
+    def __init__(self, max_plans: int = 256, max_results: int = 64):
+        self.max_plans = max_plans
+        self.max_results = max_results
+        self._plans: "OrderedDict[Hashable, CompiledQuery]" = OrderedDict()
+        self._results: "OrderedDict[Hashable, pl.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _get(store: OrderedDict, key):
+        value = store.get(key)
+        if value is not None:
+            store.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _put(store: OrderedDict, key, value, limit: int):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > limit:
+            store.popitem(last=False)
+
+    def compiled(self, schema_names: Sequence[str], **query) -> CompiledQuery:
+        key = (tuple(schema_names), normalize(query))
+        with self._lock:
+            plan = self._get(self._plans, key)
+        if plan is None:
+            plan = compile_query(schema_names, **query)
+            with self._lock:
+                self._put(self._plans, key, plan, self.max_plans)
+        return plan
+
+    def run(
+        self,
+        source_key: Hashable,
+        lf: pl.LazyFrame,
+        collect: Callable[[pl.LazyFrame], pl.DataFrame] = pl.LazyFrame.collect,
+        **query,
+    ) -> pl.DataFrame:
+        """Compile (cached) and collect ``query`` against ``lf``; results are cached per source.
+
+        ``collect`` runs the plan (e.g. ``COMPUTE.collect`` to schedule it).
+        """
+        schema_names = lf.collect_schema().names()
+        result_key = (source_key, normalize(query))
+        with self._lock:
+            cached = self._get(self._results, result_key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        df = collect(self.compiled(schema_names, **query).apply(lf))
+        with self._lock:
+            self._put(self._results, result_key, df, self.max_results)
+        return df
+
+    def invalidate(self, source_key_prefix: Tuple) -> None:
+        """Drop cached results whose source key starts with ``source_key_prefix``."""
+        n = len(source_key_prefix)
+        with self._lock:
+            for key in [k for k in self._results if isinstance(k[0], tuple) and k[0][:n] == source_key_prefix]:
+                del self._results[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+            self._results.clear()
+            self.hits = self.misses = 0
+
+
+PLAN_CACHE = PlanCache()
+
+
+# Polars SQL table functions read arbitrary paths; only registered tables are allowed.
+_SQL_FILE_FUNCS = re.compile(r"\b(read|scan)_[a-z_]+\s*\(", re.IGNORECASE)
+_SQL_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def sql_plan(tables: Dict[str, pl.LazyFrame], sql: str) -> pl.LazyFrame:
+    """Validate one SELECT/WITH statement and plan it lazily over ``tables``."""
+    sql = sql.strip().rstrip(";")
+    if ";" in sql:
+        raise QueryError("Only a single SQL statement is allowed")
+    if not _SQL_READ_ONLY.match(sql):
+        raise QueryError("Only SELECT / WITH queries are allowed")
+    if _SQL_FILE_FUNCS.search(sql):
+        raise QueryError("File table functions are not allowed; query uploaded tables by name")
+    ctx = pl.SQLContext({name: widen(lf) for name, lf in tables.items()}, eager=False)
+    try:
+        lf = ctx.execute(sql)
+    except Exception as e:
+        raise QueryError(f"SQL error: {e}") from e
+    return lf
+
+
+def run_sql(tables: Dict[str, pl.LazyFrame], sql: str) -> pl.DataFrame:
+    """Run one SELECT/WITH statement over ``tables`` with the streaming engine."""
+    return sql_plan(tables, sql).collect(engine="streaming")
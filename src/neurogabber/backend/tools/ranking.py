@@ -0,0 +1,272 @@
+"""
+Top-k ranking for the data tools ("top N cells by volume", "best cell per region").
+
+``top_k`` selects the k best rows without sorting the whole table: Polars'
+``top_k`` is a partial selection, so only the k winners are ordered. Ties are
+broken by original row position and nulls always rank last, so results are
+deterministic in either direction.
+
+``SortCache`` keeps the sort permutation of a stored table per (source key,
+keys, directions[, groups]). The first ranked request against a table pays
+for one index sort (no frame reallocation); repeats with any ``k`` are a
+gather of ``k`` rows. Source keys carry the table version, so appends and
+edits never see a stale permutation; ``SortCache.extend`` carries
+single-key permutations over an append by merging the sorted batch in. For
+that, single numeric key permutations keep their sorted key values beside
+them, so a merge reads only the appended rows.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import polars as pl
+
+_ROW = "__rank_row"
+
+Keys = Union[str, Sequence[str]]
+Directions = Union[bool, Sequence[bool]]
+
+
+def normalize_keys(
+    columns: Sequence[str], by: Keys, descending: Directions = True
+) -> Tuple[List[str], List[bool]]:
+    """Validate ``by`` against ``columns``; expand ``descending`` to one flag per key."""
+    keys = [by] if isinstance(by, str) else list(by)
+    if not keys:
+        raise ValueError("At least one sort column is required")
+    missing = [k for k in keys if k not in columns]
+    if missing:
+        raise ValueError(f"Sort column(s) not found: {missing}")
+    if isinstance(descending, bool):
+        flags = [descending] * len(keys)
+    else:
+        flags = [bool(d) for d in descending]
+        if len(flags) != len(keys):
+            raise ValueError(f"descending has {len(flags)} flags for {len(keys)} sort columns")
+    return keys, flags
+
+
+def _group_list(columns: Sequence[str], group_by: Optional[Keys]) -> List[str]:
+    if not group_by:
+        return []
+    groups = [group_by] if isinstance(group_by, str) else list(group_by)
+    missing = [g for g in groups if g not in columns]
+    if missing:
+        raise ValueError(f"group_by column(s) not found: {missing}")
+    return groups
+
+
+def sort_permutation(df: pl.DataFrame, keys: List[str], flags: List[bool]) -> np.ndarray:
+    """Row order of ``df`` by ``keys`` (stable; nulls last) as an index array."""
+    return df.select(
+        pl.arg_sort_by(keys, descending=flags, nulls_last=True, maintain_order=True)
+    ).to_series().to_numpy()
+
+
+@dataclass
+class _RankedKey:
+    """Single-key permutation plus its non-null key values in that order."""
+
+    perm: np.ndarray
+    values: np.ndarray
+
+
+def _mergeable(col: pl.Series) -> bool:
+    return col.dtype.is_numeric() and not (col.dtype.is_float() and bool(col.is_nan().any()))
+
+
+def _ranked_key(col: pl.Series, perm: np.ndarray) -> Optional[_RankedKey]:
+    if not _mergeable(col):
+        return None
+    return _RankedKey(perm, col.gather(perm[: col.len() - col.null_count()]).to_numpy())
+
+
+def merge_appended(entry: _RankedKey, batch: pl.Series, descending: bool, n_old: int) -> Optional[_RankedKey]:
+    """Order of the grown table from ``entry`` (its first ``n_old`` rows) and the appended ``batch``.
+
+    Sorts only the batch and binary-searches its slots in the stored key
+    values, keeping ``sort_permutation``'s tie (row order) and nulls-last
+    rules; the old rows are never read. Numeric keys without NaN only;
+    returns None otherwise.
+    """
+    if not _mergeable(batch):
+        return None
+    ranked = entry.values
+    m = len(ranked)  # non-null prefix of the old order
+    batch_order = sort_permutation(batch.to_frame(), [batch.name], [descending])
+    values = batch.gather(batch_order[: batch.len() - batch.null_count()]).to_numpy()
+    if descending:
+        slots = m - np.searchsorted(ranked[::-1], values, side="left")
+    else:
+        slots = np.searchsorted(ranked, values, side="right")
+    merged_values = np.insert(ranked.astype(np.result_type(ranked, values)), slots, values)
+    slots = np.concatenate([slots, np.full(batch.null_count(), n_old)])  # batch nulls go last
+    return _RankedKey(np.insert(entry.perm, slots, (batch_order + n_old).astype(entry.perm.dtype)), merged_values)
+
+
+@dataclass
+class _GroupedOrder:
+    """Rows ordered by (rank within group, group ordinal) plus each group's size.
+
+    The first ``sum(min(size, k))`` entries of ``order`` are exactly the top
+    ``k`` of every group, whatever ``k`` is.
+    """
+
+    order: np.ndarray
+    rank: np.ndarray
+    group: np.ndarray
+    sizes: np.ndarray
+
+    def take(self, k: int) -> np.ndarray:
+        m = int(np.minimum(self.sizes, k).sum())
+        head = np.lexsort((self.rank[:m], self.group[:m]))
+        return self.order[:m][head]
+
+
+def _grouped_order(df: pl.DataFrame, perm: np.ndarray, groups: List[str]) -> _GroupedOrder:
+    # Groups are numbered by the position of their best row, so the best group comes first.
+    ranked = df.select(groups)[perm].with_row_index("__pos").with_columns(
+        pl.int_range(pl.len()).over(groups).alias("__rank"),
+        pl.col("__pos").min().over(groups).alias("__group"),
+    )
+    rank = ranked["__rank"].to_numpy()
+    group = ranked["__group"].to_numpy()
+    by_rank = np.lexsort((group, rank))
+    sizes = ranked.group_by("__group").len()["len"].to_numpy()
+    return _GroupedOrder(perm[by_rank], rank[by_rank], group[by_rank], sizes)
+
+
+def top_k(
+    df: pl.DataFrame,
+    k: int,
+    by: Keys,
+    descending: Directions = True,
+    group_by: Optional[Keys] = None,
+) -> pl.DataFrame:
+    """Return the ``k`` best rows of ``df`` (per group when ``group_by`` is set), in rank order.
+
+    Ungrouped selection is a partial sort: O(n) plus O(k log k) for the winners.
+    Grouped results list groups by their best row, ranked rows within each.
+    """
+    keys, flags = normalize_keys(df.columns, by, descending)
+    groups = _group_list(df.columns, group_by)
+    k = max(0, int(k))
+    if k == 0 or df.height == 0:
+        return df.clear()
+    if groups:
+        return df[_grouped_order(df, sort_permutation(df, keys, flags), groups).take(k)]
+    order = [*keys, _ROW]
+    return (
+        df.with_row_index(_ROW)
+        .top_k(k, by=order, reverse=[not d for d in flags] + [True])
+        .sort(order, descending=[*flags, False], nulls_last=True)
+        .drop(_ROW)
+    )
+
+
+class SortCache:
+    """LRU of sort permutations for stored tables, keyed by source key and ordering."""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _lookup(self, key: Hashable):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def _store(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def permutation(self, source_key: Hashable, df: pl.DataFrame, keys: List[str], flags: List[bool]) -> np.ndarray:
+        key = (source_key, tuple(keys), tuple(flags))
+        entry = self._lookup(key)
+        if entry is None:
+            perm = sort_permutation(df, keys, flags)
+            entry = (_ranked_key(df.get_column(keys[0]), perm) if len(keys) == 1 else None) or perm
+            self._store(key, entry)
+        return entry.perm if isinstance(entry, _RankedKey) else entry
+
+    def grouped(
+        self, source_key: Hashable, df: pl.DataFrame, keys: List[str], flags: List[bool], groups: List[str]
+    ) -> _GroupedOrder:
+        key = (source_key, tuple(keys), tuple(flags), tuple(groups))
+        entry = self._lookup(key)
+        if entry is None:
+            entry = _grouped_order(df, self.permutation(source_key, df, keys, flags), groups)
+            self._store(key, entry)
+        return entry
+
+    def top_k(
+        self,
+        source_key: Hashable,
+        df: pl.DataFrame,
+        k: int,
+        by: Keys,
+        descending: Directions = True,
+        group_by: Optional[Keys] = None,
+    ) -> pl.DataFrame:
+        """``top_k`` against a stored table whose contents are identified by ``source_key``."""
+        keys, flags = normalize_keys(df.columns, by, descending)
+        groups = _group_list(df.columns, group_by)
+        k = max(0, int(k))
+        if k == 0 or df.height == 0:
+            return df.clear()
+        if groups:
+            return df[self.grouped(source_key, df, keys, flags, groups).take(k)]
+        return df[self.permutation(source_key, df, keys, flags)[:k]]
+
+    def extend(
+        self, old_key: Hashable, new_key: Hashable, n_old: int, batch: Callable[[], pl.DataFrame]
+    ) -> int:
+        """Carry permutations of ``old_key`` over to ``new_key`` after rows were appended.
+
+        ``batch()`` returns just the appended rows (read only if something can
+        be carried over). Single numeric key permutations are merged
+        (``merge_appended``) in O(batch log table) plus the array copy; the
+        rest are dropped and rebuilt on demand. Returns how many were kept.
+        """
+        with self._lock:
+            entries = [(k, v) for k, v in self._entries.items() if k[0] == old_key]
+        kept, rows = 0, None
+        for key, value in entries:
+            if isinstance(value, _RankedKey):
+                rows = batch() if rows is None else rows
+                merged = merge_appended(value, rows.get_column(key[1][0]), key[2][0], n_old)
+                if merged is not None:
+                    self._store((new_key, *key[1:]), merged)
+                    kept += 1
+        self.invalidate(old_key)
+        return kept
+
+    def invalidate(self, source_key_prefix: Tuple) -> None:
+        """Drop permutations whose source key starts with ``source_key_prefix``."""
+        n = len(source_key_prefix)
+        with self._lock:
+            for key in [k for k in self._entries if isinstance(k[0], tuple) and k[0][:n] == source_key_prefix]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+RANK_CACHE = SortCache()
@@ -0,0 +1,507 @@
+"""
+Uniform-grid spatial index over NumPy point arrays.
+
+Points are bucketed into cubic cells; cells are encoded as int64 keys and the
+points sorted by key, so a query only touches the key ranges of the cells it
+overlaps (``np.searchsorted`` on the sorted keys) before an exact distance
+filter. Everything is vectorized; there are no per-point Python loops.
+
+Distances can be anisotropic: ``scale`` multiplies each axis before the
+distance is taken (e.g. voxel -> micrometre conversion from the Neuroglancer
+``dimensions``).
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+_AXIS_BITS = 21  # 3 axes * 21 bits fit in an int64 key
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+_MAX_QUERY_CELLS = 1 << 16  # above this, a vectorized full scan is cheaper
+_JOIN_CHUNK = 1 << 16  # query points per batch in nearest_within
+
+
+def _as_scale(scale, dim: int) -> np.ndarray:
+    if scale is None:
+        return np.ones(dim)
+    scale = np.asarray(scale, dtype=np.float64)
+    if scale.shape != (dim,) or (scale <= 0).any():
+        raise ValueError(f"scale must be {dim} positive factors")
+    return scale
+
+
+class GridIndex:
+    """Uniform grid over an ``(N, d)`` point array (``d <= 3``).
+
+    Query methods return indices into the original ``points`` array. Rows with
+    NaN coordinates are never returned.
+    """
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        cell_size: Optional[float] = None,
+        target_per_cell: int = 8,
+        min_cell_size: Optional[float] = None,
+    ):
+        pts = np.ascontiguousarray(points, dtype=np.float64)
+        if pts.ndim != 2 or not 1 <= pts.shape[1] <= 3:
+            raise ValueError(f"points must have shape (N, d) with d <= 3, got {pts.shape}")
+        self.points = pts
+        self.dim = pts.shape[1]
+        valid = np.flatnonzero(np.isfinite(pts).all(axis=1))
+        self.n_indexed = len(valid)
+        if self.n_indexed:
+            lo = pts[valid].min(axis=0)
+            hi = pts[valid].max(axis=0)
+        else:
+            lo = hi = np.zeros(self.dim)
+        self.origin = lo
+        self.bounds = (lo, hi)
+        extent = hi - lo
+        if cell_size is None:
+            span = extent[extent > 0]
+            if span.size and self.n_indexed > target_per_cell:
+                n_cells = self.n_indexed / target_per_cell
+                cell_size = float(np.prod(span) / n_cells) ** (1.0 / span.size)
+            else:
+                cell_size = float(extent.max()) or 1.0
+            if min_cell_size is not None:
+                cell_size = max(cell_size, min_cell_size)
+        # keep per-axis cell counts inside the key encoding
+        self.cell_size = max(float(cell_size), float(extent.max()) / (_AXIS_OFFSET - 1), 1e-12)
+        cells = self._cells(pts[valid])
+        keys = self._encode(cells)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._order = valid[order]
+        self.built_points = self.n_indexed  # ``extended`` keeps the grid sized for this many
+
+    def __len__(self) -> int:
+        return self.n_indexed
+
+    def extended(self, points: np.ndarray) -> "GridIndex":
+        """A new index that also holds ``points`` (indices continue after the current ones).
+
+        The grid (origin, cell size) is kept and the new keys are merged into
+        the sorted ones, so nothing is re-sorted; points outside the old
+        bounds land in clipped edge cells, which queries still filter exactly.
+        """
+        new = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, self.dim)
+        valid = np.flatnonzero(np.isfinite(new).all(axis=1))
+        keys = self._encode(self._cells(new[valid]))
+        order = np.argsort(keys, kind="stable")
+        keys, idx = keys[order], valid[order] + len(self.points)
+        pos = np.searchsorted(self._keys, keys, side="right")  # after equal keys: stable by index
+        out = copy.copy(self)
+        out.points = np.concatenate([self.points, new])
+        out._keys = np.insert(self._keys, pos, keys)
+        out._order = np.insert(self._order, pos, idx)
+        out.n_indexed = self.n_indexed + len(valid)
+        if len(valid):
+            lo, hi = new[valid].min(axis=0), new[valid].max(axis=0)
+            if self.n_indexed:
+                lo, hi = np.minimum(lo, self.bounds[0]), np.maximum(hi, self.bounds[1])
+            out.bounds = (lo, hi)
+        out._cells_cache = None
+        return out
+
+    # --- cell helpers -----------------------------------------------------
+    def _cells(self, pts: np.ndarray) -> np.ndarray:
+        cells = np.floor((pts - self.origin) / self.cell_size)
+        return np.clip(cells, -_AXIS_OFFSET, _AXIS_OFFSET - 1).astype(np.int64)
+
+    def _encode(self, cells: np.ndarray) -> np.ndarray:
+        key = np.zeros(len(cells), dtype=np.int64)
+        for axis in range(self.dim):
+            key = (key << _AXIS_BITS) | (cells[:, axis] + _AXIS_OFFSET)
+        return key
+
+    def _gather(self, keys: np.ndarray) -> np.ndarray:
+        """Point indices stored in the given cells."""
+        lo = np.searchsorted(self._keys, keys, side="left")
+        hi = np.searchsorted(self._keys, keys, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # positions lo_i..hi_i-1 for every cell, without a Python loop
+        before = np.cumsum(counts) - counts
+        pos = np.arange(total) + np.repeat(lo - before, counts)
+        return self._order[pos]
+
+    def _candidates(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """Indices of points in cells overlapping the box (superset of the answer)."""
+        data_lo, data_hi = self.bounds
+        lower = np.maximum(lower, data_lo)
+        upper = np.minimum(upper, data_hi)
+        if self.n_indexed == 0 or (upper < lower).any():
+            return np.empty(0, dtype=np.int64)
+        clo = self._cells(lower[None, :])[0]
+        chi = self._cells(upper[None, :])[0]
+        n_cells = int(np.prod(chi - clo + 1))
+        if n_cells > min(_MAX_QUERY_CELLS, max(self.n_indexed, 1)):
+            return self._order
+        axes = [np.arange(a, b + 1) for a, b in zip(clo, chi)]
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, self.dim)
+        return self._gather(np.unique(self._encode(grid)))
+
+    def _cell_table(self) -> Tuple[np.ndarray, np.ndarray, list]:
+        """Batch-lookup tables, built on first use.
+
+        Distinct occupied cell keys, their start offsets into ``_order`` (plus
+        an end sentinel) and the points in that cell-major order, one
+        contiguous array per axis (1-D gathers are the cheapest).
+        """
+        if getattr(self, "_cells_cache", None) is None:
+            keys, start = np.unique(self._keys, return_index=True)
+            cols = [np.ascontiguousarray(self.points[self._order, a]) for a in range(self.dim)]
+            self._cells_cache = (keys, np.append(start, len(self._keys)), cols)
+        return self._cells_cache
+
+    # --- queries ----------------------------------------------------------
+    def bbox(self, lower: Sequence[float], upper: Sequence[float]) -> np.ndarray:
+        """Indices of points with ``lower <= p <= upper`` on every axis."""
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        cand = self._candidates(lower, upper)
+        pts = self.points[cand]
+        inside = ((pts >= lower) & (pts <= upper)).all(axis=1)
+        return np.sort(cand[inside])
+
+    def count_bbox(self, lower: Sequence[float], upper: Sequence[float]) -> int:
+        return int(len(self.bbox(lower, upper)))
+
+    def radius(
+        self, center: Sequence[float], r: float, scale: Optional[Sequence[float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Points within distance ``r`` of ``center``, nearest first.
+
+        Returns ``(indices, distances)``.
+        """
+        center = np.asarray(center, dtype=np.float64)
+        scale = _as_scale(scale, self.dim)
+        half = r / scale
+        cand = self._candidates(center - half, center + half)
+        dist = np.sqrt((((self.points[cand] - center) * scale) ** 2).sum(axis=1))
+        keep = dist <= r
+        cand, dist = cand[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return cand[order], dist[order]
+
+    def knn(
+        self, center: Sequence[float], k: int, scale: Optional[Sequence[float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The ``k`` nearest points to ``center``, nearest first.
+
+        Grows a search cube until it holds ``k`` points whose k-th distance is
+        no larger than the cube's half-width (so nothing outside can be closer).
+        """
+        center = np.asarray(center, dtype=np.float64)
+        scale = _as_scale(scale, self.dim)
+        k = min(int(k), self.n_indexed)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        reach = self.cell_size * float(scale.min())
+        while True:
+            cand = self._candidates(center - reach / scale, center + reach / scale)
+            if len(cand) >= k:
+                dist = np.sqrt((((self.points[cand] - center) * scale) ** 2).sum(axis=1))
+                part = np.argpartition(dist, k - 1)[:k]
+                if dist[part].max() <= reach or len(cand) == self.n_indexed:
+                    order = part[np.argsort(dist[part], kind="stable")]
+                    return cand[order], dist[order]
+            elif len(cand) == self.n_indexed:  # pragma: no cover - k is clamped above
+                break
+            reach *= 2.0
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    def nearest_within(
+        self,
+        queries: np.ndarray,
+        r: float,
+        scale: Optional[Sequence[float]] = None,
+        workers: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest indexed point within ``r`` of every query point (batch).
+
+        Returns ``(indices, distances)`` aligned with ``queries``; index -1 and
+        distance inf where nothing is in range. Each chunk of queries visits
+        the neighbouring cell offsets in turn, fully vectorized; chunks run
+        on a thread pool (``workers``, default all cores), since NumPy
+        releases the GIL in the heavy kernels.
+        """
+        q = np.ascontiguousarray(queries, dtype=np.float64).reshape(-1, self.dim)
+        scale = _as_scale(scale, self.dim)
+        best = np.full(len(q), -1, dtype=np.int64)
+        best_d = np.full(len(q), np.inf)
+        if self.n_indexed == 0 or len(q) == 0:
+            return best, best_d
+        ok_all = np.isfinite(q).all(axis=1)
+        rel = (np.where(ok_all[:, None], q, 0) - self.origin) / self.cell_size
+        q_cells = np.clip(np.floor(rel), -_AXIS_OFFSET, _AXIS_OFFSET - 1).astype(np.int64)
+        half_cell = bool((r / scale <= self.cell_size / 2).all())
+        if half_cell:
+            # the r-ball crosses at most the nearer face per axis, and only when within r of it
+            frac = rel - np.floor(rel)
+            side = np.where(frac < 0.5, -1, 1)
+            near = np.minimum(frac, 1 - frac) * self.cell_size * scale < r
+            offsets = np.stack(np.meshgrid(*[np.arange(2)] * self.dim, indexing="ij"), axis=-1).reshape(-1, self.dim)
+        else:
+            reach = np.ceil(r / scale / self.cell_size).astype(np.int64)
+            offsets = np.stack(
+                np.meshgrid(*[np.arange(-k, k + 1) for k in reach], indexing="ij"), axis=-1
+            ).reshape(-1, self.dim)
+        # visit queries in cell-key order so the lookups walk the sorted index sequentially
+        perm = np.argsort(self._encode(q_cells), kind="stable")
+        q_cols = [np.ascontiguousarray(q[perm, a]) for a in range(self.dim)]
+        ok_all, q_cells = ok_all[perm], q_cells[perm]
+        if half_cell:
+            side, near = side[perm], near[perm]
+        cell_keys, cell_start, p_cols = self._cell_table()
+        r2 = float(r) ** 2
+
+        def run(start: int) -> None:
+            sl = slice(start, start + _JOIN_CHUNK)
+            ok, cells = ok_all[sl], q_cells[sl]
+            n = len(ok)
+            bi = np.full(n, -1, dtype=np.int64)
+            bd = np.full(n, np.inf)
+            for off in offsets:
+                if half_cell:
+                    rows = np.flatnonzero(ok & near[sl][:, off.astype(bool)].all(axis=1))
+                    nb = cells[rows] + off * side[sl][rows]
+                else:
+                    rows = np.flatnonzero(ok)
+                    nb = cells[rows] + off
+                inside = ((nb >= -_AXIS_OFFSET) & (nb < _AXIS_OFFSET)).all(axis=1)
+                rows, keys = rows[inside], self._encode(nb[inside])
+                if not len(rows):
+                    continue
+                # sorted needles make searchsorted several times faster
+                o = np.argsort(keys)
+                j = np.empty(len(keys), dtype=np.int64)
+                j[o] = np.minimum(np.searchsorted(cell_keys, keys[o]), len(cell_keys) - 1)
+                hit = cell_keys[j] == keys
+                rows, j = rows[hit], j[hit]
+                lo = cell_start[j]
+                counts = cell_start[j + 1] - lo
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                qi = np.repeat(rows + start, counts)
+                starts = np.cumsum(counts) - counts
+                pos = np.arange(total) + np.repeat(lo - starts, counts)
+                d2 = np.zeros(total)
+                for a in range(self.dim):
+                    d2 += ((p_cols[a][pos] - q_cols[a][qi]) * scale[a]) ** 2
+                # closest candidate per query (first on ties); candidates are grouped by query
+                mins = np.minimum.reduceat(d2, starts)
+                at_min = np.where(d2 == np.repeat(mins, counts), np.arange(total), total)
+                found = self._order[pos[np.minimum.reduceat(at_min, starts)]]
+                better = (mins <= r2) & (mins < bd[rows])
+                bi[rows[better]] = found[better]
+                bd[rows[better]] = mins[better]
+            best[perm[sl]] = bi
+            best_d[perm[sl]] = np.sqrt(bd)
+
+        starts = range(0, len(q), _JOIN_CHUNK)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(starts) == 1:
+            for start in starts:
+                run(start)
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+                list(pool.map(run, starts))
+        return best, best_d
+
+
+def match_points(
+    left: np.ndarray,
+    right: np.ndarray,
+    tolerance: float,
+    mode: str = "one_to_one",
+    right_index: Optional[GridIndex] = None,
+    scale: Optional[Sequence[float]] = None,
+    workers: Optional[int] = None,
+    max_rounds: int = 32,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Match left points to right points within ``tolerance``.
+
+    ``many_to_one``: every left point takes its nearest right point (right
+    points may be reused). ``one_to_one``: rounds of mutual nearest
+    neighbours among the still-unmatched points, which pairs points in
+    increasing distance order without any per-pair Python loop.
+
+    Returns ``(left_indices, right_indices, distances)`` of the matches.
+    """
+    if mode not in ("one_to_one", "many_to_one"):
+        raise ValueError(f"Unknown match mode '{mode}'")
+    left = np.asarray(left, dtype=np.float64)
+    right = np.asarray(right, dtype=np.float64)
+    grid = right_index
+    if grid is None or grid.cell_size < 2 * tolerance:
+        # cells >= 2x the tolerance: each query visits its own cell plus near faces only
+        grid = GridIndex(right, min_cell_size=2 * tolerance)
+    nearest, dist = grid.nearest_within(left, tolerance, scale=scale, workers=workers)
+    if mode == "many_to_one":
+        hit = np.flatnonzero(nearest >= 0)
+        return hit, nearest[hit], dist[hit]
+
+    out_l, out_r, out_d = [], [], []
+    free_l = np.arange(len(left))
+    free_r = np.arange(len(right))
+    for round_ in range(max_rounds):
+        if round_:
+            grid = GridIndex(right[free_r], min_cell_size=2 * tolerance)
+            nearest, dist = grid.nearest_within(left[free_l], tolerance, scale=scale, workers=workers)
+        back_grid = GridIndex(left[free_l], min_cell_size=2 * tolerance)
+        back, _ = back_grid.nearest_within(right[free_r], tolerance, scale=scale, workers=workers)
+        has = nearest >= 0
+        mutual = has & (back[np.where(has, nearest, 0)] == np.arange(len(free_l)))
+        if not mutual.any():
+            break
+        out_l.append(free_l[mutual])
+        out_r.append(free_r[nearest[mutual]])
+        out_d.append(dist[mutual])
+        # points with no candidate left can never match; drop them with the matched ones
+        keep_r = back >= 0
+        keep_r[nearest[mutual]] = False
+        free_l = free_l[has & ~mutual]
+        free_r = free_r[keep_r]
+        if not len(free_l) or not len(free_r):
+            break
+    if not out_l:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    li, ri, d = np.concatenate(out_l), np.concatenate(out_r), np.concatenate(out_d)
+    order = np.argsort(li, kind="stable")
+    return li[order], ri[order], d[order]
+
+
+class CountPyramid:
+    """Multi-resolution point counts over a uniform grid (a sparse count octree).
+
+    Level 0 uses cells of ``base_cell`` (about ``target_per_cell`` points per
+    occupied cell); each coarser level doubles the cell size, up to a single
+    cell covering the data. Only occupied cells are stored (sorted int64 keys
+    + counts), so memory is O(occupied cells) per level.
+
+    ``level_for`` picks the finest level at which a box spans at most
+    ``max_cells`` cells and ``cells`` enumerates exactly those, so a query
+    costs O(max_cells log n) however much of the data the box covers.
+    """
+
+    def __init__(self, points: np.ndarray, base_cell: Optional[float] = None, target_per_cell: int = 8):
+        pts = np.asarray(points, dtype=np.float64)
+        if pts.ndim != 2 or not 1 <= pts.shape[1] <= 3:
+            raise ValueError(f"points must have shape (N, d) with d <= 3, got {pts.shape}")
+        self.dim = pts.shape[1]
+        pts = pts[np.isfinite(pts).all(axis=1)]
+        self.n_points = len(pts)
+        self.built_points = self.n_points
+        lo = pts.min(axis=0) if self.n_points else np.zeros(self.dim)
+        hi = pts.max(axis=0) if self.n_points else np.zeros(self.dim)
+        self.origin, self.bounds = lo, (lo, hi)
+        extent = float((hi - lo).max()) or 1.0
+        if base_cell is None:
+            n_cells = max(self.n_points / target_per_cell, 1.0)
+            base_cell = extent / max(n_cells ** (1.0 / self.dim), 1.0)
+        # at most 2**(_AXIS_BITS - 1) cells per axis at level 0
+        self.base_cell = max(float(base_cell), extent / (_AXIS_OFFSET - 1), 1e-12)
+        cells = np.floor((pts - lo) / self.base_cell).astype(np.int64)
+        cells, counts = self._coarsen(cells, np.ones(len(cells), dtype=np.int64))
+        self.levels: list = []  # per level: (sorted keys, counts)
+        while True:
+            self.levels.append((self._encode(cells), counts))
+            if len(cells) <= 1:
+                break
+            cells, counts = self._coarsen(cells >> 1, counts)
+
+    def _encode(self, cells: np.ndarray) -> np.ndarray:
+        key = np.zeros(len(cells), dtype=np.int64)
+        for axis in range(self.dim):
+            key = (key << _AXIS_BITS) | cells[:, axis]
+        return key
+
+    def extended(self, points: np.ndarray) -> Optional["CountPyramid"]:
+        """A new pyramid that also counts ``points``, or None if any falls outside the bounds.
+
+        Per level the batch's cells are merged into the sorted keys; the
+        grid stays fixed, so out-of-bounds points need a rebuild instead.
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, self.dim)
+        pts = pts[np.isfinite(pts).all(axis=1)]
+        if len(pts) and (not self.n_points or (pts < self.bounds[0]).any() or (pts > self.bounds[1]).any()):
+            return None
+        out = copy.copy(self)
+        out.n_points = self.n_points + len(pts)
+        cells, counts = self._coarsen(
+            np.floor((pts - self.origin) / self.base_cell).astype(np.int64), np.ones(len(pts), dtype=np.int64)
+        )
+        levels = []
+        for keys, old_counts in self.levels:
+            new_keys = self._encode(cells)
+            pos = np.searchsorted(keys, new_keys)
+            hit = pos < len(keys)
+            hit[hit] = keys[pos[hit]] == new_keys[hit]
+            merged = old_counts.copy()
+            np.add.at(merged, pos[hit], counts[hit])
+            levels.append((np.insert(keys, pos[~hit], new_keys[~hit]), np.insert(merged, pos[~hit], counts[~hit])))
+            cells, counts = self._coarsen(cells >> 1, counts)
+        out.levels = levels
+        return out
+
+    def _coarsen(self, cells: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Merge duplicate cells, summing their counts (result sorted by key)."""
+        if len(cells) == 0:
+            return cells, counts
+        keys = self._encode(cells)
+        order = np.argsort(keys, kind="stable")
+        keys, cells, counts = keys[order], cells[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return cells[starts], np.add.reduceat(counts, starts)
+
+    def cell_size(self, level: int) -> float:
+        return self.base_cell * (1 << level)
+
+    def level_for(self, lower: Sequence[float], upper: Sequence[float], max_cells: int) -> int:
+        """Finest level at which the box overlaps at most ``max_cells`` cells."""
+        lower, upper = self._clip(lower, upper)
+        for level in range(len(self.levels)):
+            size = self.cell_size(level)
+            span = np.floor((upper - self.origin) / size) - np.floor((lower - self.origin) / size) + 1
+            if np.prod(span) <= max_cells:
+                return level
+        return len(self.levels) - 1
+
+    def _clip(self, lower, upper) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.bounds
+        return (np.maximum(np.asarray(lower, dtype=np.float64), lo),
+                np.minimum(np.asarray(upper, dtype=np.float64), hi))
+
+    def cells(self, lower: Sequence[float], upper: Sequence[float], level: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Occupied cells at ``level`` overlapping the box: ``(cell lower corners, counts)``."""
+        lower, upper = self._clip(lower, upper)
+        if self.n_points == 0 or (upper < lower).any():
+            return np.empty((0, self.dim)), np.empty(0, dtype=np.int64)
+        size = self.cell_size(level)
+        clo = np.floor((lower - self.origin) / size).astype(np.int64)
+        chi = np.floor((upper - self.origin) / size).astype(np.int64)
+        axes = [np.arange(a, b + 1) for a, b in zip(clo, chi)]
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, self.dim)
+        keys, counts = self.levels[level]
+        query = self._encode(grid)
+        pos = np.clip(np.searchsorted(keys, query), 0, max(len(keys) - 1, 0))
+        hit = keys[pos] == query if len(keys) else np.zeros(len(query), dtype=bool)
+        return self.origin + grid[hit] * size, counts[pos[hit]]
+
+    def estimate(self, lower: Sequence[float], upper: Sequence[float], max_cells: int = 4096) -> int:
+        """Upper bound on the points in the box (sum over overlapping cells)."""
+        level = self.level_for(lower, upper, max_cells)
+        return int(self.cells(lower, upper, level)[1].sum())
@@ -1,4 +1,4 @@
-import os, json, httpx, asyncio, re, panel as pn, io
+import os, json, httpx, asyncio, re, panel as pn, io, uuid
 from datetime import datetime
 from contextlib import contextmanager
 from panel.chat import ChatInterface
@@ -6,11 +6,8 @@ from panel_neuroglancer import Neuroglancer
 import polars as pl
 import pandas as pd
 
-# Import pointer expansion functionality
-from neurogabber.backend.tools.pointer_expansion import (
-    expand_if_pointer_and_generate_inline,
-    is_pointer_url
-)
+# Pointer detection is local; expansion (network fetch) happens in the backend.
+from neurogabber.backend.tools.pointer_expansion import is_pointer_url
 
 # setup debug logging
 import logging
@@ -37,6 +34,8 @@ pn.extension(
 )
 
 BACKEND = os.environ.get("BACKEND", "http://127.0.0.1:8000")
+# One id per Panel session so the backend schedules sessions' compute fairly
+_SESSION_HEADERS = {"X-Neurogabber-Session": uuid.uuid4().hex}
 
 viewer = Neuroglancer()
 status = pn.pane.Markdown("Ready.")
@@ -91,37 +90,29 @@ def _open_latest(_):
 open_latest_btn = pn.widgets.Button(name="Open latest link", button_type="primary")
 open_latest_btn.on_click(_open_latest)
 
-async def _notify_backend_state_load(url: str):
+async def _notify_backend_state_load(url: str) -> dict:
     """Inform backend that the widget loaded a new NG URL so CURRENT_STATE is in sync.
-    
-    If URL contains a JSON pointer, expand it first before syncing to backend.
+
+    Pointer links go to ``/tools/state_resolve``, which expands them with
+    async fetchers and a shared cache, so this never blocks the event loop on
+    remote storage; inline-state links go straight to ``/tools/state_load``.
+    Returns the backend response (for pointers ``url`` is the inline-state URL).
     """
     try:
-        status.object = "Syncing state to backend…"
-        
-        # Check if URL contains a pointer and expand if needed
-        sync_url = url
-        if is_pointer_url(url):
-            try:
-                status.object = "Expanding JSON pointer…"
-                canonical_url, state_dict, was_pointer = expand_if_pointer_and_generate_inline(url)
-                if was_pointer:
-                    sync_url = canonical_url
-                    status.object = "Pointer expanded, syncing state…"
-            except Exception as e:
-                status.object = f"Pointer expansion failed: {e}"
-                # Fall back to syncing original URL
-                sync_url = url
-        
+        pointer = is_pointer_url(url)
+        status.object = "Expanding JSON pointer…" if pointer else "Syncing state to backend…"
         async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(f"{BACKEND}/tools/state_load", json={"link": sync_url})
+            endpoint = "state_resolve" if pointer else "state_load"
+            resp = await client.post(f"{BACKEND}/tools/{endpoint}", json={"link": url})
             data = resp.json()
-            if not data.get("ok"):
-                status.object = f"Error syncing link: {data.get('error', 'unknown error')}"
-                return
-        status.object = f"**Opened:** {sync_url}"
+        if not data.get("ok"):
+            status.object = f"Error syncing link: {data.get('error', 'unknown error')}"
+            return data
+        status.object = f"**Opened:** {data.get('url') or url}"
+        return data
     except Exception as e:
         status.object = f"Error syncing: {e}"
+        return {"ok": False, "error": str(e)}
 
 def _on_url_change(event):
     """Handle Neuroglancer URL changes with pointer expansion and debouncing."""
@@ -162,25 +153,15 @@ def _on_url_change(event):
             _scheduled_user_state_task = asyncio.create_task(_delayed_sync())
 
 async def _handle_url_change_immediate(url: str):
-    """Handle URL change immediately with pointer expansion and viewer update."""
+    """Sync a URL change to the backend; swap pointer links for their inline form."""
     try:
-        # Check if URL contains a pointer and expand if needed
-        if is_pointer_url(url):
-            canonical_url, state_dict, was_pointer = expand_if_pointer_and_generate_inline(url)
-            if was_pointer:
-                # Update viewer with canonical URL to avoid re-triggering
-                with _programmatic_viewer_update():
-                    viewer.url = canonical_url
-                # Sync the expanded state
-                await _notify_backend_state_load(canonical_url)
-                return
-        
-        # Regular URL handling
-        await _notify_backend_state_load(url)
+        data = await _notify_backend_state_load(url)
+        if data.get("ok") and data.get("was_pointer"):
+            # Update viewer with canonical URL (backend state is already loaded)
+            with _programmatic_viewer_update():
+                viewer.url = data["url"]
     except Exception as e:
         status.object = f"URL handling error: {e}"
-        # Fallback: try to sync original URL
-        await _notify_backend_state_load(url)
 
 # Watch the Neuroglancer widget URL; use its built-in Demo/Load buttons
 viewer.param.watch(_on_url_change, 'url')
@@ -194,7 +175,7 @@ async def agent_call(prompt: str) -> dict:
     """
     async with httpx.AsyncClient(timeout=120) as client:
         chat_payload = {"messages": [{"role": "user", "content": prompt}]}
-        resp = await client.post(f"{BACKEND}/agent/chat", json=chat_payload)
+        resp = await client.post(f"{BACKEND}/agent/chat", json=chat_payload, headers=_SESSION_HEADERS)
         data = resp.json()
         answer = None
         if data.get("choices"):
@@ -440,7 +421,23 @@ settings_card = pn.Card(
 # NOTE: We keep upload + table refresh synchronous to avoid early event-loop timing issues
 # during Panel server warm start on some platforms (Windows). Async is still used for
 # LLM/chat + state sync, but simple data listing uses blocking httpx calls.
-file_drop = pn.widgets.FileDropper(name="Drop CSV files here", multiple=True, accepted_filetypes=["text/csv", ".csv"],sizing_mode="stretch_width")
+# Columnar formats upload as-is; the backend detects them by magic bytes.
+_UPLOAD_CONTENT_TYPES = {
+    ".csv": "text/csv",
+    ".tsv": "text/tab-separated-values",
+    ".parquet": "application/vnd.apache.parquet",
+    ".pq": "application/vnd.apache.parquet",
+    ".arrow": "application/vnd.apache.arrow.file",
+    ".ipc": "application/vnd.apache.arrow.file",
+    ".feather": "application/vnd.apache.arrow.file",
+    ".arrows": "application/vnd.apache.arrow.stream",
+}
+file_drop = pn.widgets.FileDropper(
+    name="Drop CSV / Parquet / Arrow files here",
+    multiple=True,
+    accepted_filetypes=["text/csv", *_UPLOAD_CONTENT_TYPES],
+    sizing_mode="stretch_width",
+)
 upload_notice = pn.pane.Markdown("")
 try:
     import pandas as pd
@@ -467,6 +464,14 @@ else:
     uploaded_table = pn.pane.Markdown("pandas not available")
     summaries_table = pn.pane.Markdown("pandas not available")
 
+# Data endpoints answer in columnar JSON when asked (backend tools/formats.py), which
+# pandas reads without building per-row dicts.
+_COLUMNAR_JSON = {"Accept": "application/vnd.neurogabber.columnar+json"}
+
+def _columnar_frame(payload: dict, key: str):
+    block = payload.get(key) or {}
+    return pd.DataFrame(block.get("data") or {}, columns=block.get("columns") or [])
+
 # Helper to update upload card title with dynamic file count
 def _update_upload_card_title(n: int):
     try:
@@ -481,11 +486,11 @@ def _refresh_files():
         return
     try:
         with httpx.Client(timeout=30) as client:
-            lst = client.post(f"{BACKEND}/tools/data_list_files")
-            data = lst.json().get("files", [])
-        _update_upload_card_title(len(data))
-        if data:
-            df = pd.DataFrame(data)
+            lst = client.post(f"{BACKEND}/tools/data_list_files", headers=_COLUMNAR_JSON)
+            df = _columnar_frame(lst.json(), "files")
+        _update_upload_card_title(len(df))
+        _set_export_options("file", dict(zip(df.get("name", []), df.get("file_id", []))))
+        if len(df):
             # Reorder with name first, keep file_id (hidden) at end for potential future use
             desired = [c for c in ["name","size","n_rows","n_cols","file_id"] if c in df.columns]
             df = df[desired]
@@ -522,10 +527,12 @@ def _refresh_summaries():
         return
     try:
         with httpx.Client(timeout=30) as client:
-            lst = client.post(f"{BACKEND}/tools/data_list_summaries")
-            data = lst.json().get("summaries", [])
-        if data:
-            df = pd.DataFrame(data)
+            lst = client.post(f"{BACKEND}/tools/data_list_summaries", headers=_COLUMNAR_JSON)
+            df = _columnar_frame(lst.json(), "summaries")
+        _set_export_options("summary", {
+            f"{kind} ({sid})": sid for kind, sid in zip(df.get("kind", []), df.get("summary_id", []))
+        })
+        if len(df):
             # Reorder with kind first; retain IDs (hidden) for possible referencing
             desired_order = [c for c in ["kind","n_rows","n_cols","summary_id","source_file_id"] if c in df.columns]
             df = df[desired_order]
@@ -568,7 +575,7 @@ def _handle_file_upload(evt):
                     raw_bytes = raw
                 resp = client.post(
                     f"{BACKEND}/upload_file",
-                    files={"file": (name, raw_bytes, "text/csv")},
+                    files={"file": (name, raw_bytes, _UPLOAD_CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "text/csv"))},
                 )
                 rj = resp.json()
 
@@ -585,6 +592,42 @@ def _handle_file_upload(evt):
 
 file_drop.param.watch(_handle_file_upload, "value")
 
+# ---------------- Export ----------------
+# Downloads stream from GET /data/{id}/export; the backend never materializes the
+# table, and here the bytes spool to disk past 64 MiB.
+_EXPORT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+_export_groups: dict[str, dict[str, str]] = {"file": {}, "summary": {}}
+export_select = pn.widgets.Select(name="Export table", options={}, sizing_mode="stretch_width")
+export_format = pn.widgets.RadioButtonGroup(options=list(_EXPORT_EXTENSIONS), value="csv")
+
+def _set_export_options(group: str, options: dict):
+    _export_groups[group] = {str(k): str(v) for k, v in options.items()}
+    export_select.options = {**_export_groups["file"], **_export_groups["summary"]}
+
+def _export_filename(*_):
+    label = next((k for k, v in export_select.options.items() if v == export_select.value), "export")
+    export_button.filename = os.path.splitext(label)[0] + _EXPORT_EXTENSIONS[export_format.value]
+
+def _export_download():
+    import tempfile
+    table_id = export_select.value
+    if not table_id:
+        return None
+    out = tempfile.SpooledTemporaryFile(max_size=64 * 1024**2)
+    with httpx.Client(timeout=None) as client:
+        with client.stream("GET", f"{BACKEND}/data/{table_id}/export", params={"format": export_format.value}) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_bytes():
+                out.write(chunk)
+    out.seek(0)
+    return out
+
+export_button = pn.widgets.FileDownload(
+    callback=_export_download, filename="export.csv", label="Download", button_type="primary",
+)
+export_select.param.watch(_export_filename, "value")
+export_format.param.watch(_export_filename, "value")
+
 def _initial_refresh():
     _refresh_files()
     _refresh_summaries()
@@ -595,6 +638,7 @@ upload_card = pn.Card(
         upload_notice,
         #pn.pane.Markdown("**Uploaded Files**"),
         uploaded_table,
+        pn.Row(export_select, export_format, export_button),
         #pn.pane.Markdown("**Summaries**"),
         #summaries_table,
     ),
@@ -0,0 +1,88 @@
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main as backend_main
+from neurogabber.backend.main import app, summarize_state_struct
+from neurogabber.backend.tools.neuroglancer_state import NeuroglancerState
+
+client = TestClient(app)
+
+
+def _layer_anns(state: NeuroglancerState, name: str) -> list:
+    layer = next(L for L in state.as_dict()["layers"] if L["name"] == name)
+    return layer["source"]["annotations"]
+
+
+def test_add_annotations_upserts_by_id():
+    s = NeuroglancerState()
+    s.add_annotations("ROIs", [{"point": [1, 2, 3], "id": "a"}])
+    s.add_annotations("ROIs", [{"point": [4, 5, 6], "id": "a"}, {"point": [7, 8, 9], "id": "b"}])
+    anns = _layer_anns(s, "ROIs")
+    assert len(anns) == 2
+    assert s.annotation_index("ROIs").get("a")["point"] == [4, 5, 6]
+
+
+def test_delete_swaps_last_and_keeps_index_consistent():
+    s = NeuroglancerState()
+    s.add_annotations("ROIs", [{"point": [i, i, i], "id": str(i)} for i in range(5)])
+    index = s.annotation_index("ROIs")
+    deleted, missing = index.delete(["1", "nope"])
+    assert (deleted, missing) == (1, ["nope"])
+    anns = _layer_anns(s, "ROIs")
+    assert len(anns) == 4
+    for ann_id, pos in index.positions.items():
+        assert anns[pos]["id"] == ann_id
+
+
+def _legacy_state() -> NeuroglancerState:
+    data = NeuroglancerState().as_dict()
+    data["layers"].append({"type": "annotation", "name": "old", "source": {"annotations": [
+        {"point": [0, 0, 0], "id": "x"},
+        {"type": "box", "point": [0, 0, 0], "size": [1, 1, 1], "id": "x"},
+        {"point": [1, 1, 1]},
+    ]}})
+    return NeuroglancerState(data)
+
+
+def test_index_rebuilds_from_loaded_state_and_dedupes_on_first_mutation():
+    s = _legacy_state()
+    url = s.to_url()
+    index = s.annotation_index("old")
+    assert s.to_url() == url  # building the index doesn't rewrite the layer
+    assert index.get("x")["type"] == "box"
+    index.upsert([{"point": [2, 2, 2], "id": "y"}])
+    assert len(index) == 3
+    assert index.types() == ["box", "point"]
+    assert all(a.get("id") for a in _layer_anns(s, "old"))
+    assert [a["id"] for a in _layer_anns(s, "old")].count("x") == 1
+
+
+def test_summary_leaves_legacy_layer_untouched():
+    s = _legacy_state()
+    url = s.to_url()
+    summary = summarize_state_struct(s)
+    assert summary["annotation_layers"] == [{"name": "old", "count": 3, "types": ["box", "point"]}]
+    assert s.to_url() == url and s.annotation_index("old", build=False) is None
+
+
+def test_summary_reads_counts_and_types_from_index():
+    s = NeuroglancerState()
+    s.add_annotations("ROIs", [{"point": [0, 0, 0], "id": "p"}, {"type": "ellipsoid", "center": [0, 0, 0], "radii": [1, 1, 1], "id": "e"}])
+    s.annotation_index("ROIs").delete(["e"])
+    summary = summarize_state_struct(s)
+    assert summary["annotation_layers"] == [{"name": "ROIs", "count": 1, "types": ["point"]}]
+
+
+def test_upsert_delete_replace_endpoints():
+    backend_main.CURRENT_STATE = NeuroglancerState()
+    item = lambda i, x: {"id": i, "type": "point", "center": {"x": x, "y": 0, "z": 0}}
+    r = client.post("/tools/ng_annotations_upsert", json={"layer": "cur", "items": [item("a", 1), item("b", 2)]}).json()
+    assert (r["inserted"], r["updated"], r["count"]) == (2, 0, 2)
+    r = client.post("/tools/ng_annotations_upsert", json={"layer": "cur", "items": [item("a", 5)]}).json()
+    assert (r["inserted"], r["updated"], r["count"]) == (0, 1, 2)
+    r = client.post("/tools/ng_annotations_delete", json={"layer": "cur", "ids": ["b"]}).json()
+    assert (r["deleted"], r["count"]) == (1, 1)
+    r = client.post("/tools/ng_annotations_replace", json={"layer": "cur", "items": [item("z", 0)]}).json()
+    assert r["count"] == 1
+    assert [a["id"] for a in _layer_anns(backend_main.CURRENT_STATE, "cur")] == ["z"]
+    r = client.post("/tools/ng_annotations_delete", json={"layer": "missing", "ids": ["a"]}).json()
+    assert r["ok"] is False
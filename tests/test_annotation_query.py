@@ -0,0 +1,90 @@
+import json
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main as backend_main
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.neuroglancer_state import NeuroglancerState
+from neurogabber.backend.tools.spatial import GridIndex
+
+client = TestClient(app)
+
+rng = np.random.default_rng(0)
+PTS = rng.uniform(0, 100, size=(2000, 3))
+
+
+def test_grid_bbox_matches_brute_force():
+    grid = GridIndex(PTS)
+    lower, upper = np.array([10, 20, 30]), np.array([40, 45, 90])
+    expected = np.flatnonzero(((PTS >= lower) & (PTS <= upper)).all(axis=1))
+    assert np.array_equal(grid.bbox(lower, upper), expected)
+
+
+def test_grid_radius_and_knn_match_brute_force():
+    grid = GridIndex(PTS)
+    center = np.array([50.0, 50.0, 50.0])
+    scale = np.array([1.0, 2.0, 0.5])
+    dist = np.sqrt((((PTS - center) * scale) ** 2).sum(axis=1))
+    idx, d = grid.radius(center, 12.0, scale=scale)
+    assert set(idx.tolist()) == set(np.flatnonzero(dist <= 12.0).tolist())
+    assert np.all(np.diff(d) >= 0)
+    idx, d = grid.knn(center, 15, scale=scale)
+    assert idx.tolist() == np.argsort(dist, kind="stable")[:15].tolist()
+
+
+def test_grid_skips_nan_rows_and_handles_far_queries():
+    pts = PTS[:10].copy()
+    pts[3] = np.nan
+    grid = GridIndex(pts)
+    assert len(grid) == 9
+    assert 3 not in grid.bbox([-1e9] * 3, [1e9] * 3).tolist()
+    assert len(grid.knn([1e6, 1e6, 1e6], 20)[0]) == 9
+
+
+def _state_with_points():
+    s = NeuroglancerState()
+    s.data["dimensions"] = {"x": [4e-9, "m"], "y": [4e-9, "m"], "z": [40e-9, "m"]}
+    s.data["position"] = [0, 0, 0]
+    s.add_annotations("cells", [{"point": [float(i), 0.0, 0.0], "id": f"c{i}"} for i in range(10)])
+    return s
+
+
+def test_query_endpoint_modes():
+    backend_main.CURRENT_STATE = _state_with_points()
+    r = client.post("/tools/ng_annotations_query", json={"layer": "cells", "mode": "knn", "k": 3}).json()
+    assert [m["id"] for m in r["matches"]] == ["c0", "c1", "c2"]
+    r = client.post("/tools/ng_annotations_query", json={
+        "layer": "cells", "radius": 2.5, "center": {"x": 5, "y": 0, "z": 0},
+    }).json()
+    assert sorted(m["id"] for m in r["matches"]) == ["c3", "c4", "c5", "c6", "c7"]
+    # 10 nm at 4 nm/voxel along x -> 2.5 voxels
+    r = client.post("/tools/ng_annotations_query", json={
+        "layer": "cells", "radius": 10, "units": "nm", "center": {"x": 5, "y": 0, "z": 0},
+    }).json()
+    assert r["count"] == 5
+    r = client.post("/tools/ng_annotations_query", json={
+        "layer": "cells", "mode": "bbox", "lower": {"x": 0, "y": -1, "z": -1}, "upper": {"x": 3, "y": 1, "z": 1}, "limit": 2,
+    }).json()
+    assert r["count"] == 4 and r["truncated"] and len(r["matches"]) == 2
+
+
+def test_query_sees_mutations_and_reports_errors():
+    backend_main.CURRENT_STATE = _state_with_points()
+    backend_main.CURRENT_STATE.annotation_index("cells").delete(["c0"])
+    r = client.post("/tools/ng_annotations_query", json={"layer": "cells", "mode": "knn", "k": 1}).json()
+    assert r["matches"][0]["id"] == "c1"
+    assert "error" in client.post("/tools/ng_annotations_query", json={"layer": "nope", "radius": 1}).json()
+    assert "error" in client.post("/tools/ng_annotations_query", json={"layer": "cells"}).json()
+
+
+def test_query_default_answer_fits_tool_output_budget():
+    s = NeuroglancerState()
+    s.add_annotations("many", [{"point": p.tolist(), "id": uuid.uuid4().hex} for p in PTS])
+    backend_main.CURRENT_STATE = s
+    r = client.post("/tools/ng_annotations_query", json={
+        "layer": "many", "radius": 30, "center": {"x": 50, "y": 50, "z": 50},
+    }).json()
+    assert r["truncated"] and len(r["matches"]) == 20
+    assert json.loads(backend_main._truncate_tool_output(r)) == r
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import polars as pl
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import compute, main
+from neurogabber.backend.compute import ComputeScheduler
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.plots import histogram
+
+client = TestClient(app)
+
+
+def _wait_queued(sched, n):
+    for _ in range(500):
+        if sum(sched.stats()["queued"].values()) == n:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"expected {n} queued, got {sched.stats()['queued']}")
+
+
+def test_slots_admit_round_robin_across_sessions():
+    sched = ComputeScheduler(slots=1, threads=1)
+    order = []
+
+    def worker(session, tag):
+        with sched.slot(session):
+            order.append(tag)
+
+    threads = []
+    with sched.slot("busy"):
+        for i, (session, tag) in enumerate([("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]):
+            t = threading.Thread(target=worker, args=(session, tag))
+            t.start()
+            threads.append(t)
+            _wait_queued(sched, i + 1)
+        assert sched.stats()["queued"] == {"a": 3, "b": 1}
+    for t in threads:
+        t.join(5)
+    assert order == ["a1", "b1", "a2", "a3"]  # b isn't stuck behind a's backlog
+    stats = sched.stats()
+    assert stats["completed"] == 5 and stats["active"] == 0 and stats["queued"] == {}
+
+
+def test_slot_is_reentrant_and_run_defaults_to_thread():
+    sched = ComputeScheduler(slots=1, threads=1)
+    with sched.slot():
+        with sched.slot():
+            assert sched.run(lambda x: x + 1, 1) == 2
+    assert sched.stats()["active"] == 0 and sched.process_calls == 0
+
+
+def test_process_mode_budgets_threads_and_maps_arrow_results(tmp_path):
+    path = tmp_path / "t.arrow"
+    pl.DataFrame({"a": range(1000), "g": [i % 3 for i in range(1000)]}).write_ipc(path)
+    sched = ComputeScheduler(slots=1, threads=1, mode="process", out_dir=str(tmp_path / "out"))
+    try:
+        assert sched.run(os.getenv, "POLARS_MAX_THREADS") == "1"
+        out = sched.collect(pl.scan_ipc(path).filter(pl.col("g") == 1).select("a"))
+        assert out.height == 333 and out["a"][0] == 1
+        assert sched.describe(pl.scan_ipc(path))["statistic"][0] == "count"
+        hist, edges = sched.run(histogram, np.arange(256, dtype=np.uint16))
+        assert hist.sum() == 256 and len(edges) == 257
+        assert sched.process_calls == 4 and os.listdir(tmp_path / "out") == []
+    finally:
+        sched.shutdown()
+
+
+def test_endpoints_schedule_by_session_header(monkeypatch):
+    sched = ComputeScheduler(slots=2, threads=1)
+    seen = []
+    slot = sched.slot
+
+    @contextmanager
+    def recording_slot(session=None):
+        seen.append(compute.current_session())
+        with slot(session):
+            yield
+
+    monkeypatch.setattr(sched, "slot", recording_slot)
+    monkeypatch.setattr(main, "COMPUTE", sched)
+    content = b"cell_id,x\n" + b"".join(f"{i},{i}\n".encode() for i in range(50))
+    fid = client.post("/upload_file", files={"file": ("compute_cells.csv", content, "text/csv")}).json()["file"]["file_id"]
+    res = client.post(
+        "/tools/data_select",
+        json={"file_id": fid, "filters": [{"column": "x", "op": ">", "value": 45}]},
+        headers={compute.SESSION_HEADER: "alice"},
+    ).json()
+    assert [r["cell_id"] for r in res["preview_rows"]] == [46, 47, 48, 49]
+    client.post("/tools/data_plot_histogram", json={"layer": "em"}, headers={compute.SESSION_HEADER: "bob"})
+    assert seen == ["alice", "bob"]
+    assert client.get("/debug/timing").json()["compute"]["completed"] == 2
@@ -0,0 +1,139 @@
+import numpy as np
+import polars as pl
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main
+from neurogabber.backend.main import app, DATA_MEMORY
+from neurogabber.backend.storage.data import DataMemory
+from neurogabber.backend.tools.ranking import RANK_CACHE, sort_permutation
+from neurogabber.backend.tools.memo import TOOL_MEMO
+from neurogabber.backend.tools.spatial import GridIndex
+
+client = TestClient(app)
+
+
+def _cells(start: int, n: int, offset: float = 0.0) -> bytes:
+    rows = (f"{i},{i % 97 + offset},{i % 89},{i % 83},r{i % 3}\n" for i in range(start, start + n))
+    return b"cell_id,x,y,z,region\n" + "".join(rows).encode()
+
+
+def _upload(content: bytes, name: str = "batches.csv") -> str:
+    return client.post("/upload_file", files={"file": (name, content, "text/csv")}).json()["file"]["file_id"]
+
+
+def _append(fid: str, content: bytes, name: str = "batch.csv") -> dict:
+    return client.post(f"/data/{fid}/append", files={"file": (name, content, "text/csv")}).json()
+
+
+def test_append_updates_table_caches_and_stats():
+    fid = _upload(_cells(0, 1000))
+    rec = DATA_MEMORY.files[fid]
+    rec.wait_stats()
+    old_key = DATA_MEMORY.source_key(fid)
+    # warm the caches the append has to keep consistent
+    grid = DATA_MEMORY.spatial_index(fid)
+    ranked = client.post("/tools/data_ng_views_table", json={"file_id": fid, "sort_by": "x", "top_n": 3}).json()
+    assert len(ranked["rows"]) == 3
+    main._execute_tool_memoized("data_info", {"file_id": fid})
+    sel = client.post("/tools/data_select", json={"file_id": fid, "filters": [{"column": "x", "op": ">", "value": 150}]}).json()
+    assert sel["preview_rows"] == []
+    rec.release()  # carrying the sort permutation over must not reload the table
+
+    res = _append(fid, _cells(1000, 100, offset=200.0))
+    assert res["ok"], res
+    meta = res["file"]
+    assert (meta["n_rows"], meta["appended_rows"], meta["version"]) == (1100, 100, 1)
+    assert sel["summary"]["summary_id"] in meta["invalidated"]
+    assert meta["sort_permutations_kept"] == 1 and rec._df is None
+    assert len(rec.chunk_paths) == 1 and rec.lazy().select(pl.len()).collect().item() == 1100
+
+    # queries see the new rows; nothing keyed by the old version survives
+    sel = client.post("/tools/data_select", json={"file_id": fid, "filters": [{"column": "x", "op": ">", "value": 150}], "limit": 500}).json()
+    assert len(sel["preview_rows"]) == 100
+    assert not [k for k in TOOL_MEMO._entries if k[2] == old_key]
+    assert not [k for k in RANK_CACHE._entries if k[0] == old_key]
+
+    # the sort permutation was merged, not rebuilt
+    df = DATA_MEMORY.get_df(fid)
+    entry = RANK_CACHE._entries[(DATA_MEMORY.source_key(fid), ("x",), (True,))]
+    assert np.array_equal(entry.perm, sort_permutation(df, ["x"], [True]))
+    assert np.array_equal(entry.values, df["x"].gather(entry.perm).to_numpy())
+    top = client.post("/tools/data_ng_views_table", json={"file_id": fid, "sort_by": "x", "top_n": 3}).json()
+    assert [r["cell_id"] for r in top["rows"]] == df.sort("x", descending=True, maintain_order=True)["cell_id"].head(3).to_list()
+
+    # the grid index was extended in place of a rebuild
+    grown = DATA_MEMORY.spatial_index(fid)
+    assert grown is not grid and len(grown) == 1100
+    fresh = GridIndex(df.select(pl.col(c).cast(pl.Float64) for c in "xyz").to_numpy())
+    assert np.array_equal(grown.bbox((180, 0, 0), (400, 50, 50)), fresh.bbox((180, 0, 0), (400, 50, 50)))
+
+    # stats merged from the batch match a full recomputation where exact
+    stats = rec.wait_stats()
+    assert stats["n_rows"] == 1100
+    x = stats["columns"]["x"]
+    assert x["max"] == df["x"].max() and abs(x["mean"] - df["x"].mean()) < 1e-5 and abs(x["std"] - df["x"].std()) < 1e-5
+    assert sum(x["histogram"]["counts"]) == 1100
+    assert stats["columns"]["region"]["distinct"] == 3 and stats["columns"]["cell_id"]["max"] == 1099
+
+
+def test_append_widens_narrowed_dtypes(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    fid = mem.add_file("small.csv", b"id,v\n1,10\n2,20\n3,30\n")["file_id"]
+    assert mem.get_lazy(fid).collect_schema()["v"] == pl.Int8
+    batch = tmp_path / "b.csv"
+    batch.write_bytes(b"v,id\n70000,4\n-5,5\n")
+    meta = mem.append_file_path(fid, str(batch), "b.csv")
+    assert meta["n_rows"] == 5 and meta["version"] == 1
+    df = mem.get_df(fid)
+    assert df["v"].to_list() == [10, 20, 30, 70000, -5] and df["id"].to_list() == [1, 2, 3, 4, 5]
+    assert df.schema["v"] == pl.Int64 and "v" not in meta["dtype_changes"]
+    stats = mem.files[fid].wait_stats()
+    assert (stats["columns"]["v"]["min"], stats["columns"]["v"]["max"]) == (-5, 70000)
+
+
+def test_append_to_alias_leaves_source_alone(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    content = b"id,v\n" + b"".join(f"{i},{i}\n".encode() for i in range(20))
+    src = mem.add_file("a.csv", content)["file_id"]
+    alias = mem.add_file("b.csv", content)["file_id"]
+    mem.get_df(src)
+    batch = tmp_path / "more.csv"
+    batch.write_bytes(b"id,v\n20,20\n")
+    mem.append_file_path(alias, str(batch))
+    assert mem.get_df(alias).height == 21 and mem.get_df(src).height == 20
+    assert mem.files[src].wait_stats()["n_rows"] == 20 and mem.files[alias].wait_stats()["n_rows"] == 21
+    assert mem.files[alias].resident_bytes() > 0  # no longer sharing the source's frame
+
+
+def test_append_errors():
+    fid = _upload(_cells(0, 10), name="errs.csv")
+    bad = _append(fid, b"cell_id,x\n1,2\n")
+    assert not bad["ok"] and "don't match" in bad["error"]
+    assert DATA_MEMORY.files[fid].version == 0 and not DATA_MEMORY.files[fid].chunk_paths
+    assert _append("nope", _cells(0, 1)) == {"ok": False, "error": "Unknown file_id: nope"}
+
+
+def test_widening_append_stops_deduping_against_rewritten_base(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    content = b"id,v\n1,10\n2,20\n"
+    fid = mem.add_file("a.csv", content)["file_id"]
+    for i, row in enumerate([b"id,v\n3,30\n", b"id,v\n4,70000\n"]):
+        batch = tmp_path / f"b{i}.csv"
+        batch.write_bytes(row)
+        mem.append_file_path(fid, str(batch))
+    assert mem.get_df(fid).height == 4
+    again = mem.add_file("a.csv", content)
+    assert not again["parse_skipped"] and mem.get_df(again["file_id"])["v"].to_list() == [10, 20]
+
+
+def test_widening_append_hands_dedupe_to_unchanged_alias(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    content = b"id,v\n1,10\n2,20\n"
+    src = mem.add_file("a.csv", content)["file_id"]
+    alias = mem.add_file("b.csv", content)["file_id"]
+    batch = tmp_path / "wide.csv"
+    batch.write_bytes(b"id,v\n3,70000\n")
+    mem.append_file_path(src, str(batch))
+    again = mem.add_file("c.csv", content)
+    assert again["parse_skipped"] and again["alias_of"] == alias
+    assert mem.get_df(again["file_id"])["v"].to_list() == [10, 20]
@@ -0,0 +1,62 @@
+import io
+import threading
+
+import polars as pl
+from fastapi.testclient import TestClient
+
+from neurogabber.backend.main import app, DATA_MEMORY
+from neurogabber.backend.tools.formats import export_chunks
+
+client = TestClient(app)
+
+
+def _upload(n=1000, name="cells.csv"):
+    content = b"cell_id,x,region\n" + b"".join(f"{i},{i * 0.5},r{i % 4}\n".encode() for i in range(n))
+    return client.post("/upload_file", files={"file": (name, content, "text/csv")}).json()["file"]["file_id"]
+
+
+def test_export_file_as_csv():
+    fid = _upload(name="cells.csv")
+    resp = client.get(f"/data/{fid}/export")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/csv")
+    assert 'filename="cells.csv"' in resp.headers["content-disposition"]
+    df = pl.read_csv(io.BytesIO(resp.content))
+    assert df.height == 1000 and df["x"][3] == 1.5 and df["region"][2] == "r2"
+
+
+def test_export_summaries_parquet_and_arrow():
+    fid = _upload()
+    sel = client.post("/tools/data_select", json={
+        "file_id": fid, "filters": [{"column": "region", "op": "==", "value": "r1"}], "limit": 500,
+    }).json()
+    sid = sel["summary"]["summary_id"]
+    DATA_MEMORY.summaries[sid].release()  # lazy summary: export re-plans from the source scan
+    pq = client.get(f"/data/{sid}/export", params={"format": "parquet"})
+    assert f'filename="select-{sid}.parquet"' in pq.headers["content-disposition"]
+    df = pl.read_parquet(io.BytesIO(pq.content))
+    assert df.height == 250 and set(df["region"].cast(pl.Utf8)) == {"r1"}
+    arrow = client.get(f"/data/{sid}/export", params={"format": "arrow"})
+    assert pl.read_ipc(io.BytesIO(arrow.content))["cell_id"].to_list() == df["cell_id"].to_list()
+
+
+def test_export_errors():
+    assert client.get("/data/nope/export").status_code == 404
+    fid = _upload(10)
+    bad = client.get(f"/data/{fid}/export", params={"format": "xlsx"})
+    assert bad.status_code == 400 and "csv" in bad.json()["formats"]
+
+
+def test_export_chunks_stream_and_cancel():
+    lf = pl.LazyFrame({"a": range(200_000)}).with_columns(b=pl.col("a") * 2)
+    chunks = list(export_chunks(lf, "csv"))
+    assert len(chunks) > 1
+    assert pl.read_csv(io.BytesIO(b"".join(chunks))).height == 200_000
+    before = threading.active_count()
+    gen = export_chunks(lf, "csv", max_pending=1)
+    next(gen)
+    gen.close()  # client went away: the sink thread must stop, not block on the full queue
+    for t in threading.enumerate():
+        if t.name == "neurogabber-export":
+            t.join(timeout=5)
+            assert not t.is_alive()
+    assert threading.active_count() <= before
@@ -0,0 +1,156 @@
+import json
+
+import numpy as np
+import polars as pl
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main as backend_main
+from neurogabber.backend.main import app, DATA_MEMORY
+from neurogabber.backend.tools.neuroglancer_state import NeuroglancerState
+from neurogabber.backend.tools.spatial import CountPyramid, GridIndex, match_points
+
+client = TestClient(app)
+
+rng = np.random.default_rng(1)
+PTS = rng.uniform(0, 1000, size=(5000, 3))
+
+
+def _upload() -> str:
+    df = pl.DataFrame({"cell_id": np.arange(len(PTS)), "x": PTS[:, 0], "y": PTS[:, 1], "z": PTS[:, 2]})
+    raw = df.write_csv().encode()
+    return client.post("/upload_file", files={"file": ("cells.csv", raw, "text/csv")}).json()["file"]["file_id"]
+
+
+def test_nearby_knn_defaults_to_view_position():
+    fid = _upload()
+    s = NeuroglancerState()
+    s.data["position"] = [500.0, 500.0, 500.0]
+    backend_main.CURRENT_STATE = s
+    r = client.post("/tools/data_nearby", json={"file_id": fid, "k": 5, "columns": ["cell_id"]}).json()
+    dist = np.sqrt(((PTS - 500.0) ** 2).sum(axis=1))
+    assert [row["cell_id"] for row in r["rows"]] == np.argsort(dist)[:5].tolist()
+    assert r["center"] == [500.0, 500.0, 500.0] and list(r["rows"][0]) == ["cell_id", "distance"]
+
+
+def test_nearby_radius_bbox_and_index_reuse():
+    fid = _upload()
+    r = client.post("/tools/data_nearby", json={
+        "file_id": fid, "mode": "radius", "radius": 60, "center": {"x": 100, "y": 200, "z": 300}, "limit": 1000,
+    }).json()
+    dist = np.sqrt(((PTS - [100, 200, 300]) ** 2).sum(axis=1))
+    assert r["count"] == int((dist <= 60).sum())
+    grid = DATA_MEMORY.spatial_index(fid)
+    assert DATA_MEMORY.spatial_index(fid) is grid  # cached per table version
+    r = client.post("/tools/data_nearby", json={
+        "file_id": fid, "mode": "bbox", "lower": {"x": 0, "y": 0, "z": 0}, "upper": {"x": 100, "y": 100, "z": 100}, "limit": 3,
+    }).json()
+    assert r["count"] == int((PTS <= 100).all(axis=1).sum()) and len(r["rows"]) == 3 and r["truncated"]
+
+
+def test_nearby_errors():
+    fid = _upload()
+    assert "error" in client.post("/tools/data_nearby", json={"k": 3}).json()
+    assert "error" in client.post("/tools/data_nearby", json={"file_id": fid, "center_columns": ["a", "b", "c"]}).json()
+    assert "error" in client.post("/tools/data_nearby", json={"file_id": fid, "mode": "radius"}).json()
+
+
+def test_count_pyramid_levels_and_bounded_cells():
+    pyr = CountPyramid(PTS)
+    assert [int(c.sum()) for _, c in pyr.levels] == [len(PTS)] * len(pyr.levels)
+    assert len(pyr.levels[-1][0]) == 1
+    lower, upper = [0, 0, 0], [1000, 1000, 1000]
+    level = pyr.level_for(lower, upper, 64)
+    corners, counts = pyr.cells(lower, upper, level)
+    assert len(counts) <= 64 and counts.sum() == len(PTS)
+    lower, upper = [200, 300, 400], [260, 330, 470]
+    inside = int(((PTS >= lower) & (PTS <= upper)).all(axis=1).sum())
+    assert pyr.estimate(lower, upper, 512) >= inside
+
+
+def _view(position, scale, layout="xy"):
+    s = NeuroglancerState()
+    s.data["dimensions"] = {"x": [4e-9, "m"], "y": [4e-9, "m"], "z": [40e-9, "m"]}
+    s.data["position"] = position
+    s.data["crossSectionScale"] = scale
+    s.data["layout"] = layout
+    return s
+
+
+def test_in_view_points_when_zoomed_in_density_when_zoomed_out():
+    fid = _upload()
+    backend_main.CURRENT_STATE = _view([500.0, 500.0, 500.0], 0.1)  # ~102 x 102 x 10 voxels
+    r = client.post("/tools/data_in_view", json={"file_id": fid, "columns": ["cell_id"], "max_points": 100}).json()
+    assert r["mode"] == "points"
+    lower, upper = np.array(r["view"]["lower"]), np.array(r["view"]["upper"])
+    assert np.allclose(upper - lower, [102.4, 102.4, 10])
+    expected = np.flatnonzero(((PTS >= lower) & (PTS <= upper)).all(axis=1))
+    assert [row["cell_id"] for row in r["rows"]] == expected.tolist()
+
+    backend_main.CURRENT_STATE = _view([500.0, 500.0, 500.0], 100.0, layout="3d")
+    backend_main.CURRENT_STATE.data["projectionScale"] = 1e5
+    r = client.post("/tools/data_in_view", json={"file_id": fid, "max_bins": 100}).json()
+    bins = r["bins"]
+    assert r["mode"] == "density" and len(bins["count"]) == len(bins["lower"]) <= 100
+    assert r["approx_count"] == sum(bins["count"]) == len(PTS)
+    assert bins["count"][0] >= bins["count"][-1] and r["cell_size"] > 0
+
+
+def test_nearby_default_answer_fits_tool_output_budget():
+    fid = _upload()
+    r = client.post("/tools/data_nearby", json={
+        "file_id": fid, "mode": "radius", "radius": 300, "center": {"x": 500, "y": 500, "z": 500},
+    }).json()
+    assert r["truncated"] and len(r["rows"]) == 20
+    assert json.loads(backend_main._truncate_tool_output(r)) == r
+
+
+def test_in_view_default_answer_fits_tool_output_budget():
+    fid = _upload()
+    backend_main.CURRENT_STATE = _view([500.0, 500.0, 500.0], 100.0, layout="3d")
+    backend_main.CURRENT_STATE.data["projectionScale"] = 1e5
+    for state in (_view([500.0, 500.0, 500.0], 0.3), _view([500.0, 500.0, 500.0], 2.0), backend_main.CURRENT_STATE):
+        backend_main.CURRENT_STATE = state
+        r = client.post("/tools/data_in_view", json={"file_id": fid}).json()
+        assert json.loads(backend_main._truncate_tool_output(r)) == r, r["mode"]
+
+
+def _brute_nearest(q, pts, r):
+    d = np.sqrt(((q[:, None, :] - pts[None, :, :]) ** 2).sum(axis=-1))
+    return np.where(d.min(axis=1) <= r, d.argmin(axis=1), -1)
+
+
+def test_nearest_within_matches_brute_force_both_paths():
+    q = rng.uniform(0, 1000, size=(800, 3))
+    pts = PTS[:1500]
+    for grid in (GridIndex(pts, min_cell_size=80.0), GridIndex(pts, cell_size=25.0)):  # half-cell / multi-cell
+        idx, dist = grid.nearest_within(q, 40.0, workers=2)
+        assert idx.tolist() == _brute_nearest(q, pts, 40.0).tolist()
+        assert np.all(np.isinf(dist[idx < 0])) and np.all(dist[idx >= 0] <= 40.0)
+
+
+def test_match_points_one_to_one_is_injective():
+    right = PTS[rng.permutation(len(PTS))] + rng.normal(0, 0.5, size=PTS.shape)
+    li, ri, d = match_points(PTS, right, 3.0, "one_to_one")
+    assert len(set(ri.tolist())) == len(ri) and np.all(d <= 3.0)
+    assert len(li) > 0.95 * len(PTS)
+    crowd = np.zeros((3, 3))  # three left points, one right point
+    li, ri, _ = match_points(crowd, np.zeros((1, 3)), 1.0, "one_to_one")
+    assert len(li) == 1
+    li, ri, _ = match_points(crowd, np.zeros((1, 3)), 1.0, "many_to_one")
+    assert li.tolist() == [0, 1, 2] and ri.tolist() == [0, 0, 0]
+
+
+def test_spatial_join_endpoint():
+    left = pl.DataFrame({"cell_id": [1, 2, 3], "x": [0.0, 10.0, 50.0], "y": [0.0] * 3, "z": [0.0] * 3})
+    right = pl.DataFrame({"cell_id": [7, 8], "x": [0.4, 10.5], "y": [0.0, 0.2], "z": [0.0] * 2, "gene": ["a", "b"]})
+    ids = [
+        client.post("/upload_file", files={"file": (f"{n}.csv", df.write_csv().encode(), "text/csv")}).json()["file"]["file_id"]
+        for n, df in (("round1", left), ("round2", right))
+    ]
+    r = client.post("/tools/data_spatial_join", json={"left_id": ids[0], "right_id": ids[1], "tolerance": 1.0}).json()
+    assert r["n_matched"] == 2 and r["summary"]["kind"] == "spatial_join"
+    assert [(row["cell_id"], row["cell_id_right"], row["gene"]) for row in r["preview_rows"]] == [(1, 7, "a"), (2, 8, "b")]
+    r = client.post("/tools/data_spatial_join", json={"left_id": ids[0], "right_id": ids[1], "tolerance": 1.0, "how": "left"}).json()
+    assert [row["gene"] for row in r["preview_rows"]] == ["a", "b", None]
+    assert r["summary"]["depends_on"] == ids
+    assert "error" in client.post("/tools/data_spatial_join", json={"left_id": ids[0], "right_id": "nope", "tolerance": 1}).json()
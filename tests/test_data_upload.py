@@ -0,0 +1,206 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main as backend_main
+from neurogabber.backend.main import app, DATA_MEMORY
+from neurogabber.backend.storage.data import DataMemory
+
+client = TestClient(app)
+
+
+def _csv(n: int) -> bytes:
+    return b"cell_id,x,y,z\n" + b"".join(f"{i},{i},{i * 2},{i * 3}\n".encode() for i in range(n))
+
+
+def test_chunked_upload_is_stored_as_ipc_on_disk(monkeypatch):
+    monkeypatch.setattr(backend_main, "UPLOAD_CHUNK_BYTES", 64)
+    content = _csv(500)
+    r = client.post("/upload_file", files={"file": ("big.csv", content, "text/csv")}).json()
+    assert r["ok"], r
+    meta = r["file"]
+    assert (meta["n_rows"], meta["columns"], meta["size"]) == (500, ["cell_id", "x", "y", "z"], len(content))
+    rec = DATA_MEMORY.files[meta["file_id"]]
+    assert rec.path.endswith(".arrow") and os.path.exists(rec.path)
+    assert rec._df is None  # metadata did not load the table
+    assert DATA_MEMORY.get_lazy(meta["file_id"]).select("z").sum().collect().item() == 3 * sum(range(500))
+    assert not [p for p in os.listdir(DATA_MEMORY.data_dir) if p.endswith(".part")]
+
+
+def test_upload_size_limit_and_parse_errors(monkeypatch):
+    monkeypatch.setattr(backend_main, "MAX_FILE_BYTES", 100)
+    r = client.post("/upload_file", files={"file": ("big.csv", _csv(50), "text/csv")}).json()
+    assert r["ok"] is False and "too large" in r["error"]
+    monkeypatch.undo()
+    r = client.post("/upload_file", files={"file": ("bad.csv", b"a,b\n1,2\n3\n4,5,6,7\n", "text/csv")}).json()
+    assert r["ok"] is False
+    assert not [p for p in os.listdir(DATA_MEMORY.data_dir) if p.endswith(".part")]
+
+
+def test_add_file_bytes_path(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    meta = mem.add_file("t.csv", _csv(3))
+    assert mem.get_df(meta["file_id"]).height == 3
+    assert [p.suffix for p in mem.data_dir.iterdir()] == [".arrow"]
+
+
+def test_memory_budget_spills_cold_tables(tmp_path):
+    import polars as pl
+
+    frame = lambda k: pl.DataFrame({"a": list(range(k, k + 1000)), "b": [float(k)] * 1000})
+    mem = DataMemory(data_dir=str(tmp_path), memory_budget=int(frame(0).estimated_size() * 1.5))
+    fid = mem.add_file("t.csv", _csv(1000))["file_id"]
+    s1 = mem.add_summary(fid, "select", frame(1))["summary_id"]
+    s2 = mem.add_summary(fid, "select", frame(2))["summary_id"]
+    rec1 = mem.summaries[s1]
+    assert rec1._df is None and rec1.path.endswith(f"summary-{s1}.arrow")
+    assert [m["n_rows"] for m in mem.list_summaries()] == [1000, 1000]  # metadata only
+    assert mem.budget.resident_bytes <= mem.budget.max_bytes
+    assert mem.get_summary_df(s1).equals(frame(1))  # reloads, evicting s2
+    assert mem.summaries[s2]._df is None
+    assert mem.get_df(fid).height == 1000
+    assert mem.files[fid].path.endswith(".arrow")
+    assert mem.budget.stats()["spills"] >= 2
+
+
+def test_columnar_uploads_detected_by_magic_bytes(tmp_path):
+    import io
+
+    import polars as pl
+    import pytest
+
+    df = pl.DataFrame({"cell_id": [1, 2, 3], "x": [0.5, 1.5, 2.5], "label": ["a", "b", "c"]})
+    payloads = {}
+    for fmt, write in {
+        "parquet": df.write_parquet,
+        "ipc": df.write_ipc,
+        "ipc_stream": df.write_ipc_stream,
+    }.items():
+        buf = io.BytesIO()
+        write(buf)
+        payloads[fmt] = buf.getvalue()
+    for fmt, raw in payloads.items():
+        # deliberately misleading name: detection uses the header
+        r = client.post("/upload_file", files={"file": ("table.bin", raw, "application/octet-stream")}).json()
+        assert r["ok"], (fmt, r)
+        assert r["file"]["format"] == fmt
+        out = DATA_MEMORY.get_df(r["file"]["file_id"])
+        assert out.equals(df), fmt
+    r = client.post("/upload_file", files={"file": ("t.tsv", b"a\tb\n1\t2\n", "text/tab-separated-values")}).json()
+    assert r["file"]["columns"] == ["a", "b"]
+    mem = DataMemory(data_dir=str(tmp_path))
+    for name, raw in {"old.feather": b"FEA1....", "fake.parquet": b"a,b\n1,2\n"}.items():
+        path = tmp_path / name
+        path.write_bytes(raw)
+        with pytest.raises(ValueError):
+            mem.add_file_path(name, str(path))
+
+
+def test_column_stats_computed_at_ingest(tmp_path):
+    mem = DataMemory(data_dir=str(tmp_path))
+    raw = b"id,x,region\n" + b"".join(f"{i},{i if i % 10 else ''},r{i % 3}\n".encode() for i in range(100))
+    fid = mem.add_file("t.csv", raw)["file_id"]
+    rec = mem.files[fid]
+    stats = rec.wait_stats(timeout=30)
+    assert stats["n_rows"] == 100 and rec.stats_status() == "ready"
+    x = stats["columns"]["x"]
+    assert (x["min"], x["max"], x["null_count"]) == (1, 99, 10)
+    assert x["quantiles"]["p50"] == 50.0
+    assert sum(x["histogram"]["counts"]) == 90 and len(x["histogram"]["edges"]) == 11
+    assert stats["columns"]["region"]["distinct"] == 3
+    assert rec._df is None  # computed from a scan, nothing left resident
+
+
+def test_info_describe_and_context_use_stats(monkeypatch):
+    content = _csv(50)
+    fid = client.post("/upload_file", files={"file": ("s.csv", content, "text/csv")}).json()["file"]["file_id"]
+    DATA_MEMORY.files[fid].wait_stats(timeout=30)
+    info = client.post("/tools/data_info", json={"file_id": fid}).json()
+    assert info["stats"]["z"]["max"] == 147
+    desc = client.post("/tools/data_describe", json={"file_id": fid}).json()
+    by_stat = {row["statistic"]: row for row in desc["rows"]}
+    assert by_stat["count"]["x"] == 50 and by_stat["max"]["y"] == 98
+    block = backend_main._data_context_block(max_files=1000)
+    assert f"{fid} s.csv" in block and "z:ui8[0..147]" in block  # stored narrow (ingest dtype pass)
+
+
+def test_lazy_summaries_drop_and_rebuild(tmp_path):
+    import polars as pl
+
+    mem = DataMemory(data_dir=str(tmp_path), memory_budget=0)
+    fid = mem.add_file("t.csv", _csv(100))["file_id"]
+    build = lambda lazy_table: lazy_table(fid).filter(pl.col("x") < 10)
+    s1 = mem.add_derived(fid, "select", build, {"op": "select"}, df=build(mem.lazy_table).collect())["summary_id"]
+    s2 = mem.add_derived(s1, "select", lambda t: t(s1).select("z"), {"op": "select"})["summary_id"]
+    rec1, rec2 = mem.summaries[s1], mem.summaries[s2]
+    assert rec1.n_rows == 10 and rec2.n_rows is None and rec2.columns == ["z"]
+    mem.get_summary_df(s2)  # budget 0: reading s2 evicts s1 without spilling it
+    assert rec1._df is None and rec1.path is None
+    assert not list(mem.data_dir.glob("summary-*"))
+    assert mem.get_summary_df(s1).height == 10 and rec2.n_rows == 10
+    assert mem.dependents(fid) == [s1, s2]
+    mem.add_summary(s2, "ng_views", pl.DataFrame({"a": [1]}))
+    affected = mem.invalidate(fid)
+    assert len(affected) == 3 and rec1._df is None and rec1.version == 1
+    assert [m["stale"] for m in mem.list_summaries()] == [False, False, True]
+    assert mem.refresh_summary(s2)["n_rows"] == 10
+
+
+def test_ingest_narrows_dtypes_losslessly(tmp_path):
+    import polars as pl
+
+    from neurogabber.backend.tools.query import PLAN_CACHE, run_sql
+
+    mem = DataMemory(data_dir=str(tmp_path))
+    rows = [f"{i},{i * 0.5},{i * 0.1},CA{i % 3},{1000 + i},name{i}\n" for i in range(200)]
+    fid = mem.add_file("cells.csv", b"cell_id,x,score,region,size,label\n" + "".join(rows).encode())["file_id"]
+    meta = mem.files[fid].to_meta()
+    assert meta["optimized_bytes"] < meta["original_bytes"]
+    schema = mem.get_lazy(fid).collect_schema()
+    assert schema["cell_id"] == pl.UInt8 and schema["size"] == pl.Int16
+    assert schema["x"] == pl.Float32  # halves round-trip exactly; tenths do not
+    assert schema["score"] == pl.Float64 and schema["label"] == pl.String
+    assert schema["region"] == pl.Categorical
+    assert meta["dtype_changes"]["cell_id"] == "Int64 -> UInt8"
+    df = mem.get_df(fid)
+    assert df["x"].to_list()[:3] == [0.0, 0.5, 1.0] and df["region"][4] == "CA1"
+    # SQL and computed columns run on widened dtypes: no wraparound, string functions work
+    out = run_sql({"t": mem.get_lazy(fid)}, "SELECT cell_id * size * size AS v FROM t WHERE region LIKE 'CA1%' ORDER BY v DESC LIMIT 1")
+    assert out["v"][0] == 199 * 1199 * 1199
+    big = PLAN_CACHE.compiled(schema.names(), computed=[{"name": "v", "expr": "size * size * size"}]).apply(mem.get_lazy(fid)).collect()
+    assert big["v"].max() == 1199**3
+
+
+def test_identical_upload_aliases_without_parsing(tmp_path, monkeypatch):
+    from neurogabber.backend.storage import data as data_mod
+
+    mem = DataMemory(data_dir=str(tmp_path))
+    first = mem.add_file("cells.csv", _csv(300))
+    assert first["parse_skipped"] is False and first["content_hash"]
+
+    def no_parse(*_):
+        raise AssertionError("duplicate content was parsed again")
+
+    monkeypatch.setattr(data_mod, "_write_ipc", no_parse)
+    second = mem.add_file("cells copy.csv", _csv(300))
+    assert second["parse_skipped"] is True and second["alias_of"] == first["file_id"]
+    assert second["file_id"] != first["file_id"] and second["name"] == "cells copy.csv"
+    assert (second["n_rows"], second["columns"]) == (300, first["columns"])
+    src, alias = mem.files[first["file_id"]], mem.files[second["file_id"]]
+    assert alias.path == src.path and alias._stats is src._stats
+    assert len([p for p in os.listdir(mem.data_dir) if p.endswith(".arrow")]) == 1
+    df = mem.get_df(first["file_id"])
+    assert mem.get_df(second["file_id"]) is df and alias.resident_bytes() == 0
+    assert mem.budget.resident_bytes == df.estimated_size()
+    monkeypatch.undo()
+    other = mem.add_file("cells.csv", _csv(301))
+    assert other["parse_skipped"] is False and other["alias_of"] is None
+
+
+def test_duplicate_upload_endpoint_reports_skip():
+    content = _csv(50) + b"999,1,2,3\n"
+    a = client.post("/upload_file", files={"file": ("dup.csv", content, "text/csv")}).json()["file"]
+    b = client.post("/upload_file", files={"file": ("dup.csv", content, "text/csv")}).json()["file"]
+    assert (a["parse_skipped"], b["parse_skipped"], b["alias_of"]) == (False, True, a["file_id"])
+    sel = client.post("/tools/data_select", json={"file_id": b["file_id"], "filters": [{"column": "cell_id", "op": "==", "value": 999}]}).json()
+    assert sel["preview_rows"] == [{"cell_id": 999, "x": 1, "y": 2, "z": 3}]
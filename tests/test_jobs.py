@@ -0,0 +1,131 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import jobs, main
+from neurogabber.backend.jobs import JobManager
+from neurogabber.backend.main import app
+
+client = TestClient(app)
+
+
+def test_job_runs_reports_progress_and_returns_result():
+    mgr = JobManager(workers=1)
+    gate = threading.Event()
+
+    def work(ctx):
+        ctx.report(0.5, "halfway")
+        gate.wait(5)
+        return {"value": 42}
+
+    job = mgr.submit("demo", work)
+    for _ in range(100):
+        if job.message == "halfway":
+            break
+        time.sleep(0.01)
+    meta = job.to_meta()
+    assert (meta["status"], meta["progress"], meta["message"]) == ("running", 0.5, "halfway")
+    gate.set()
+    assert job.wait(5)
+    assert job.to_meta()["result"] == {"value": 42} and job.progress == 1.0
+
+
+def test_jobs_dedupe_by_key_and_retry_after_error():
+    mgr = JobManager(workers=2)
+    calls = []
+
+    def work(ctx):
+        calls.append(1)
+        return {"n": len(calls)}
+
+    first = mgr.submit("demo", work, key=("demo", 1))
+    first.wait(5)
+    assert mgr.submit("demo", work, key=("demo", 1)) is first
+    assert len(calls) == 1
+    failing = mgr.submit("demo", lambda ctx: 1 / 0, key=("bad",))
+    failing.wait(5)
+    assert failing.status == jobs.ERROR and "division" in failing.error
+    assert mgr.submit("demo", lambda ctx: {"ok": True}, key=("bad",)) is not failing
+
+
+def test_cancel_running_and_queued_jobs():
+    mgr = JobManager(workers=1)
+    started = threading.Event()
+
+    def spin(ctx):
+        started.set()
+        while True:
+            ctx.check()
+            time.sleep(0.01)
+
+    running = mgr.submit("spin", spin)
+    queued = mgr.submit("never", lambda ctx: {"ran": True})
+    assert started.wait(5)
+    mgr.cancel(queued.job_id)
+    mgr.cancel(running.job_id)
+    assert running.wait(5) and queued.wait(5)
+    assert running.status == queued.status == jobs.CANCELLED
+    assert queued.started is None
+
+
+def test_cleanup_runs_for_every_terminal_status():
+    mgr = JobManager(workers=1)
+    cleaned = []
+    gate = threading.Event()
+    blocker = mgr.submit("block", lambda ctx: gate.wait(5), cleanup=lambda: cleaned.append("block"))
+    queued = mgr.submit("never", lambda ctx: {"ran": True}, cleanup=lambda: cleaned.append("queued"))
+    mgr.cancel(queued.job_id)
+    assert queued.wait(5) and queued.status == jobs.CANCELLED and cleaned == ["queued"]
+    gate.set()
+    assert blocker.wait(5) and cleaned == ["queued", "block"]
+    failing = mgr.submit("bad", lambda ctx: 1 / 0, cleanup=lambda: cleaned.append("bad"))
+    assert failing.wait(5) and cleaned[-1] == "bad"
+    done = mgr.submit("demo", lambda ctx: 1, key=("k",))
+    done.wait(5)
+    assert mgr.submit("demo", lambda ctx: 2, key=("k",), cleanup=lambda: cleaned.append("dup")) is done
+    assert cleaned[-1] == "dup"
+
+
+def test_module_report_is_noop_outside_jobs():
+    jobs.report(0.5, "ignored")
+    jobs.check_cancelled()
+
+
+def test_background_tool_returns_handle_then_job_status(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(main, "sample_voxels", lambda layer, roi=None: (gate.wait(5), [1, 2, 3])[1])
+    handle = main._execute_tool_in_job("data_plot_histogram", {"layer": "em", "roi": {"n": 1}}, wait=0.05)
+    assert handle["status"] in ("queued", "running") and "job_status" in handle["note"]
+    gate.set()
+    res = client.post("/tools/job_status", json={"job_id": handle["job_id"], "wait": 5}).json()
+    assert res["status"] == "done" and len(res["result"]["hist"]) == 256
+    # an identical call reuses the finished job's result
+    again, status = main._execute_tool_memoized("data_plot_histogram", {"layer": "em", "roi": {"n": 1}})
+    assert again == res["result"] and status is None
+    assert any(j["job_id"] == handle["job_id"] for j in client.get("/jobs").json()["jobs"])
+    assert "error" in client.post("/tools/job_status", json={"job_id": "nope"}).json()
+
+
+def test_background_upload():
+    content = b"cell_id,x\n" + b"".join(f"{i},{i}\n".encode() for i in range(100))
+    resp = client.post("/upload_file", params={"background": "true"}, files={"file": ("bg.csv", content, "text/csv")}).json()
+    assert resp["ok"] and "job" in resp
+    done = client.get(f"/jobs/{resp['job']['job_id']}", params={"wait": 10}).json()
+    assert done["status"] == "done", done
+    assert done["result"]["n_rows"] == 100 and done["result"]["file_id"] in main.DATA_MEMORY.files
+
+
+def test_cancelled_background_upload_removes_spool(monkeypatch):
+    mgr = JobManager(workers=1)
+    gate = threading.Event()
+    mgr.submit("block", lambda ctx: gate.wait(5))
+    monkeypatch.setattr(main, "JOBS", mgr)
+    spools = lambda: {p.name for p in main.DATA_MEMORY.data_dir.glob("upload-*.part")}
+    before = spools()
+    resp = client.post("/upload_file", params={"background": "true"}, files={"file": ("queued.csv", b"a\n1\n", "text/csv")}).json()
+    assert len(spools() - before) == 1
+    mgr.cancel(resp["job"]["job_id"])
+    gate.set()
+    assert mgr.get(resp["job"]["job_id"]).status == jobs.CANCELLED
+    assert spools() == before
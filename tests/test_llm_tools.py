@@ -14,6 +14,11 @@ def test_tool_names_are_underscored_and_valid():
         "ng_set_view",
         "ng_set_lut",
         "ng_annotations_add",
+        "ng_annotations_upsert",
+        "ng_annotations_delete",
+        "ng_annotations_replace",
+        "ng_annotations_query",
+        "ng_annotations_from_table",
         "ng_add_layer",
         "ng_set_layer_visibility",
         "data_plot_histogram",
@@ -29,5 +34,10 @@ def test_tool_names_are_underscored_and_valid():
         "data_preview",
         "data_describe",
         "data_select",
+        "data_sql",
+        "data_nearby",
+        "data_in_view",
+        "data_spatial_join",
+        "job_status",
         "data_list_summaries",
     }
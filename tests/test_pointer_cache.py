@@ -0,0 +1,286 @@
+"""Tests for the pointer-resolution cache (TTL, revalidation, LRU, pooled clients)."""
+
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+import pytest
+
+from neurogabber.backend.tools import pointer_expansion as pe
+from neurogabber.backend.tools.pointer_expansion import (
+    CachedPointer,
+    PointerCache,
+    _cached_fetch,
+    resolve_neuroglancer_pointer,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _StateHandler(BaseHTTPRequestHandler):
+    body = json.dumps({"position": [1, 2, 3]}).encode()
+    etag = '"v1"'
+    send_length = True
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        if self.send_length:
+            self.send_header("Content-Length", str(len(self.body)))
+        else:
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_state():
+    _StateHandler.requests = []
+    _StateHandler.etag = '"v1"'
+    _StateHandler.send_length = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StateHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/state.json"
+    server.shutdown()
+
+
+def test_http_fresh_hit_skips_network_then_revalidates(http_state):
+    clock = FakeClock()
+    cache = PointerCache(ttl=60, clock=clock)
+    assert json.loads(_cached_fetch(http_state, cache)) == {"position": [1, 2, 3]}
+    _cached_fetch(http_state, cache)
+    assert _StateHandler.requests == [None]  # second call served from cache
+    clock.now = 120
+    _cached_fetch(http_state, cache)
+    assert _StateHandler.requests == [None, '"v1"']
+    assert cache.stats()["revalidated"] == 1
+    clock.now = 240
+    _StateHandler.etag = '"v2"'
+    _cached_fetch(http_state, cache)
+    assert cache.get(http_state).etag == '"v2"'
+    assert cache.stats()["misses"] == 2
+
+
+def test_resolve_uses_shared_cache(http_state):
+    pe.POINTER_CACHE.clear()
+    for _ in range(3):
+        state, was_pointer = resolve_neuroglancer_pointer(http_state)
+        assert was_pointer and state["position"] == [1, 2, 3]
+    assert len(_StateHandler.requests) == 1
+    pe.POINTER_CACHE.clear()
+
+
+class FakeS3:
+    class NotModified(Exception):
+        response = {"Error": {"Code": "304"}}
+
+    class _Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self, amt=None):
+            out, self.data = (self.data, b"") if amt is None else (self.data[:amt], self.data[amt:])
+            return out
+
+    def __init__(self):
+        self.objects = {("b", "k.json"): (b'{"layers": []}', '"e1"')}
+        self.calls = []
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.calls.append(IfNoneMatch)
+        data, etag = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            raise self.NotModified()
+        return {"Body": self._Body(data), "ETag": etag}
+
+
+def test_s3_client_pooled_and_revalidated():
+    fake = FakeS3()
+    built = []
+
+    def factory(name):
+        built.append(name)
+        return fake
+
+    clock = FakeClock()
+    cache = PointerCache(ttl=10, clock=clock)
+    with patch.object(pe, "_HAS_BOTO3", True), patch.object(pe, "boto3", create=True) as boto:
+        boto.client = factory
+        assert _cached_fetch("s3://b/k.json", cache) == '{"layers": []}'
+        clock.now = 20
+        assert _cached_fetch("s3://b/k.json", cache) == '{"layers": []}'
+        pe._cached_fetch("s3://b/k.json", PointerCache(ttl=10, clock=clock))
+    assert built == ["s3"]
+    assert fake.calls == [None, '"e1"', None]
+
+
+def test_lru_evicts_by_count_and_bytes():
+    cache = PointerCache(ttl=60, max_entries=2, max_bytes=10)
+    cache.put("a", CachedPointer("1234"))
+    cache.put("b", CachedPointer("1234"))
+    cache.get("a")  # a becomes most recent
+    cache.put("c", CachedPointer("12"))
+    assert cache.get("b") is None and cache.get("a") is not None
+    cache.put("d", CachedPointer("123456789"))
+    assert len(cache) == 1 and cache.stats()["bytes"] == 9
+    cache.put("huge", CachedPointer("x" * 11))
+    assert cache.get("huge") is None
+
+
+@pytest.mark.asyncio
+async def test_async_fetch_coalesces_concurrent_requests():
+    import asyncio
+
+    calls = []
+
+    async def slow_fetch(url, cached):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        return CachedPointer('{"layers": []}')
+
+    cache = PointerCache(ttl=60)
+    with patch.object(pe, "_conditional_fetch_async", slow_fetch):
+        texts = await asyncio.gather(*(pe.cached_fetch_async("s3://b/x.json", cache) for _ in range(5)))
+        assert texts == ['{"layers": []}'] * 5
+        await pe.cached_fetch_async("s3://b/x.json", cache)
+    assert calls == ["s3://b/x.json"]
+    assert not pe._INFLIGHT
+
+
+@pytest.mark.asyncio
+async def test_async_resolve_timeout():
+    import asyncio
+
+    async def hang(url, cached):
+        await asyncio.sleep(5)
+
+    with patch.object(pe, "_conditional_fetch_async", hang):
+        with pytest.raises(ValueError, match="Timed out"):
+            await pe.resolve_neuroglancer_pointer_async("gs://b/slow.json", timeout=0.05)
+
+
+def test_state_resolve_endpoint(http_state):
+    from fastapi.testclient import TestClient
+    from neurogabber.backend import main as backend_main
+
+    pe.POINTER_CACHE.clear()
+    client = TestClient(backend_main.app)
+    r = client.post("/tools/state_resolve", json={"link": f"https://viewer.example/#!{http_state}"}).json()
+    assert r["ok"] and r["was_pointer"]
+    assert r["url"].startswith("https://viewer.example/#!")
+    assert backend_main.CURRENT_STATE.as_dict()["position"] == [1, 2, 3]
+    r = client.post("/tools/state_resolve", json={"link": f"https://viewer.example/#!{http_state}", "load": False}).json()
+    assert r["ok"] and len(_StateHandler.requests) == 1
+    r = client.post("/tools/state_resolve", json={"link": "https://viewer.example/#!ftp://nope/x.json"}).json()
+    assert r["ok"] is False
+    pe.POINTER_CACHE.clear()
+
+
+@pytest.mark.parametrize("sep", ["#", "#!"])
+def test_state_resolve_inline_fragment_is_not_fetched(sep):
+    from urllib.parse import quote
+    from fastapi.testclient import TestClient
+    from neurogabber.backend import main as backend_main
+
+    link = "https://neuroglancer-demo.appspot.com/" + sep + quote(json.dumps({"position": [4, 5, 6]}))
+    with patch.object(pe, "_conditional_fetch_async", side_effect=AssertionError("fetched")):
+        r = TestClient(backend_main.app).post("/tools/state_resolve", json={"link": link}).json()
+    assert r == {"ok": True, "url": link, "was_pointer": False}
+    assert backend_main.CURRENT_STATE.as_dict()["position"] == [4, 5, 6]
+
+
+@pytest.mark.parametrize("send_length", [True, False])
+def test_oversized_pointer_rejected(http_state, send_length):
+    _StateHandler.send_length = send_length
+    with patch.object(pe, "POINTER_MAX_BYTES", 8), patch.object(pe, "_READ_CHUNK", 4):
+        with pytest.raises(pe.PointerTooLarge):
+            _cached_fetch(http_state, PointerCache())
+        with pytest.raises(pe.PointerTooLarge):
+            asyncio_run(pe.resolve_neuroglancer_pointer_async(http_state))
+
+
+def test_gcs_size_checked_before_download():
+    blob = Mock(size=100, generation=7)
+    client = Mock()
+    client.bucket.return_value.blob.return_value = blob
+    with patch.object(pe, "_HAS_GCS", True), patch.object(pe, "gcs", create=True), \
+            patch.object(pe, "_pooled_client", return_value=client), patch.object(pe, "POINTER_MAX_BYTES", 8):
+        with pytest.raises(pe.PointerTooLarge):
+            pe._fetch_gs_conditional("gs://b/big.json")
+        blob.open.assert_not_called()
+        blob.size = None  # metadata missing: the streamed read is still bounded
+        blob.open.return_value = io.BytesIO(b"x" * 100)
+        with patch.object(pe, "_READ_CHUNK", 4), pytest.raises(pe.PointerTooLarge):
+            pe._fetch_gs_conditional("gs://b/big.json")
+        blob.open.assert_called_with("rb", if_generation_match=7)
+
+
+def test_s3_body_bounded_without_content_length():
+    fake = FakeS3()
+    fake.objects[("b", "big.json")] = (b"x" * 100, '"e2"')
+    with patch.object(pe, "_HAS_BOTO3", True), patch.object(pe, "_pooled_client", return_value=fake), \
+            patch.object(pe, "POINTER_MAX_BYTES", 8), patch.object(pe, "_READ_CHUNK", 4):
+        with pytest.raises(pe.PointerTooLarge):
+            pe._fetch_s3_conditional("s3://b/big.json")
+
+
+def asyncio_run(coro):
+    import asyncio
+    return asyncio.run(coro)
+
+
+def test_pointer_loads_recorded_in_timing(http_state):
+    from neurogabber.backend.observability import timing
+
+    pe.POINTER_CACHE.clear()
+    timing._recent_pointer_loads.clear()
+    resolve_neuroglancer_pointer(http_state)
+    resolve_neuroglancer_pointer(http_state)
+    with timing.pointer_load("mem://x", trace_memory=True) as load:
+        load.source = "custom"
+        blob = [0] * 100_000
+    del blob
+    stats = timing.get_pointer_load_stats()
+    assert stats["count"] == 3
+    assert stats["sources"] == {"network": 1, "cache": 1, "custom": 1}
+    assert stats["recent"][0]["size_bytes"] == len(_StateHandler.body)
+    assert stats["max_peak_memory_bytes"] >= 100_000 * 8
+    pe.POINTER_CACHE.clear()
+
+
+def test_overlapping_traced_loads_report_no_peak():
+    import tracemalloc
+    from neurogabber.backend.observability import timing
+
+    a = timing.pointer_load("mem://a", trace_memory=True)
+    b = timing.pointer_load("mem://b", trace_memory=True)
+    load_a, load_b = a.__enter__(), b.__enter__()
+    a.__exit__(None, None, None)
+    assert tracemalloc.is_tracing()  # b still needs it
+    blob = [0] * 200_000
+    b.__exit__(None, None, None)
+    del blob
+    assert load_a.peak_memory_bytes is None and load_b.peak_memory_bytes is None
+    assert not tracemalloc.is_tracing()
+    with timing.pointer_load("mem://c", trace_memory=True) as load_c:
+        blob = [0] * 200_000
+    del blob
+    assert load_c.peak_memory_bytes >= 200_000 * 8
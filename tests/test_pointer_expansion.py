@@ -2,6 +2,7 @@
 Tests for Neuroglancer JSON pointer expansion functionality.
 """
 
+import io
 import json
 import pytest
 from unittest.mock import Mock, patch
@@ -250,7 +251,7 @@ class TestFetchers:
         mock_boto3.client.return_value = mock_s3_client
         
         mock_body = Mock()
-        mock_body.read.return_value.decode.return_value = '{"test": "value"}'
+        mock_body.read.side_effect = [b'{"test": "value"}', b'']
         mock_response = {'Body': mock_body}
         mock_s3_client.get_object.return_value = mock_response
         
@@ -281,7 +282,7 @@ class TestFetchers:
         
         mock_bucket = Mock()
         mock_blob = Mock()
-        mock_blob.download_as_text.return_value = '{"test": "gs_value"}'
+        mock_blob.open.return_value = io.BytesIO(b'{"test": "gs_value"}')
         mock_bucket.blob.return_value = mock_blob
         mock_client.bucket.return_value = mock_bucket
         
@@ -306,7 +307,8 @@ class TestFetchers:
     def test_fetch_http_success(self, mock_urlopen):
         """Test successful HTTP fetch."""
         mock_response = Mock()
-        mock_response.read.return_value.decode.return_value = '{"test": "http_value"}'
+        mock_response.headers = {}
+        mock_response.read.side_effect = [b'{"test": "http_value"}', b'']
         mock_urlopen.return_value.__enter__.return_value = mock_response
         
         result = _fetch_http("https://example.com/state.json")
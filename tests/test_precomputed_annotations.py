@@ -0,0 +1,136 @@
+import json
+import os
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.precomputed_annotations import (
+    evict_sources,
+    read_annotation_by_id,
+    read_annotation_chunk,
+    write_point_annotations,
+)
+
+client = TestClient(app)
+
+
+def test_write_point_annotations_levels_cover_every_point(tmp_path):
+    rng = np.random.default_rng(0)
+    pts = rng.uniform(0, 100, size=(500, 3))
+    ids = np.arange(1000, 1500, dtype=np.uint64)
+    info = write_point_annotations(
+        str(tmp_path), pts, ids=ids, properties={"Mean Intensity": rng.uniform(size=500)}, limit=20
+    )
+    assert info["@type"] == "neuroglancer_annotations_v1"
+    assert info["annotation_type"] == "point"
+    assert info["properties"][0]["id"] == "mean_Intensity"
+    assert len(info["spatial"]) > 1
+    assert json.loads((tmp_path / "info").read_text()) == info
+
+    seen = []
+    for level in info["spatial"]:
+        level_dir = tmp_path / level["key"]
+        for name in os.listdir(level_dir):
+            chunk = read_annotation_chunk(str(level_dir / name), info)
+            assert len(chunk["ids"]) <= level["limit"]
+            seen.extend(chunk["ids"].tolist())
+            # points in a chunk lie inside that chunk's bounds
+            cell = np.array([int(v) for v in name.split("_")])
+            lo = np.array(info["lower_bound"]) + cell * np.array(level["chunk_size"])
+            assert (chunk["points"] >= lo - 1e-3).all()
+    assert sorted(seen) == ids.tolist()
+
+    rec = (tmp_path / "by_id" / "1000").read_bytes()
+    geom = np.frombuffer(rec[:12], dtype="<f4")
+    assert np.allclose(geom, pts[0], atol=1e-3)
+    assert len(rec) == 16  # 3 float32 coords + 1 float32 property
+    assert np.allclose(read_annotation_by_id(str(tmp_path), info, 1000)["geometry"], pts[0], atol=1e-3)
+
+
+def test_colliding_property_ids_are_suffixed(tmp_path):
+    pts = np.zeros((2, 3))
+    props = {"a-b": np.array([1, 2]), "a_b": np.array([3.5, 4.5]), "A_b": np.array([5, 6])}
+    info = write_point_annotations(str(tmp_path), pts, properties=props)
+    assert [(p["id"], p["description"]) for p in info["properties"]] == [("a_b", "a-b"), ("a_b_2", "a_b"), ("a_b_3", "A_b")]
+    rec = read_annotation_by_id(str(tmp_path), info, 1)
+    assert (rec["a_b"], rec["a_b_2"], rec["a_b_3"]) == (2, 4.5, 6)
+
+
+def test_large_by_id_index_is_sharded(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 20_000
+    pts = rng.uniform(0, 1000, size=(n, 3))
+    ids = rng.choice(10 * n, size=n, replace=False).astype(np.uint64)
+    info = write_point_annotations(str(tmp_path), pts, ids=ids, properties={"v": np.arange(n)}, limit=500)
+    sharding = info["by_id"]["sharding"]
+    assert sharding["hash"] == "identity" and sharding["minishard_bits"] + sharding["shard_bits"] == 7
+    files = os.listdir(tmp_path / "by_id")
+    assert len(files) == 1 << sharding["shard_bits"] and all(f.endswith(".shard") for f in files)
+    for i in rng.choice(n, size=50, replace=False):
+        rec = read_annotation_by_id(str(tmp_path), info, int(ids[i]))
+        assert np.allclose(rec["geometry"], pts[i], atol=1e-3) and rec["v"] == i
+    assert read_annotation_by_id(str(tmp_path), info, 10 * n + 1) is None
+
+
+def test_annotations_from_table_serves_precomputed_source():
+    content = b"cell_id,x,y,z,mean_intensity\n1,10,20,30,5.5\n2,11,21,31,6.5\n3,40,50,60,7.5\n"
+    fid = client.post("/upload_file", files={"file": ("cells.csv", content, "text/csv")}).json()["file"]["file_id"]
+    out = client.post("/tools/ng_annotations_from_table", json={
+        "layer": "cells", "file_id": fid, "id_column": "cell_id", "property_columns": ["mean_intensity"],
+    }).json()
+    assert out.get("ok"), out
+    assert out["count"] == 3
+    assert out["source"].startswith("precomputed://http")
+
+    summary = client.post("/tools/ng_state_summary", json={"detail": "minimal"}).json()
+    assert any(L["name"] == "cells" for L in summary["layers"])
+
+    path = "/precomputed/" + out["source"].rsplit("/", 1)[1]
+    info = client.get(f"{path}/info")
+    assert info.status_code == 200
+    assert info.headers["access-control-allow-origin"] == "*"
+    etag = info.headers["etag"]
+    assert client.get(f"{path}/info", headers={"If-None-Match": etag}).status_code == 304
+
+    rng = client.get(f"{path}/by_id/2", headers={"Range": "bytes=0-3"})
+    assert rng.status_code == 206
+    assert len(rng.content) == 4
+
+
+def test_annotations_from_table_rejects_bad_ids():
+    content = b"cell_id,x,y,z\n1,10,20,30\n1,11,21,31\n"
+    fid = client.post("/upload_file", files={"file": ("dup.csv", content, "text/csv")}).json()["file"]["file_id"]
+    out = client.post("/tools/ng_annotations_from_table", json={
+        "layer": "dups", "file_id": fid, "id_column": "cell_id",
+    }).json()
+    assert "error" in out
+
+
+def test_annotations_from_table_reuses_and_evicts_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PRECOMPUTED_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "PRECOMPUTED_KEEP", 1)
+    content = b"cell_id,x,y,z\n1,10,20,30\n2,11,21,31\n"
+    fid = client.post("/upload_file", files={"file": ("reuse.csv", content, "text/csv")}).json()["file"]["file_id"]
+    req = {"layer": "reuse", "file_id": fid, "id_column": "cell_id"}
+    first = client.post("/tools/ng_annotations_from_table", json=req).json()
+    again = client.post("/tools/ng_annotations_from_table", json=req).json()
+    assert (first["reused"], again["reused"]) == (False, True) and again["source"] == first["source"]
+    assert os.listdir(tmp_path) == [first["source"].rsplit("/", 1)[1]]
+
+    other = client.post("/tools/ng_annotations_from_table", json={**req, "layer": "other", "limit": 1}).json()
+    assert other["source"] != first["source"]
+    # both are referenced by the current state, so neither is evicted yet
+    assert len(os.listdir(tmp_path)) == 2
+    main.CURRENT_STATE.set_layer_source("reuse", "precomputed://gs://elsewhere/anns")
+    client.post("/tools/ng_annotations_from_table", json={**req, "layer": "other", "limit": 1})
+    assert os.listdir(tmp_path) == [other["source"].rsplit("/", 1)[1]]
+
+
+def test_evict_sources_keeps_most_recent(tmp_path):
+    for i, name in enumerate(["a", "b", "c", ".tmp"]):
+        (tmp_path / name).mkdir()
+        os.utime(tmp_path / name, (i, i))
+    assert evict_sources(str(tmp_path), keep=1, protect={"a"}) == ["b"]
+    assert sorted(os.listdir(tmp_path)) == [".tmp", "a", "c"]
@@ -0,0 +1,118 @@
+import polars as pl
+import pytest
+from fastapi.testclient import TestClient
+
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.query import PlanCache, QueryError, compile_query
+
+client = TestClient(app)
+
+DF = pl.DataFrame({
+    "cell_id": [1, 2, 3, 4, 5],
+    "region": ["CA1", "CA3", "DG", "CA1", None],
+    "intensity": [10.0, 20.0, 30.0, 40.0, 50.0],
+    "area": [2.0, 4.0, 5.0, 8.0, 10.0],
+})
+
+
+def _run(**query):
+    return compile_query(DF.columns, **query).apply(DF.lazy()).collect()
+
+
+def test_filter_grammar():
+    out = _run(filters=[{"column": "region", "op": "in", "value": ["CA1", "DG"]},
+                        {"column": "intensity", "op": "between", "value": [10, 30]}])
+    assert out["cell_id"].to_list() == [1, 3]
+    out = _run(filters=[{"any": [{"column": "region", "op": "is_null"},
+                                 {"column": "cell_id", "op": "==", "value": 2}]}])
+    assert out["cell_id"].to_list() == [2, 5]
+    out = _run(filters=[{"column": "region", "op": "contains", "value": "CA"},
+                        {"column": "region", "op": "not_in", "value": ["CA3"]}])
+    assert out["cell_id"].to_list() == [1, 4]
+
+
+def test_computed_columns_sort_and_projection():
+    out = _run(
+        computed=[{"name": "density", "expr": "intensity / area"}, {"name": "bright", "expr": "sqrt(intensity) > 5 and area < 9"}],
+        filters=[{"column": "bright", "op": "==", "value": True}],
+        columns=["cell_id", "density"],
+        sort_by="density",
+        descending=True,
+    )
+    assert out.columns == ["cell_id", "density"]
+    assert out["cell_id"].to_list() == [3, 4]
+
+
+@pytest.mark.parametrize("expr", ["__import__('os')", "intensity.__class__", "open('x')", "nope + 1", "[1, 2]"])
+def test_rejects_unsafe_or_unknown_expressions(expr):
+    with pytest.raises(QueryError):
+        compile_query(DF.columns, computed=[{"name": "bad", "expr": expr}])
+
+
+def test_plan_cache_hits_and_pushdown(tmp_path):
+    path = tmp_path / "t.arrow"
+    DF.write_ipc(path)
+    lf = pl.scan_ipc(path)
+    cache = PlanCache()
+    query = {"columns": ["cell_id"], "filters": [{"column": "area", "op": ">", "value": 3}], "limit": 2}
+    plan = cache.compiled(lf.collect_schema().names(), **query).apply(lf).explain()
+    assert "PROJECT 2/4" in plan
+    first = cache.run(("file", "t", 0), lf, **query)
+    again = cache.run(("file", "t", 0), lf, **dict(reversed(list(query.items()))))
+    assert first is again and (cache.hits, cache.misses) == (1, 1)
+    cache.invalidate(("file", "t"))
+    cache.run(("file", "t", 0), lf, **query)
+    assert cache.misses == 2
+
+
+def test_data_select_endpoint_filters_unselected_columns():
+    fid = client.post("/upload_file", files={"file": ("q.csv", DF.write_csv().encode(), "text/csv")}).json()["file"]["file_id"]
+    r = client.post("/tools/data_select", json={
+        "file_id": fid,
+        "columns": ["cell_id"],
+        "filters": [{"any": [{"column": "region", "op": "==", "value": "DG"}, {"column": "area", "op": ">=", "value": 10}]}],
+    }).json()
+    assert [row["cell_id"] for row in r["preview_rows"]] == [3, 5]
+    r = client.post("/tools/data_select", json={"file_id": fid, "filters": [{"column": "x", "op": "==", "value": 1}]}).json()
+    assert "error" in r
+
+
+def test_data_sql_joins_files_and_stores_summary():
+    rounds = pl.DataFrame({"cell_id": [1, 2, 3, 4], "round2": [1.0, 2.0, 3.0, 4.0]})
+    fid = client.post("/upload_file", files={"file": ("sqlcells.csv", DF.write_csv().encode(), "text/csv")}).json()["file"]["file_id"]
+    client.post("/upload_file", files={"file": ("Round 2.csv", rounds.write_csv().encode(), "text/csv")})
+    r = client.post("/tools/data_sql", json={"query": (
+        "SELECT c.region, AVG(c.intensity) AS mean_intensity, SUM(r.round2) AS r2 "
+        "FROM sqlcells c JOIN round_2 r ON c.cell_id = r.cell_id "
+        "WHERE c.intensity > 10 GROUP BY c.region ORDER BY c.region"
+    )}).json()
+    assert r["columns"] == ["region", "mean_intensity", "r2"], r
+    assert r["preview_rows"] == [
+        {"region": "CA1", "mean_intensity": 40.0, "r2": 4.0},
+        {"region": "CA3", "mean_intensity": 20.0, "r2": 2.0},
+        {"region": "DG", "mean_intensity": 30.0, "r2": 3.0},
+    ]
+    assert r["summary"]["kind"] == "sql" and r["summary"]["source_file_id"] == fid
+    r2 = client.post("/tools/data_sql", json={"query": f'SELECT COUNT(*) AS n FROM "{r["summary"]["summary_id"]}"'}).json()
+    assert r2["preview_rows"] == [{"n": 3}]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_csv('/etc/hostname')",
+    "DROP TABLE sqlcells",
+    "SELECT 1; SELECT 2",
+])
+def test_data_sql_rejects_unsafe_statements(sql):
+    assert "error" in client.post("/tools/data_sql", json={"query": sql}).json()
+
+
+def test_data_sql_lineage_follows_query_order_and_skips_column_refs():
+    up = lambda name, df: client.post("/upload_file", files={"file": (name, df.write_csv().encode(), "text/csv")}).json()["file"]["file_id"]
+    first = up("lin_first.csv", pl.DataFrame({"cell_id": [1, 2], "v": [1.0, 2.0]}))
+    second = up("lin_second.csv", pl.DataFrame({"cell_id": [1, 2], "lin_col": [3, 4]}))
+    up("lin_col.csv", pl.DataFrame({"a": [0]}))  # shares its name with a column
+    r = client.post("/tools/data_sql", json={"query": (
+        "SELECT ls.lin_col, lf.v FROM lin_second ls JOIN lin_first lf ON ls.cell_id = lf.cell_id"
+    )}).json()
+    assert r["summary"]["source_file_id"] == second
+    assert r["summary"]["depends_on"] == [second, first]
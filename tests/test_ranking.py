@@ -0,0 +1,121 @@
+import numpy as np
+import polars as pl
+import pytest
+from fastapi.testclient import TestClient
+
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.io import top_n_rois
+from neurogabber.backend.tools.ranking import SortCache, sort_permutation, top_k
+
+client = TestClient(app)
+
+
+def _frame(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    score = rng.integers(0, 50, n).astype(float)
+    score[rng.choice(n, 40, replace=False)] = np.nan
+    return pl.DataFrame({
+        "cell_id": np.arange(n),
+        "region": rng.choice(["CA1", "CA3", "DG", "SUB"], n),
+        "score": score,
+        "size": rng.integers(0, 10, n),
+    }).with_columns(pl.col("score").fill_nan(None))
+
+
+def _full_sort(df, by, descending):
+    flags = [descending] * len(by) if isinstance(descending, bool) else descending
+    return df.with_row_index("r").sort([*by, "r"], descending=[*flags, False], nulls_last=True).drop("r")
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_top_k_matches_full_sort(descending):
+    df = _frame()
+    for by in (["score"], ["score", "size"]):
+        for k in (1, 7, 100, 5000):
+            expected = _full_sort(df, by, descending).head(k)
+            assert top_k(df, k, by, descending).equals(expected)
+            cache = SortCache()
+            assert cache.top_k(("file", "t", 1), df, k, by, descending).equals(expected)
+
+
+def test_top_k_mixed_directions_and_nulls_last():
+    df = _frame()
+    got = top_k(df, 30, ["size", "score"], [False, True])
+    assert got.equals(_full_sort(df, ["size", "score"], [False, True]).head(30))
+    tail = top_k(df, df.height, "score")
+    assert tail["score"].tail(40).null_count() == 40
+
+
+def test_grouped_top_k():
+    df = _frame()
+    got = top_k(df, 3, "score", group_by="region")
+    ranked = _full_sort(df, ["score"], True)
+    expected = ranked.group_by("region", maintain_order=True).head(3)
+    assert got.height == 12
+    assert sorted(got.rows()) == sorted(expected.select(df.columns).rows())
+    # groups appear in order of their best row, ranked within each group
+    assert got["region"].unique(maintain_order=True).to_list() == ranked["region"].unique(maintain_order=True).to_list()
+    for _, part in got.group_by("region", maintain_order=True):
+        assert part["score"].to_list() == sorted(part["score"].to_list(), reverse=True)
+    cache = SortCache()
+    assert cache.top_k(("file", "t", 1), df, 3, "score", group_by="region").equals(got)
+
+
+def test_sort_cache_reuses_permutation_per_version():
+    df = _frame()
+    cache = SortCache()
+    key = ("file", "t", 1)
+    cache.top_k(key, df, 5, "score")
+    cache.top_k(key, df, 50, "score")
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.top_k(key, df, 5, "score", descending=False)
+    cache.top_k(("file", "t", 2), df, 5, "score")
+    assert cache.misses == 3
+    cache.invalidate(("file", "t"))
+    cache.top_k(key, df, 5, "score")
+    assert cache.misses == 4
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_sort_cache_extend_reads_only_the_batch(descending):
+    old = pl.DataFrame({"v": pl.Series([3, None, 1, 3, 2], dtype=pl.Int8)})
+    batch = pl.DataFrame({"v": pl.Series([1000, None, 3, -5], dtype=pl.Int16)})
+    cache = SortCache()
+    cache.permutation(("file", "t", 0), old, ["v"], [descending])
+    kept = cache.extend(("file", "t", 0), ("file", "t", 1), old.height, lambda: batch)
+    grown = pl.concat([old.cast(pl.Int16), batch])
+    assert kept == 1
+    expected = sort_permutation(grown, ["v"], [descending])
+    assert np.array_equal(cache.permutation(("file", "t", 1), grown.clear(), ["v"], [descending]), expected)
+
+
+def test_top_k_errors():
+    df = _frame(100)
+    with pytest.raises(ValueError):
+        top_k(df, 3, "missing")
+    with pytest.raises(ValueError):
+        top_k(df, 3, ["score", "size"], [True])
+    assert top_k(df, 0, "score").height == 0
+
+
+def test_top_n_rois_orders_by_volume():
+    df = pl.DataFrame({
+        "id": [1, 2, 3], "x": [0, 0, 0], "y": [0, 0, 0], "z": [0, 0, 0],
+        "size_x": [1, 3, 2], "size_y": [1, 1, 1], "size_z": [1, 1, 1],
+    })
+    assert [r["id"] for r in top_n_rois(df, 2)] == [2, 3]
+
+
+def test_ng_views_table_grouped_multi_key():
+    content = (
+        b"cell_id,region,x,y,z,score,size\n"
+        b"1,CA1,1,1,1,5,1\n2,CA1,2,2,2,9,1\n3,CA3,3,3,3,9,2\n"
+        b"4,CA3,4,4,4,7,1\n5,CA1,5,5,5,9,3\n6,DG,6,6,6,1,1\n"
+    )
+    fid = client.post("/upload_file", files={"file": ("ranked.csv", content, "text/csv")}).json()["file"]["file_id"]
+    res = client.post("/tools/data_ng_views_table", json={
+        "file_id": fid, "sort_by": ["score", "size"], "group_by": ["region"], "top_n": 1,
+    }).json()
+    assert [r["cell_id"] for r in res["rows"]] == [5, 3, 6], res
+    bad = client.post("/tools/data_ng_views_table", json={"file_id": fid, "sort_by": "nope"}).json()
+    assert "error" in bad
@@ -0,0 +1,68 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from neurogabber.backend.main import app
+from neurogabber.backend.tools.formats import (
+    ARROW_STREAM,
+    COLUMNAR_JSON,
+    META_HEADER,
+    negotiate,
+    read_arrow_stream,
+)
+
+client = TestClient(app)
+
+CSV = b"cell_id,x,y,z,region\n1,1.5,2,3,CA1\n2,2.5,3,4,CA3\n3,3.5,4,5,CA1\n4,4.5,5,6,CA1\n"
+
+
+def _upload(name="fmt.csv"):
+    return client.post("/upload_file", files={"file": (name, CSV, "text/csv")}).json()["file"]["file_id"]
+
+
+def test_negotiate():
+    assert negotiate(None) == "rows"
+    assert negotiate("application/json") == "rows"
+    assert negotiate(f"{COLUMNAR_JSON}, application/json;q=0.5") == "columnar"
+    assert negotiate(f"text/html, {ARROW_STREAM}; q=1") == "arrow"
+
+
+def test_default_rows_unchanged():
+    fid = _upload()
+    res = client.post("/tools/data_preview", json={"file_id": fid, "n": 2}).json()
+    assert res["rows"][0] == {"cell_id": 1, "x": 1.5, "y": 2, "z": 3, "region": "CA1"}
+
+
+def test_columnar_json_preview_and_lists():
+    fid = _upload()
+    resp = client.post("/tools/data_preview", json={"file_id": fid, "n": 3}, headers={"Accept": COLUMNAR_JSON})
+    assert resp.headers["content-type"].startswith(COLUMNAR_JSON)
+    body = resp.json()
+    assert body["file_id"] == fid
+    assert body["rows"]["columns"] == ["cell_id", "x", "y", "z", "region"]
+    assert body["rows"]["data"]["x"] == [1.5, 2.5, 3.5]
+    assert body["rows"]["data"]["region"] == ["CA1", "CA3", "CA1"]
+    files = client.post("/tools/data_list_files", headers={"Accept": COLUMNAR_JSON}).json()["files"]
+    assert fid in files["data"]["file_id"]
+    assert len(files["data"]["name"]) == len(files["data"]["file_id"])
+
+
+def test_arrow_stream_select_and_sample():
+    fid = _upload()
+    resp = client.post(
+        "/tools/data_select",
+        json={"file_id": fid, "filters": [{"column": "region", "op": "==", "value": "CA1"}], "sort_by": "x"},
+        headers={"Accept": ARROW_STREAM},
+    )
+    assert resp.headers["content-type"] == ARROW_STREAM
+    df = read_arrow_stream(resp.content)
+    assert df["cell_id"].to_list() == [1, 3, 4]
+    meta = json.loads(resp.headers[META_HEADER])
+    assert meta["summary"]["kind"] == "select"
+    sample = client.post("/tools/data_sample", json={"file_id": fid, "n": 2, "seed": 1}, headers={"Accept": ARROW_STREAM})
+    assert read_arrow_stream(sample.content).height == 2
+    assert json.loads(sample.headers[META_HEADER])["returned"] == 2
+    summaries = client.post("/tools/data_list_summaries", headers={"Accept": ARROW_STREAM})
+    table = read_arrow_stream(summaries.content)
+    assert "summary_id" in table.columns and table.height >= 1
+    assert table["depends_on"].dtype == table["summary_id"].dtype  # nested fields arrive as JSON text
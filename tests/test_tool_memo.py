@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+
+from neurogabber.backend import main
+from neurogabber.backend.main import app, _execute_tool_memoized
+from neurogabber.backend.observability.timing import TimingCollector
+from neurogabber.backend.tools.memo import ToolMemo
+
+client = TestClient(app)
+
+CSV = b"cell_id,x,y,z,area\n1,1,2,3,10\n2,2,3,4,20\n3,3,4,5,30\n"
+
+
+def _upload(name="memo.csv"):
+    resp = client.post("/upload_file", files={"file": (name, CSV, "text/csv")}).json()
+    fid = resp["file"]["file_id"]
+    main.DATA_MEMORY.files[fid].wait_stats()
+    return fid
+
+
+def test_repeated_describe_is_served_from_memo():
+    fid = _upload()
+    first, status1 = _execute_tool_memoized("data_describe", {"file_id": fid})
+    n_summaries = len(main.DATA_MEMORY.summaries)
+    second, status2 = _execute_tool_memoized("data_describe", {"file_id": fid})
+    assert (status1, status2) == ("miss", "hit")
+    assert second == first
+    assert len(main.DATA_MEMORY.summaries) == n_summaries  # no duplicate summary
+
+
+def test_defaults_share_a_key_and_version_bump_invalidates():
+    fid = _upload("memo2.csv")
+    _, s1 = _execute_tool_memoized("data_preview", {"file_id": fid})
+    _, s2 = _execute_tool_memoized("data_preview", {"file_id": fid, "n": 10})
+    _, s3 = _execute_tool_memoized("data_preview", {"file_id": fid, "n": 2})
+    assert (s1, s2, s3) == ("miss", "hit", "miss")
+    info, _ = _execute_tool_memoized("data_info", {"file_id": fid})
+    assert info["n_rows"] == 3 and "error" not in info
+    main.DATA_MEMORY.files[fid].version += 1
+    _, s4 = _execute_tool_memoized("data_preview", {"file_id": fid})
+    assert s4 == "miss"
+
+
+def test_errors_and_other_tools_are_not_memoized():
+    res, status = _execute_tool_memoized("data_info", {"file_id": "nope"})
+    assert "error" in res and status is None
+    _, status = _execute_tool_memoized("data_list_files", {})
+    assert status is None
+
+
+def test_memo_hits_are_copies_and_invalidate_by_prefix():
+    memo = ToolMemo()
+    key = memo.key("data_info", {"file_id": "a"}, ("file", "a", 0))
+    memo.put(key, {"rows": [1]})
+    memo.get(key)["rows"].append(2)
+    assert memo.get(key) == {"rows": [1]}
+    memo.invalidate(("file", "a"))
+    assert memo.get(key) is None
+    assert memo.stats() == {"hits": 2, "misses": 1, "entries": 0}
+
+
+def test_timing_summary_counts_memo_hits():
+    collector = TimingCollector(user_prompt="memo")
+    it = collector.start_iteration(0)
+    for status in ("miss", "hit", None):
+        with collector.tool_execution(it, "data_info") as ctx:
+            ctx.set_cache(status)
+    collector.finalize()
+    assert collector.record.summary["memo_hits"] == 1
+    assert collector.record.summary["memo_misses"] == 1
+    assert [t.cache for t in it.tools] == ["miss", "hit", None]